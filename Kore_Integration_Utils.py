@@ -0,0 +1,1893 @@
+###
+# Title:    kore_integration_utils.py
+# Date:     2026-10-18
+# Version:  1.0
+#
+# Shared helpers for the Kore API Integration templates (Membership, Tickets and Ticket Activity).
+# Holds the Eloqua Bulk API plumbing that is identical across the entity templates so that each
+# template only has to describe its own CDO, field mappings and S3 files.
+#
+# UPDATES
+#
+#
+# Version 1.0:
+# - added waitForSync, a backoff based replacement of the recursive sync() polling function
+# - added iterExportPages/iterExportRecords, generators that stream a bulk export page by page, the pages
+#   are downloaded concurrently once totalResults is known
+# - added getExportCount, reads the number of records of a synced export without paging through it
+# - added runBulkExport and getContactEmailSet, a local SQLite cache of the contact email addresses refreshed
+#   with only the contacts modified since the last run
+# - added getHttpSession, one keep-alive requests session shared by every Eloqua, S3 and Mailgun call
+# - added getEloquaAccessContext, resolves the Eloqua base/bulk/REST urls once and caches them with the auth headers
+# - added iterUrlLines and iterBatches, stream a Kore file line by line and group parsed rows into import batches
+# - added processFilesConcurrently, spreads the Kore files of a run over a process or thread pool
+# - added a manifest of the processed S3 keys (etag, size, last modified) so unchanged Kore files are skipped
+# - added compileRowParser and getImportFields, the row parser and import definition of a template come from one field schema
+# - added iterColumnarRows, parses a Kore file a chunk of lines at a time and filters on the email column as a whole,
+#   only the matching rows are split into all their fields
+# - added stageUrlToFile and iterStagedRows, a Kore file is downloaded once and parsed through mmap, only the
+#   email column and the matching rows are decoded
+# - added a contact index, hashes of the contact email addresses (optionally behind a Bloom filter) that the staged
+#   parser checks the raw email column of a line against before anything else is decoded
+# - getContactEmailSet replaced by getContactEmailIndex, a sorted array of 64-bit email hashes (binary search, exact
+#   check against the cache on request) saved next to the cache so it can be reused by the following runs
+# - added iterPipelined, runs the download and parse/batching stages of a Kore file in their own threads with
+#   bounded queues between them, so downloading, parsing and importing overlap
+# - added an import uploader (startImportUploader/submitImportBatch/finishImportUploader), pushes several import
+#   batches at once behind an adaptive throttle for Eloqua's 429 rate limits and follows each sync to completion
+# - added getImportDefinitionUri, looks up (or creates) an import definition once per run, the uploader only pushes
+#   data per batch and syncs once at the end or every syncEvery batches
+# - added getBatchSizer and iterSizedBatches, import batches are cut by serialized bytes and the byte target follows
+#   the upload latency and errors reported by the uploader
+# - added iterJsonArray, import payloads are encoded record by record (orjson when installed) while they are sent
+# - added iterRestPages and getRestInstanceKeys, page through a REST list concurrently at the largest page size and
+#   keep only the instance id and key of each custom object instance
+# - added getExportInstanceKeys, snapshots the instance id and key of a custom object with a two field bulk export
+# - added deleteCustomObjectInstances, purges custom object instances through a bulk delete definition, or concurrent
+#   throttled REST deletes when bulk deletes are not available, with a checkpoint so an interrupted purge resumes
+# - added saveKeySet/loadKeySet, keep the PKs of each Kore file so a custom object is reconciled once per run
+# - added a run journal (openRunJournal/runJournalStage), a SQLite record of the stages and of the rows of each file
+#   already imported, a failed stage is retried after its own policy and a retried file resumes after its last sync
+# - added getRunContactIndex, every attempt of a run matches the rows of a file against the same contact index
+#
+###
+
+import array
+import base64
+import bisect
+import collections
+import datetime
+import functools
+import hashlib
+import io
+import itertools
+import json
+import mmap
+import operator
+import os
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import requests
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+# orjson (optional) encodes the import payloads several times faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Keep-alive pool of the shared HTTP session, one pool per host of up to HTTP_POOL_MAXSIZE
+# connections (keep it at least as large as the number of worker threads making calls)
+HTTP_POOL_CONNECTIONS = 8
+HTTP_POOL_MAXSIZE = 32
+
+# Connect and read timeouts (seconds) of every call made through the shared HTTP session, unless the
+# call passes its own; a half-dead pooled connection then fails the call instead of hanging it
+HTTP_TIMEOUT = (10, 300)
+
+# Sync statuses that mean Eloqua is still working on the sync
+SYNC_RUNNING_STATUSES = ('pending', 'active')
+
+# Sync statuses that mean the sync did not go through ('warning' did, less the rows Eloqua rejected)
+SYNC_FAILED_STATUSES = ('error', 'timeout')
+
+# Contact fields used by the contact email cache
+CONTACT_EMAIL_FIELD = '{{Contact.Field(C_EmailAddress)}}'
+CONTACT_MODIFIED_FIELD = '{{Contact.Field(C_DateModified)}}'
+
+# Format of the timestamps stored in the caches and used in export filters
+STAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+
+httpSession = None
+httpSessionPid = None
+httpSessionLock = threading.Lock()
+
+
+
+#Shared HTTP session for all Eloqua, S3 and Mailgun calls
+#
+# Reusing one session keeps the TCP/TLS connections alive between calls instead of opening a
+# new one per request. The session is created on first use and again in a forked worker process
+# (sockets must not be shared between processes). Every call gets HTTP_TIMEOUT by default.
+def getHttpSession():
+
+    global httpSession, httpSessionPid
+
+    with httpSessionLock:
+        if httpSession is None or httpSessionPid != os.getpid():
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.request = functools.partial(session.request, timeout=HTTP_TIMEOUT)
+
+            httpSession = session
+            httpSessionPid = os.getpid()
+
+    return httpSession
+
+
+
+eloquaAccessCache = {}
+eloquaAccessLock = threading.Lock()
+
+
+
+#Eloqua access context (auth headers and endpoints) for a site/user
+#
+# The base url of the instance is looked up on login.eloqua.com once and cached for ttl seconds,
+# so every stage and every retry of a run talks to the same endpoints without logging in again.
+# Returns a dict with the sitename, headers, baseUrl, bulkUrl (Bulk API 2.0) and restUrl (REST API 2.0).
+def getEloquaAccessContext(site, username, pw, ttl=3600):
+
+    cacheKey = (site, username)
+
+    with eloquaAccessLock:
+        apiAccess = eloquaAccessCache.get(cacheKey)
+        if apiAccess is not None and apiAccess['expires'] > time.time():
+            return apiAccess
+
+    # Set up authentication encoding
+    authKey = base64.b64encode((site + '\\' + username + ':' + pw).encode('utf-8')).decode('ascii')
+
+    # Key and JSON signals to Eloqua
+    headers = {
+        "Authorization": "Basic " + authKey,
+        "content-type":"application/json",
+        "Accept":"application/json; encoding='utf8'"
+    }
+
+    r = getHttpSession().get('https://login.eloqua.com/id', headers=headers)
+    r.raise_for_status()
+    loginInfo = r.json()
+    if not isinstance(loginInfo, dict):
+        raise Exception('Eloqua login failed for {} : {}'.format(site, loginInfo))
+
+    baseUrl = loginInfo['urls']['base']
+
+    apiAccess = {}
+    apiAccess['sitename'] = site
+    apiAccess['headers'] = headers
+    apiAccess['baseUrl'] = baseUrl
+    apiAccess['bulkUrl'] = baseUrl + '/api/bulk/2.0'
+    apiAccess['restUrl'] = baseUrl + '/api/REST/2.0'
+    apiAccess['expires'] = time.time() + ttl
+
+    with eloquaAccessLock:
+        eloquaAccessCache[cacheKey] = apiAccess
+
+    return apiAccess
+
+
+
+#Wait for an Eloqua export/import sync to finish
+#
+# Polls the sync uri with exponential backoff (full jitter) until the sync leaves the
+# pending/active states or the overall deadline (in seconds) has passed. A poll failing with a
+# transient error (429, 5xx) is retried by throttledRequest rather than ending the wait.
+# Returns a dict with the final status, elapsed seconds, number of polls and,
+# when the sync did not succeed, the sync logs retrieved from Eloqua (and the first
+# rejectLimit rows it rejected, for a sync ending with a warning).
+def waitForSync(apiAccess, syncUri, initialDelay=1, maxDelay=60, backoffFactor=2, deadline=3600, rejectLimit=1000):
+
+    syncUrl = apiAccess['bulkUrl'] + syncUri
+    headers = apiAccess['headers']
+    throttle = getImportThrottle(1)
+
+    startTime = time.monotonic()
+    pollCount = 0
+    delay = initialDelay
+    status = 'pending'
+    syncResponse = {}
+
+    while True:
+        syncResponse = throttledRequest(throttle, 'get', syncUrl, maxDelay=maxDelay, headers=headers).json()
+        pollCount = pollCount + 1
+        status = syncResponse['status']
+
+        if status not in SYNC_RUNNING_STATUSES:
+            break
+
+        elapsed = time.monotonic() - startTime
+        if elapsed >= deadline:
+            status = 'timeout'
+            break
+
+        print('Sync {} ({} polls, {:.0f}s elapsed)...'.format(status, pollCount, elapsed))
+
+        # Sleep a random amount up to the current backoff, never past the deadline
+        sleepTime = min(random.uniform(0, delay), deadline - elapsed)
+        time.sleep(sleepTime)
+        delay = min(delay * backoffFactor, maxDelay)
+
+    syncResult = {}
+    syncResult['status'] = status
+    syncResult['elapsed'] = time.monotonic() - startTime
+    syncResult['polls'] = pollCount
+    syncResult['logs'] = {}
+    syncResult['rejects'] = {}
+
+    if status != 'success':
+        print('Sync ended with status {} : {}'.format(status, syncResponse))
+        syncResult['logs'] = throttledRequest(throttle, 'get', syncUrl + '/logs', maxDelay=maxDelay, headers=headers).json()
+
+    if status == 'warning':
+        syncResult['rejects'] = throttledRequest(throttle, 'get', syncUrl + '/rejects', maxDelay=maxDelay, params={'limit' : rejectLimit}, headers=headers).json()
+
+    return syncResult
+
+
+
+#True when a sync went through, a sync ending with a warning did for every row Eloqua did not reject
+#
+# The logs (and rejects) of a sync that did not succeed are printed either way.
+def isSyncDone(syncResult):
+
+    if syncResult['status'] != 'success':
+        print(syncResult['logs'])
+        if syncResult['rejects']:
+            print('Rows rejected : {}'.format(syncResult['rejects'].get('totalResults')))
+            print(syncResult['rejects'].get('items', []))
+
+    return syncResult['status'] not in SYNC_FAILED_STATUSES
+
+
+
+#Retrieve a single page of a bulk export/sync instance
+def getExportPage(apiAccess, dataUrl, offset, limit):
+
+    params = {'offset' : offset, 'limit' : limit}
+    exportPage = getHttpSession().get(dataUrl, params=params, headers=apiAccess['headers'])
+    exportPage.raise_for_status()
+
+    return exportPage.json()
+
+
+
+#Retrieve the number of records of a synced bulk export
+#
+# Only asks Eloqua for a single record, the count comes from the totalResults of that page.
+def getExportCount(apiAccess, syncedInstanceUri):
+
+    dataUrl = apiAccess['bulkUrl'] + syncedInstanceUri + '/data'
+    exportPage = getExportPage(apiAccess, dataUrl, 0, 1)
+
+    return int(exportPage['totalResults'])
+
+
+
+#Stream the pages of a synced bulk export
+#
+# The first page tells how many records the export holds (totalResults), so every other
+# offset is known up front. Up to maxWorkers of the following pages are downloaded at the
+# same time while the caller works through the current one; pages are yielded in export
+# order as lists of records, so at most maxWorkers + 1 pages are held in memory.
+def iterExportPages(apiAccess, syncedInstanceUri, limit=50000, maxWorkers=4):
+
+    dataUrl = apiAccess['bulkUrl'] + syncedInstanceUri + '/data'
+
+    firstPage = getExportPage(apiAccess, dataUrl, 0, limit)
+    totalResults = int(firstPage['totalResults'])
+    offsets = iter(range(limit, totalResults, limit))
+
+    print('Retrieving {} records in pages of {}...'.format(totalResults, limit))
+
+    yield firstPage.get('items', [])
+    firstPage = None
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+        pendingPages = collections.deque()
+        for offset in itertools.islice(offsets, maxWorkers):
+            pendingPages.append(pool.submit(getExportPage, apiAccess, dataUrl, offset, limit))
+
+        while pendingPages:
+            exportPage = pendingPages.popleft().result()
+
+            nextOffset = next(offsets, None)
+            if nextOffset is not None:
+                pendingPages.append(pool.submit(getExportPage, apiAccess, dataUrl, nextOffset, limit))
+
+            yield exportPage.get('items', [])
+
+
+
+#Stream the records of a synced bulk export one at a time, see iterExportPages
+def iterExportRecords(apiAccess, syncedInstanceUri, limit=50000, maxWorkers=4):
+
+    for exportItems in iterExportPages(apiAccess, syncedInstanceUri, limit, maxWorkers):
+        for element in exportItems:
+            yield element
+
+
+
+#Retrieve a single page of a REST 2.0 list (ie. the instances of a custom object)
+def getRestPage(apiAccess, listUrl, page, count, depth='complete'):
+
+    params = {'page' : page, 'count' : count, 'depth' : depth}
+    restPage = getHttpSession().get(listUrl, params=params, headers=apiAccess['headers'])
+    restPage.raise_for_status()
+
+    return restPage.json()
+
+
+
+#Stream the pages of a REST 2.0 list, count elements per page (1000 at most)
+#
+# Same scheme as iterExportPages: the total of the first page gives the number of pages, up to
+# maxWorkers of the following pages are downloaded at the same time and the pages are yielded in
+# order as lists of elements.
+def iterRestPages(apiAccess, listUrl, count=1000, maxWorkers=4, depth='complete'):
+
+    firstPage = getRestPage(apiAccess, listUrl, 1, count, depth)
+    total = int(firstPage['total'])
+    pages = iter(range(2, (total + count - 1) // count + 1))
+
+    print('Retrieving {} elements in pages of {}...'.format(total, count))
+
+    yield firstPage.get('elements', [])
+    firstPage = None
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+        pendingPages = collections.deque()
+        for page in itertools.islice(pages, maxWorkers):
+            pendingPages.append(pool.submit(getRestPage, apiAccess, listUrl, page, count, depth))
+
+        while pendingPages:
+            restPage = pendingPages.popleft().result()
+
+            nextPage = next(pages, None)
+            if nextPage is not None:
+                pendingPages.append(pool.submit(getRestPage, apiAccess, listUrl, nextPage, count, depth))
+
+            yield restPage.get('elements', [])
+
+
+
+#Retrieve the key field of every instance of a custom object through the REST API, instance id -> key
+#
+# Only the instance id and the value of keyFieldId are kept of each instance, instances without
+# the key field are left out.
+def getRestInstanceKeys(apiAccess, instancesUrl, keyFieldId, count=1000, maxWorkers=4):
+
+    instanceKeys = {}
+
+    for elements in iterRestPages(apiAccess, instancesUrl, count, maxWorkers):
+        for element in elements:
+            for fieldValue in element.get('fieldValues', ()):
+                if fieldValue.get('id') == keyFieldId:
+                    instanceKeys[element['id']] = fieldValue.get('value')
+                    break
+
+    return instanceKeys
+
+
+
+#Create a bulk export, sync it and wait for the sync to finish
+#
+# exportPath is relative to the bulk API (ie. '/contacts/exports'), returns the synced instance uri
+# to read the data from. Raises when the sync cannot be started or does not succeed.
+def runBulkExport(apiAccess, exportPath, exportDefinition, maxDelay=60, deadline=3600):
+
+    bulkUrl = apiAccess['bulkUrl']
+    headers = apiAccess['headers']
+
+    reqExport = getHttpSession().post(bulkUrl + exportPath, headers=headers, data=json.dumps(exportDefinition))
+    reqExport.raise_for_status()
+    reqExportUri = reqExport.json()['uri']
+
+    # Sync the data retrieval
+    reqSync = getHttpSession().post(bulkUrl + '/syncs', headers=headers, data=json.dumps({'syncedInstanceUri' : reqExportUri}))
+    if reqSync.status_code != 201:
+        raise Exception('Failed to sync {} : {}'.format(reqExportUri, reqSync.status_code))
+
+    syncResult = waitForSync(apiAccess, reqSync.json()['uri'], maxDelay=maxDelay, deadline=deadline)
+    print('Sync {} after {} polls in {:.0f}s'.format(syncResult['status'], syncResult['polls'], syncResult['elapsed']))
+    if not isSyncDone(syncResult):
+        raise Exception('Export sync of {} finished with status {}'.format(reqExportUri, syncResult['status']))
+
+    return reqSync.json()['syncedInstanceUri']
+
+
+
+#Snapshot the key field of every instance of a custom object through a bulk export, instance id -> key
+#
+# The export only holds the two fields (keyField and idField are field statements, ie.
+# '{{CustomObject[13].Field[190]}}' and '{{CustomObject[13].Id}}') and is streamed page by page
+# with iterExportRecords, as the contact export is.
+def getExportInstanceKeys(apiAccess, exportPath, keyField, idField, limit=50000, maxWorkers=4, maxDelay=60, deadline=3600):
+
+    exportDefinition = {
+        'name' : 'Instance Keys Snapshot',
+        'fields' : {
+            'instanceId' : idField,
+            'instanceKey' : keyField,
+            },
+        }
+
+    syncedInstanceUri = runBulkExport(apiAccess, exportPath, exportDefinition, maxDelay=maxDelay, deadline=deadline)
+
+    instanceKeys = {}
+    for element in iterExportRecords(apiAccess, syncedInstanceUri, limit, maxWorkers):
+        if element.get('instanceKey'):
+            instanceKeys[element['instanceId']] = element['instanceKey']
+
+    return instanceKeys
+
+
+
+#Shared throttle of the import requests, at most limit requests in flight (adapted between 1 and maxConcurrency)
+def getImportThrottle(maxConcurrency):
+
+    throttle = {}
+    throttle['condition'] = threading.Condition()
+    throttle['limit'] = maxConcurrency
+    throttle['maxConcurrency'] = maxConcurrency
+    throttle['inFlight'] = 0
+    throttle['successes'] = 0
+
+    return throttle
+
+
+
+# Import throttles shared by the uploaders of a process, (pid, bulk url) -> throttle
+importThrottles = {}
+importThrottleLock = threading.Lock()
+
+#Import throttle shared by every uploader of this process pushing to bulkUrl, created with maxConcurrency on first use
+#
+# Eloqua limits the concurrent requests of an instance, not of a file: the uploaders of all the files
+# handled by a process wait on the same limit, and a 429 met by any of them lowers it for all.
+def getSharedImportThrottle(bulkUrl, maxConcurrency):
+
+    throttleKey = (os.getpid(), bulkUrl)
+
+    with importThrottleLock:
+        throttle = importThrottles.get(throttleKey)
+        if throttle is None:
+            throttle = getImportThrottle(maxConcurrency)
+            importThrottles[throttleKey] = throttle
+
+    return throttle
+
+
+
+#Import requests each file worker may have in flight, out of the importWorkers of the whole run
+#
+# File workers running as threads share the throttle of their process (getSharedImportThrottle), so
+# they get all of importWorkers; worker processes (see processFilesConcurrently) get an even share of it.
+def getFileImportWorkers(importWorkers, fileWorkers, useProcesses, fileCount):
+
+    if useProcesses and fileWorkers > 1 and fileCount > 1:
+        return max(importWorkers // min(fileWorkers, fileCount), 1)
+
+    return importWorkers
+
+
+
+#Send a request through the import throttle, retrying rate limited (429) and server error responses
+#
+# Concurrency is adapted the AIMD way: every 429 halves the number of requests allowed in flight,
+# each run of successful requests as long as the current limit raises it by one again. Retries wait
+# for the Retry-After of the response, or a jittered exponential backoff up to maxDelay. A request
+# that fails to connect or times out (ie. a pooled connection reset) is retried the same way.
+# A callable data is called for a fresh body on every attempt (ie. a generator streaming the body).
+def throttledRequest(throttle, method, url, maxRetries=5, maxDelay=60, **kwargs):
+
+    condition = throttle['condition']
+    delay = 1
+
+    for attempt in range(1, maxRetries + 1):
+
+        with condition:
+            while throttle['inFlight'] >= throttle['limit']:
+                condition.wait()
+            throttle['inFlight'] = throttle['inFlight'] + 1
+
+        requestArgs = dict(kwargs)
+        if callable(requestArgs.get('data')):
+            requestArgs['data'] = requestArgs['data']()
+
+        response = None
+        try:
+            response = getattr(getHttpSession(), method)(url, **requestArgs)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            if attempt == maxRetries:
+                raise
+            requestError = error
+        finally:
+            with condition:
+                throttle['inFlight'] = throttle['inFlight'] - 1
+                condition.notify_all()
+
+        if response is not None:
+            with condition:
+                if response.status_code == 429:
+                    throttle['limit'] = max(throttle['limit'] // 2, 1)
+                    throttle['successes'] = 0
+                elif response.status_code < 500:
+                    throttle['successes'] = throttle['successes'] + 1
+                    if throttle['successes'] >= throttle['limit'] and throttle['limit'] < throttle['maxConcurrency']:
+                        throttle['limit'] = throttle['limit'] + 1
+                        throttle['successes'] = 0
+
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response
+
+            if attempt == maxRetries:
+                break
+
+        retryAfter = response.headers.get('Retry-After', '') if response is not None else ''
+        sleepTime = float(retryAfter) if retryAfter.isdigit() else random.uniform(0, delay)
+        print('Request {} {} : {}, retrying in {:.0f}s (attempt {} of {}, {} in flight allowed)...'.format(
+            method.upper(), url, 'status {}'.format(response.status_code) if response is not None else requestError,
+            sleepTime, attempt, maxRetries, throttle['limit']))
+        time.sleep(min(sleepTime, maxDelay))
+        delay = min(delay * 2, maxDelay)
+
+    response.raise_for_status()
+
+
+
+#Create a bulk import definition, importPath is relative to the bulk API (ie. '/customObjects/15/imports')
+def createImportDefinition(apiAccess, importPath, importDefinition):
+
+    reqImport = getHttpSession().post(apiAccess['bulkUrl'] + importPath, headers=apiAccess['headers'], data=json.dumps(importDefinition))
+    reqImport.raise_for_status()
+
+    return reqImport.json()['uri']
+
+
+
+# Import definitions resolved in this process, (bulk url, import path, name) -> import uri
+importDefinitionCache = {}
+importDefinitionLock = threading.Lock()
+
+# Settings of an import definition that change what a data push does, 'false' when a definition leaves them out
+importBehaviourSettings = ('isSyncTriggeredOnImport', 'mapDataCards')
+
+#True when an existing import definition (as listed by Eloqua) does the same as importDefinition
+#
+# Every setting of importDefinition has to match, as well as the settings of importBehaviourSettings
+# it leaves out (ie. a definition syncing on every push is never reused for staged batches). Flags
+# are compared as text, Eloqua lists them as booleans.
+def isSameImportDefinition(item, importDefinition):
+
+    for settingName in set(importDefinition) | set(importBehaviourSettings):
+        expected = importDefinition.get(settingName, 'false')
+        actual = item.get(settingName, 'false' if settingName in importBehaviourSettings else None)
+        if isinstance(expected, dict):
+            if actual != expected:
+                return False
+        elif str(actual).lower() != str(expected).lower():
+            return False
+
+    return True
+
+#Uri of the import definition named importDefinition['name'], created only when Eloqua does not have it yet
+#
+# An existing definition of that name is reused when it does the same (isSameImportDefinition), so
+# a run (and the following runs) push all of their batches into the same definition. The uri is
+# cached for the rest of the process.
+def getImportDefinitionUri(apiAccess, importPath, importDefinition):
+
+    cacheKey = (apiAccess['bulkUrl'], importPath, importDefinition['name'])
+
+    with importDefinitionLock:
+        importUri = importDefinitionCache.get(cacheKey)
+        if importUri is not None:
+            return importUri
+
+        reqImports = getHttpSession().get(
+            apiAccess['bulkUrl'] + importPath,
+            headers=apiAccess['headers'],
+            params={'q' : "name='" + importDefinition['name'] + "'"}
+            )
+        reqImports.raise_for_status()
+
+        for item in reqImports.json().get('items', []):
+            if isSameImportDefinition(item, importDefinition):
+                importUri = item['uri']
+                print('Reusing import definition {} ({})'.format(importDefinition['name'], importUri))
+                break
+        else:
+            importUri = createImportDefinition(apiAccess, importPath, importDefinition)
+            print('Created import definition {} ({})'.format(importDefinition['name'], importUri))
+
+        importDefinitionCache[cacheKey] = importUri
+
+    return importUri
+
+
+
+#Start an uploader pushing import batches into the import definition importUri, maxWorkers batches at a time
+#
+# Batches are handed over with submitImportBatch and collected with finishImportUploader. The
+# batches only go to the staging area of the import; a sync is started once every syncEvery
+# batches (0 for none) and once when the uploader finishes, one sync at a time, each followed to
+# completion. All requests go through the import throttle the uploaders of the process share for
+# the bulk url (getSharedImportThrottle, see throttledRequest).
+#
+# With a batchSizer (getBatchSizer) every upload is reported to it, so the next batches are sized
+# after the latency of the uploads.
+#
+# stagedDone is called with the number of rows staged so far (counted from rowOffset) as the batches
+# come back in order, ie. to checkpoint the rows of a file already staged (recordFileOffset).
+def startImportUploader(apiAccess, importUri, maxWorkers=4, maxDelay=60, deadline=3600, syncEvery=0, batchSizer=None,
+        rowOffset=0, stagedDone=None):
+
+    uploader = {}
+    uploader['apiAccess'] = apiAccess
+    uploader['importUri'] = importUri
+    uploader['maxDelay'] = maxDelay
+    uploader['deadline'] = deadline
+    uploader['syncEvery'] = syncEvery
+    uploader['batchSizer'] = batchSizer
+    uploader['throttle'] = getSharedImportThrottle(apiAccess['bulkUrl'], maxWorkers)
+    uploader['executor'] = ThreadPoolExecutor(max_workers=maxWorkers)
+    uploader['syncExecutor'] = ThreadPoolExecutor(max_workers=1)
+    uploader['pending'] = collections.deque()
+    uploader['maxPending'] = maxWorkers * 2
+    uploader['submitted'] = 0
+    uploader['rowsStaged'] = rowOffset
+    uploader['stagedDone'] = stagedDone
+    uploader['results'] = []
+    uploader['syncs'] = []
+
+    return uploader
+
+
+
+#Push a single batch into the staging area of the import
+#
+# A batch rejected as too large (413) is split in two halves that are pushed one after the other.
+def uploadImportBatch(uploader, batchNumber, importContents):
+
+    apiAccess = uploader['apiAccess']
+    batchSizer = uploader['batchSizer']
+
+    # The body is encoded while it is sent (iterJsonArray), again on every attempt
+    payloadStats = {'bytes' : 0}
+    uploadStart = time.monotonic()
+
+    try:
+        throttledRequest(
+            uploader['throttle'],
+            'post',
+            apiAccess['bulkUrl'] + uploader['importUri'] + '/data',
+            maxDelay=uploader['maxDelay'],
+            headers=apiAccess['headers'],
+            data=lambda: iterJsonArray(importContents, payloadStats=payloadStats)
+            )
+    except requests.HTTPError as error:
+        if batchSizer is not None:
+            recordBatchUpload(batchSizer, payloadStats['bytes'], time.monotonic() - uploadStart, failed=True)
+        if error.response is None or error.response.status_code != 413 or len(importContents) < 2:
+            raise
+        print('Import batch {} too large ({} records), pushing it in two halves...'.format(batchNumber, len(importContents)))
+        half = len(importContents) // 2
+        uploadImportBatch(uploader, batchNumber, importContents[:half])
+        uploadImportBatch(uploader, batchNumber, importContents[half:])
+    else:
+        if batchSizer is not None:
+            recordBatchUpload(batchSizer, payloadStats['bytes'], time.monotonic() - uploadStart)
+
+    batchResult = {}
+    batchResult['batch'] = batchNumber
+    batchResult['records'] = len(importContents)
+    batchResult['bytes'] = payloadStats['bytes']
+    batchResult['status'] = 'staged'
+
+    return batchResult
+
+
+
+#Sync the data staged in the import definition importUri and wait for the sync
+#
+# Every row staged in the definition so far is synced, whoever staged it. When several uploaders
+# (ie. file workers) stage into one definition, only one party should sync it, once they are done.
+def syncImportDefinition(apiAccess, importUri, throttle=None, maxDelay=60, deadline=3600):
+
+    if throttle is None:
+        throttle = getImportThrottle(1)
+
+    reqSync = throttledRequest(
+        throttle,
+        'post',
+        apiAccess['bulkUrl'] + '/syncs',
+        maxDelay=maxDelay,
+        headers=apiAccess['headers'],
+        data=json.dumps({'syncedInstanceUri' : importUri})
+        )
+
+    syncResult = waitForSync(apiAccess, reqSync.json()['uri'], maxDelay=maxDelay, deadline=deadline)
+    print('Import sync {} after {} polls in {:.0f}s'.format(syncResult['status'], syncResult['polls'], syncResult['elapsed']))
+
+    return syncResult
+
+
+
+#Sync the data staged by the uploader and wait for the sync
+def syncImport(uploader):
+
+    return syncImportDefinition(uploader['apiAccess'], uploader['importUri'], uploader['throttle'], uploader['maxDelay'], uploader['deadline'])
+
+
+
+#Wait for the batches handed over to the uploader until at most keepPending are still being pushed
+def drainImportUploader(uploader, keepPending):
+
+    pending = uploader['pending']
+
+    try:
+        while len(pending) > keepPending:
+            batchResult = pending.popleft().result()
+            uploader['results'].append(batchResult)
+            uploader['rowsStaged'] = uploader['rowsStaged'] + batchResult['records']
+            if uploader['stagedDone'] is not None:
+                uploader['stagedDone'](uploader['rowsStaged'])
+    except BaseException:
+        uploader['executor'].shutdown(cancel_futures=True)
+        uploader['syncExecutor'].shutdown(cancel_futures=True)
+        raise
+
+
+
+#Hand a batch over to the uploader, waits for the oldest batch once maxPending batches are queued
+def submitImportBatch(uploader, batchNumber, importContents):
+
+    drainImportUploader(uploader, uploader['maxPending'] - 1)
+
+    uploader['pending'].append(uploader['executor'].submit(uploadImportBatch, uploader, batchNumber, importContents))
+    uploader['submitted'] = uploader['submitted'] + 1
+
+    # Every syncEvery batches, sync once the batches so far are staged (the next ones keep being pushed meanwhile)
+    if uploader['syncEvery'] > 0 and uploader['submitted'] % uploader['syncEvery'] == 0:
+        drainImportUploader(uploader, 0)
+        uploader['syncs'].append(uploader['syncExecutor'].submit(syncImport, uploader))
+
+
+
+#Wait for the remaining batches, run the final sync (unless sync is False) and wait for every sync of the uploader
+#
+# Returns a dict with the results of the batches (in order) and of the syncs.
+def finishImportUploader(uploader, sync=True):
+
+    try:
+        drainImportUploader(uploader, 0)
+        if sync and uploader['submitted'] > 0:
+            uploader['syncs'].append(uploader['syncExecutor'].submit(syncImport, uploader))
+
+        importResult = {}
+        importResult['batches'] = uploader['results']
+        importResult['syncs'] = [syncFuture.result() for syncFuture in uploader['syncs']]
+    finally:
+        uploader['executor'].shutdown(cancel_futures=True)
+        uploader['syncExecutor'].shutdown(cancel_futures=True)
+
+    return importResult
+
+
+#Instance ids already deleted by an interrupted purge, read from its checkpoint file (one id per line)
+def loadDeleteCheckpoint(checkpointPath):
+
+    if not os.path.exists(checkpointPath):
+        return set()
+
+    with open(checkpointPath) as checkpointFile:
+        return set(line.strip() for line in checkpointFile if line.strip())
+
+
+
+#Delete a single custom object instance through the REST API, an instance already gone (404) counts as deleted
+def deleteRestInstance(apiAccess, throttle, instanceUrl, instanceId, maxDelay=60):
+
+    try:
+        throttledRequest(throttle, 'delete', instanceUrl + str(instanceId), maxDelay=maxDelay, headers=apiAccess['headers'])
+    except requests.HTTPError as error:
+        if error.response is None or error.response.status_code != 404:
+            raise
+
+    return instanceId
+
+
+
+#Delete the custom object instances of staleInstances (instance id -> key)
+#
+# When bulkDeletePath is given, the keys are pushed into a bulk delete definition on that path
+# (identified by keyField) and synced, as an import is. When Eloqua refuses the definition, or
+# without bulkDeletePath, the instances are deleted one by one through the REST api (instanceUrl,
+# ie. restUrl + '/data/customObject/15/instance/'), maxWorkers at a time behind the import throttle.
+#
+# Every instance deleted (through REST, or synced in a bulk delete) is appended to the checkpoint
+# file, so an interrupted purge resumes with the instances left. The checkpoint is removed once the
+# purge went through.
+def deleteCustomObjectInstances(apiAccess, staleInstances, checkpointPath, instanceUrl, bulkDeletePath=None, keyField=None,
+        maxWorkers=4, maxDelay=60, deadline=3600, batchSize=50000, checkpointEvery=500):
+
+    checkpointDir = os.path.dirname(checkpointPath)
+    if checkpointDir:
+        os.makedirs(checkpointDir, exist_ok=True)
+
+    deletedIds = loadDeleteCheckpoint(checkpointPath)
+    remaining = [(instanceId, instanceKey) for instanceId, instanceKey in staleInstances.items() if str(instanceId) not in deletedIds]
+
+    deleteResult = {}
+    deleteResult['resumed'] = len(staleInstances) - len(remaining)
+    deleteResult['deleted'] = 0
+    deleteResult['failed'] = 0
+    deleteResult['method'] = None
+
+    if deleteResult['resumed']:
+        print('Resuming purge, {} instances already deleted'.format(deleteResult['resumed']))
+
+    if not remaining:
+        if os.path.exists(checkpointPath):
+            os.remove(checkpointPath)
+        return deleteResult
+
+    deleteUri = None
+    if bulkDeletePath is not None:
+        deleteDefinition = {
+            'name' : 'Stale Instances Delete',
+            'fields' : {
+                'instanceKey' : keyField,
+                },
+            'identifierFieldName' : 'instanceKey',
+            }
+        try:
+            deleteUri = getImportDefinitionUri(apiAccess, bulkDeletePath, deleteDefinition)
+        except requests.HTTPError as error:
+            print('Bulk delete not available ({}), deleting through the REST api...'.format(error))
+
+    if deleteUri is not None:
+        deleteResult['method'] = 'bulk'
+
+        # maxWorkers batches are staged at a time and synced, then their instances go to the checkpoint
+        uploader = startImportUploader(apiAccess, deleteUri, maxWorkers, maxDelay, deadline)
+        try:
+            for deleteGroup in iterBatches(remaining, batchSize * maxWorkers):
+                for batchNumber, deleteBatch in enumerate(iterBatches(deleteGroup, batchSize), 1):
+                    submitImportBatch(uploader, batchNumber, [{'instanceKey' : instanceKey} for instanceId, instanceKey in deleteBatch])
+                drainImportUploader(uploader, 0)
+
+                syncResult = syncImport(uploader)
+                if not isSyncDone(syncResult):
+                    raise Exception('Bulk delete sync finished with status {}, the next run resumes the purge'.format(syncResult['status']))
+
+                with open(checkpointPath, 'a') as checkpointFile:
+                    checkpointFile.writelines(str(instanceId) + '\n' for instanceId, instanceKey in deleteGroup)
+                deleteResult['deleted'] = deleteResult['deleted'] + len(deleteGroup)
+                print('Deleted {} of {} instances...'.format(deleteResult['deleted'], len(remaining)))
+        finally:
+            finishImportUploader(uploader, sync=False)
+
+    else:
+        deleteResult['method'] = 'rest'
+
+        throttle = getImportThrottle(maxWorkers)
+        with ThreadPoolExecutor(max_workers=maxWorkers) as pool, open(checkpointPath, 'a') as checkpointFile:
+            futures = [pool.submit(deleteRestInstance, apiAccess, throttle, instanceUrl, instanceId, maxDelay) for instanceId, instanceKey in remaining]
+            for future in as_completed(futures):
+                try:
+                    instanceId = future.result()
+                except Exception as error:
+                    print('Delete failed : {}'.format(error))
+                    deleteResult['failed'] = deleteResult['failed'] + 1
+                    continue
+
+                checkpointFile.write(str(instanceId) + '\n')
+                deleteResult['deleted'] = deleteResult['deleted'] + 1
+                if deleteResult['deleted'] % checkpointEvery == 0:
+                    checkpointFile.flush()
+                    print('Deleted {} of {} instances...'.format(deleteResult['deleted'], len(remaining)))
+
+        if deleteResult['failed']:
+            raise Exception('{} of {} instances could not be deleted, the next run resumes the purge'.format(deleteResult['failed'], len(remaining)))
+
+    if os.path.exists(checkpointPath):
+        os.remove(checkpointPath)
+
+    return deleteResult
+
+
+
+#Open (and set up if needed) the SQLite file holding the contact email cache
+#
+# The cache is shared by the templates of a schedule, it is kept in WAL mode so a template reading
+# it never waits for another one refreshing it.
+def openContactEmailCache(cachePath):
+
+    cacheDir = os.path.dirname(cachePath)
+    if cacheDir:
+        os.makedirs(cacheDir, exist_ok=True)
+
+    db = sqlite3.connect(cachePath, timeout=600)
+    db.execute('pragma journal_mode=wal')
+    db.execute('create table if not exists cacheInfo (name text primary key, value text)')
+
+    # Caches written before the email hashes were stored are dropped, the next export is a full refresh
+    cacheColumns = [row[1] for row in db.execute('pragma table_info(contactEmail)')]
+    if cacheColumns and 'emailHash' not in cacheColumns:
+        with db:
+            db.execute('drop table contactEmail')
+            db.execute('delete from cacheInfo')
+
+    db.execute('create table if not exists contactEmail (emailAddress text primary key, emailHash integer not null) without rowid')
+    db.execute('create index if not exists contactEmailByHash on contactEmail (emailHash)')
+
+    return db
+
+
+
+#Hash of a normalized (lower-case, utf-8) contact email address, stable across processes and runs
+#
+# Signed so that it fits a SQLite integer and sorts the same way there as in the index array.
+def hashEmail(emailBytes):
+
+    return int.from_bytes(hashlib.blake2b(emailBytes, digest_size=8).digest(), 'little', signed=True)
+
+
+
+#Refresh the contact email cache and return the contact index of the Eloqua instance
+#
+# The addresses are kept in a SQLite file stamped with the time of the last export. When the cache
+# holds data, only the contacts modified since that stamp (less overlapHours, to cover clock and
+# timezone differences with Eloqua) are exported and merged in. A full export replaces the cache
+# on the first run and once every fullRefreshDays, which also drops deleted contacts.
+#
+# The export is downloaded into a temporary table of the connection first, the cache itself is only
+# locked for the short transaction merging it in, not for the whole download.
+#
+# The index (see buildContactIndex) is saved next to the cache. A run starting within
+# reuseMinutes of the last export loads it as is, so the templates of one schedule share it.
+#
+# Every Eloqua site has its own cache, the site name of apiAccess is added to cachePath
+# (ie. state/contact_emails.db becomes state/contact_emails_SiteName.db). The cache also records
+# its site and is emptied should it ever hold the contacts of another one.
+def getContactEmailIndex(apiAccess, cachePath, fullRefreshDays=7, overlapHours=24, limit=50000, maxWorkers=4, maxDelay=60, deadline=3600,
+                         reuseMinutes=0, bloomBitsPerEmail=0, exactCheck=False):
+
+    cacheRoot, cacheExtension = os.path.splitext(cachePath)
+    siteName = ''.join(character if character.isalnum() else '_' for character in apiAccess['sitename'])
+    cachePath = cacheRoot + '_' + siteName + cacheExtension
+
+    db = openContactEmailCache(cachePath)
+    cacheInfo = dict(db.execute('select name, value from cacheInfo'))
+
+    if cacheInfo.get('sitename') != apiAccess['sitename']:
+        with db:
+            db.execute('delete from contactEmail')
+            db.execute('delete from cacheInfo')
+            db.execute('insert into cacheInfo values (?, ?)', ('sitename', apiAccess['sitename']))
+        cacheInfo = {'sitename' : apiAccess['sitename']}
+
+    syncStart = datetime.datetime.now()
+    lastSync = cacheInfo.get('lastSync')
+    lastFullSync = cacheInfo.get('lastFullSync')
+
+    if lastSync is not None and syncStart - datetime.datetime.strptime(lastSync, STAMP_FORMAT) < datetime.timedelta(minutes=reuseMinutes):
+        contactIndex = loadContactIndex(cachePath + '.idx', lastSync, bloomBitsPerEmail)
+        if contactIndex is not None:
+            print('Contact email cache : reusing the index of {}...'.format(lastSync))
+            db.close()
+            contactIndex['exactCheck'] = exactCheck
+            return contactIndex
+
+    fullRefresh = True
+    if lastSync is not None and lastFullSync is not None:
+        fullSyncAge = syncStart - datetime.datetime.strptime(lastFullSync, STAMP_FORMAT)
+        fullRefresh = fullSyncAge >= datetime.timedelta(days=fullRefreshDays)
+
+    exportDefinition = {
+        'name' : 'All Email Addresses',
+        'fields' : {
+            'emailAddress' : CONTACT_EMAIL_FIELD,
+            },
+        }
+
+    if fullRefresh:
+        print('Contact email cache : full refresh...')
+    else:
+        modifiedSince = datetime.datetime.strptime(lastSync, STAMP_FORMAT) - datetime.timedelta(hours=overlapHours)
+        modifiedSince = modifiedSince.strftime(STAMP_FORMAT)
+        print('Contact email cache : retrieving contacts modified since {}...'.format(modifiedSince))
+
+        exportDefinition['name'] = 'Email Addresses Modified Since ' + modifiedSince
+        exportDefinition['filter'] = "'" + CONTACT_MODIFIED_FIELD + "' >= '" + modifiedSince + "'"
+
+    syncedInstanceUri = runBulkExport(apiAccess, '/contacts/exports', exportDefinition, maxDelay=maxDelay, deadline=deadline)
+
+    # Every page in its own transaction on the temporary table, which no other connection sees
+    db.execute('create temp table exportEmail (emailAddress text primary key, emailHash integer not null) without rowid')
+    for exportItems in iterExportPages(apiAccess, syncedInstanceUri, limit, maxWorkers):
+        emailAddresses = (
+            (emailAddress, hashEmail(emailAddress.encode('utf-8')))
+            for emailAddress in (element['emailAddress'].lower() for element in exportItems if element.get('emailAddress'))
+            )
+        with db:
+            db.executemany('insert or ignore into temp.exportEmail values (?, ?)', emailAddresses)
+
+    with db:
+        if fullRefresh:
+            db.execute('delete from contactEmail')
+            db.execute('insert or replace into cacheInfo values (?, ?)', ('lastFullSync', syncStart.strftime(STAMP_FORMAT)))
+
+        db.execute('insert or ignore into contactEmail select emailAddress, emailHash from temp.exportEmail')
+        db.execute('insert or replace into cacheInfo values (?, ?)', ('lastSync', syncStart.strftime(STAMP_FORMAT)))
+
+    db.execute('drop table temp.exportEmail')
+
+    contactIndex = buildContactIndex(db, cachePath, bloomBitsPerEmail)
+    db.close()
+
+    saveContactIndex(cachePath + '.idx', contactIndex, syncStart.strftime(STAMP_FORMAT))
+    contactIndex['exactCheck'] = exactCheck
+
+    return contactIndex
+
+
+
+#Contact index of a run (see getContactEmailIndex), the same for every attempt of the run
+#
+# The file offsets of the run journal count the rows matched against the contact index, so an attempt
+# started again has to match the same rows. The index of the first attempt is kept next to the journal
+# (one file per run name, stamped with the run id) and loaded as is by the following attempts of the run.
+def getRunContactIndex(journal, apiAccess, cachePath, **indexSettings):
+
+    runName = ''.join(character if character.isalnum() else '_' for character in journal['runName'])
+    indexPath = os.path.splitext(journal['path'])[0] + '_' + runName + '.idx'
+
+    contactIndex = loadContactIndex(indexPath, journal['runId'], indexSettings.get('bloomBitsPerEmail', 0))
+    if contactIndex is not None:
+        print('Contact email cache : reusing the index of {}...'.format(journal['runId']))
+        contactIndex['exactCheck'] = indexSettings.get('exactCheck', False)
+        return contactIndex
+
+    contactIndex = getContactEmailIndex(apiAccess, cachePath, **indexSettings)
+    saveContactIndex(indexPath, contactIndex, journal['runId'])
+
+    return contactIndex
+
+
+
+#Build the contact index from the email cache, the sorted 64-bit hashes of the contact email addresses
+#
+# A sorted array('q') takes 8 bytes per contact (a set of the address strings takes well over 100)
+# and is looked up by binary search. With bloomBitsPerEmail a Bloom filter of that many bits per
+# contact is put in front of it. A match can be confirmed against the addresses of the cache
+# (exactCheck), which rules out hash collisions.
+def buildContactIndex(db, cachePath, bloomBitsPerEmail=0):
+
+    emailHashes = array.array('q', (row[0] for row in db.execute('select emailHash from contactEmail order by emailHash')))
+
+    contactIndex = {}
+    contactIndex['hashes'] = emailHashes
+    contactIndex['cachePath'] = cachePath
+    contactIndex['exactCheck'] = False
+    contactIndex['bloom'] = None
+    contactIndex['bloomBits'] = 0
+    contactIndex['bloomProbes'] = 0
+
+    if bloomBitsPerEmail > 0:
+        bloomBits = max(len(emailHashes) * bloomBitsPerEmail, 64)
+        bloomProbes = min(max(int(round(bloomBitsPerEmail * 0.693)), 1), 16)
+        bloom = bytearray((bloomBits + 7) // 8)
+        for emailHash in emailHashes:
+            for bloomBit in iterBloomBits(emailHash, bloomBits, bloomProbes):
+                bloom[bloomBit >> 3] |= 1 << (bloomBit & 7)
+
+        contactIndex['bloom'] = bloom
+        contactIndex['bloomBits'] = bloomBits
+        contactIndex['bloomProbes'] = bloomProbes
+
+    return contactIndex
+
+
+
+#Write the contact index to indexPath: a json header line followed by the hashes and the Bloom filter
+#
+# lastSync stamps the index, the time of the export it was built from (or the run id of a run's index).
+def saveContactIndex(indexPath, contactIndex, lastSync):
+
+    indexHeader = {
+        'lastSync' : lastSync,
+        'cachePath' : contactIndex['cachePath'],
+        'hashCount' : len(contactIndex['hashes']),
+        'bloomBits' : contactIndex['bloomBits'],
+        'bloomProbes' : contactIndex['bloomProbes'],
+        }
+
+    # Written to a file of its own first, templates refreshing the cache at the same time do not mix their writes
+    indexFileHandle, indexTempPath = tempfile.mkstemp(dir=os.path.dirname(indexPath) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(indexFileHandle, 'wb') as indexFile:
+            indexFile.write(json.dumps(indexHeader).encode('utf-8') + b'\n')
+            contactIndex['hashes'].tofile(indexFile)
+            if contactIndex['bloom'] is not None:
+                indexFile.write(contactIndex['bloom'])
+        os.replace(indexTempPath, indexPath)
+    except Exception:
+        os.remove(indexTempPath)
+        raise
+
+
+
+#Read a contact index saved by saveContactIndex, None when missing or not for lastSync (or the run id) and bloomBitsPerEmail
+def loadContactIndex(indexPath, lastSync, bloomBitsPerEmail=0):
+
+    if not os.path.exists(indexPath):
+        return None
+
+    with open(indexPath, 'rb') as indexFile:
+        indexHeader = json.loads(indexFile.readline().decode('utf-8'))
+        if indexHeader['lastSync'] != lastSync or (indexHeader['bloomBits'] > 0) != (bloomBitsPerEmail > 0):
+            return None
+
+        emailHashes = array.array('q')
+        emailHashes.fromfile(indexFile, indexHeader['hashCount'])
+
+        contactIndex = {}
+        contactIndex['hashes'] = emailHashes
+        contactIndex['cachePath'] = indexHeader['cachePath']
+        contactIndex['exactCheck'] = False
+        contactIndex['bloom'] = bytearray(indexFile.read()) if indexHeader['bloomBits'] > 0 else None
+        contactIndex['bloomBits'] = indexHeader['bloomBits']
+        contactIndex['bloomProbes'] = indexHeader['bloomProbes']
+
+    return contactIndex
+
+
+
+#Bits of the Bloom filter set for an email hash (double hashing on the two halves of the hash)
+def iterBloomBits(emailHash, bloomBits, bloomProbes):
+
+    emailHash = emailHash & 0xffffffffffffffff
+    firstHash = emailHash & 0xffffffff
+    secondHash = (emailHash >> 32) | 1
+    for probe in range(bloomProbes):
+        yield (firstHash + probe * secondHash) % bloomBits
+
+
+
+# Read-only connections to the contact email cache used by the exact check, one per process and cache
+contactCacheConnections = {}
+
+#True/False for each normalized email address (bytes), whether it belongs to a contact of the index
+def matchContactEmails(contactIndex, emails):
+
+    blake2b = hashlib.blake2b
+    fromBytes = int.from_bytes
+    queryHashes = [fromBytes(blake2b(email, digest_size=8).digest(), 'little', signed=True) for email in emails]
+
+    bloom = contactIndex['bloom']
+    if bloom is not None:
+        bloomBits = contactIndex['bloomBits']
+        bloomProbes = contactIndex['bloomProbes']
+        queryHashes = [
+            emailHash if all(bloom[bloomBit >> 3] & (1 << (bloomBit & 7)) for bloomBit in iterBloomBits(emailHash, bloomBits, bloomProbes)) else None
+            for emailHash in queryHashes
+            ]
+
+    # Binary search of every hash, a hash that is not in the index lands on a different one (or past the end)
+    emailHashes = contactIndex['hashes']
+    hashCount = len(emailHashes)
+    positions = map(bisect.bisect_left, itertools.repeat(emailHashes), (emailHash or 0 for emailHash in queryHashes))
+    matches = [
+        emailHash is not None and position < hashCount and emailHashes[position] == emailHash
+        for emailHash, position in zip(queryHashes, positions)
+        ]
+
+    if contactIndex['exactCheck'] and any(matches):
+        connectionKey = (os.getpid(), contactIndex['cachePath'])
+        db = contactCacheConnections.get(connectionKey)
+        if db is None:
+            db = sqlite3.connect('file:' + contactIndex['cachePath'] + '?mode=ro', uri=True, check_same_thread=False)
+            contactCacheConnections[connectionKey] = db
+
+        for position, email in enumerate(emails):
+            if matches[position]:
+                matches[position] = db.execute('select 1 from contactEmail where emailAddress = ?', (email.decode('utf-8', 'replace'),)).fetchone() is not None
+
+    return matches
+
+
+
+#True when a (lower-case) email address belongs to a contact of the index
+def isContactEmail(contactIndex, emailAddress):
+
+    return matchContactEmails(contactIndex, [emailAddress.encode('utf-8')])[0]
+
+
+
+#Stream the lines of a file served over HTTP (ie. a presigned S3 url)
+#
+# The body is read in bufferSize chunks and decoded incrementally, so only the current chunk is
+# held in memory rather than the whole file. Lines keep their trailing newline.
+def iterUrlLines(url, encoding='utf-8', bufferSize=1048576):
+
+    bucketData = getHttpSession().get(url, stream=True)
+    bucketData.raise_for_status()
+    bucketData.raw.decode_content = True
+
+    contentLines = io.TextIOWrapper(io.BufferedReader(bucketData.raw, bufferSize), encoding=encoding, newline='\n')
+
+    try:
+        for line in contentLines:
+            yield line
+    finally:
+        bucketData.close()
+
+
+
+#Group records into lists of at most batchSize records, without reading ahead of the current batch
+def iterBatches(records, batchSize):
+
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batchSize:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+
+#Encode a record as compact JSON bytes, with orjson when it is installed
+def encodeJson(record):
+
+    if orjson is not None:
+        return orjson.dumps(record)
+
+    return json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+
+#Encode records as a JSON array, yielded in chunks of about chunkBytes so the body is sent as it is encoded
+#
+# Passed as the data of a request, the body goes out chunked without ever being held as a whole.
+# The bytes encoded so far are kept in payloadStats['bytes'].
+def iterJsonArray(records, chunkBytes=262144, payloadStats=None):
+
+    if payloadStats is None:
+        payloadStats = {}
+    payloadStats['bytes'] = 0
+
+    chunk = [b'[']
+    chunkSize = 1
+    separator = b''
+
+    for record in records:
+        encodedRecord = encodeJson(record)
+        chunk.append(separator)
+        chunk.append(encodedRecord)
+        chunkSize = chunkSize + len(separator) + len(encodedRecord)
+        separator = b','
+
+        if chunkSize >= chunkBytes:
+            payloadStats['bytes'] = payloadStats['bytes'] + chunkSize
+            yield b''.join(chunk)
+            chunk = []
+            chunkSize = 0
+
+    chunk.append(b']')
+    payloadStats['bytes'] = payloadStats['bytes'] + chunkSize + 1
+    yield b''.join(chunk)
+
+
+
+#Batch sizer of the import batches, shared by the batching stage and the import uploader
+#
+# Batches are cut at targetBytes of serialized JSON (estimated from a sample of the records) and
+# at most maxRows records. The target starts at initialBytes and follows the uploads reported by
+# recordBatchUpload: it grows while a batch uploads well within targetSeconds, shrinks when it
+# takes longer, and is halved when an upload fails or is rate limited.
+def getBatchSizer(initialBytes=4194304, minBytes=262144, maxBytes=20971520, maxRows=50000, targetSeconds=10):
+
+    batchSizer = {}
+    batchSizer['lock'] = threading.Lock()
+    batchSizer['targetBytes'] = initialBytes
+    batchSizer['minBytes'] = minBytes
+    batchSizer['maxBytes'] = maxBytes
+    batchSizer['maxRows'] = maxRows
+    batchSizer['targetSeconds'] = targetSeconds
+    batchSizer['recordBytes'] = None
+
+    return batchSizer
+
+
+
+#Adapt the target size of the batch sizer to an upload of payloadBytes that took seconds (or failed)
+def recordBatchUpload(batchSizer, payloadBytes, seconds, failed=False):
+
+    with batchSizer['lock']:
+        targetBytes = batchSizer['targetBytes']
+
+        if failed:
+            targetBytes = targetBytes / 2
+        elif seconds > batchSizer['targetSeconds']:
+            targetBytes = min(targetBytes, payloadBytes) * 0.75
+        elif seconds < batchSizer['targetSeconds'] / 2 and payloadBytes >= targetBytes * 0.9:
+            targetBytes = targetBytes * 1.25
+
+        batchSizer['targetBytes'] = int(min(max(targetBytes, batchSizer['minBytes']), batchSizer['maxBytes']))
+
+
+
+#Group records into batches sized by the batch sizer (serialized bytes and rows), without reading ahead
+def iterSizedBatches(records, batchSizer, sampleEvery=50):
+
+    batch = []
+    batchBytes = 0
+
+    for record in records:
+
+        # Bytes per record, a moving average over one record in sampleEvery
+        if batchSizer['recordBytes'] is None or len(batch) % sampleEvery == 0:
+            sampleBytes = len(encodeJson(record)) + 1
+            if batchSizer['recordBytes'] is None:
+                batchSizer['recordBytes'] = sampleBytes
+            else:
+                batchSizer['recordBytes'] = batchSizer['recordBytes'] * 0.9 + sampleBytes * 0.1
+
+        batch.append(record)
+        batchBytes = batchBytes + batchSizer['recordBytes']
+
+        if batchBytes >= batchSizer['targetBytes'] or len(batch) >= batchSizer['maxRows']:
+            yield batch
+            batch = []
+            batchBytes = 0
+
+    if batch:
+        yield batch
+
+
+
+#Run a stage of the file pipeline (download, parse, batching) in its own thread
+#
+# The items are produced in a background thread and handed over through a queue of at most
+# queueSize chunks of chunkSize items, so the stage runs ahead of its consumer by that much and no
+# further. Errors of the stage are raised in the consumer; when the consumer stops early the stage
+# is stopped and its items closed.
+def iterPipelined(items, queueSize=4, chunkSize=1):
+
+    stageQueue = queue.Queue(queueSize)
+    stageStopped = threading.Event()
+
+    def putStageItem(stageItem):
+        while not stageStopped.is_set():
+            try:
+                stageQueue.put(stageItem, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def runStage():
+        try:
+            for chunk in iterBatches(items, chunkSize):
+                if not putStageItem((chunk, None)):
+                    return
+            putStageItem((None, None))
+        except BaseException as error:
+            putStageItem((None, error))
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+
+    stageThread = threading.Thread(target=runStage, daemon=True)
+    stageThread.start()
+
+    try:
+        while True:
+            chunk, error = stageQueue.get()
+            if error is not None:
+                raise error
+            if chunk is None:
+                return
+            for item in chunk:
+                yield item
+    finally:
+        stageStopped.set()
+
+
+
+#Layout of a Kore file described by a schema: number of columns, email column, import field names
+#and getFields, picking the fields of the import record out of a split line (in the order of fieldNames)
+def getSchemaLayout(schema):
+
+    schemaFields = schema['fields']
+
+    schemaLayout = {}
+    schemaLayout['columnCount'] = max(column for fieldName, column, eloquaField in schemaFields) + 1
+    schemaLayout['emailColumn'] = [column for fieldName, column, eloquaField in schemaFields if fieldName == schema['emailField']][0]
+    schemaLayout['fieldNames'] = [fieldName for fieldName, column, eloquaField in schemaFields]
+    schemaLayout['getFields'] = operator.itemgetter(*[column for fieldName, column, eloquaField in schemaFields])
+
+    return schemaLayout
+
+
+
+#Cut the email column out of a chunk of lines (str or bytes), rows too short to hold it get an empty email
+#
+# Line ends are stripped first, so no cell ends with a newline, whichever column holds the email
+# and however short the row is. The cells can be joined with newlines and split again safely.
+def cutEmailColumn(chunk, emailColumn):
+
+    if not chunk:
+        return []
+
+    if isinstance(chunk[0], bytes):
+        separator, lineEnd, emptyCell = b'|', b'\r\n', b''
+    else:
+        separator, lineEnd, emptyCell = '|', '\r\n', ''
+
+    emailCells = [line.rstrip(lineEnd).split(separator, emailColumn + 1) for line in chunk]
+
+    return [cells[emailColumn] if len(cells) > emailColumn else emptyCell for cells in emailCells]
+
+
+
+#Row parser of a Kore file built from its schema (see the get*Schema functions of the templates)
+#
+# The schema lists (CDO import field name, column of the Kore file, Eloqua CDO field) and names the
+# import field holding the email address. The parser skips the header line, drops rows with missing
+# columns and yields the import record (built with getSchemaLayout, as iterColumnarRows does) of every
+# row whose email address is in the contact index (isContactEmail). Counts of parsed and matching rows
+# are added to fileStats.
+def compileRowParser(schema):
+
+    schemaLayout = getSchemaLayout(schema)
+    columnCount = schemaLayout['columnCount']
+    emailColumn = schemaLayout['emailColumn']
+    fieldNames = schemaLayout['fieldNames']
+    getFields = schemaLayout['getFields']
+
+    def parseRows(contentLines, contactIndex, fileStats):
+
+        records = 0
+        matched = 0
+
+        try:
+            for line in itertools.islice(contentLines, 1, None):
+                records = records + 1
+                contentSplit = line.rstrip('\r\n').split('|')
+                if len(contentSplit) < columnCount:
+                    continue
+                if isContactEmail(contactIndex, contentSplit[emailColumn].lower()):
+                    matched = matched + 1
+                    yield dict(zip(fieldNames, getFields(contentSplit)))
+        finally:
+            fileStats['records'] = fileStats['records'] + records
+            fileStats['matched'] = fileStats['matched'] + matched
+
+    return parseRows
+
+
+
+#Columnar parsing of a Kore file, an alternative to the row parser of compileRowParser for large files
+#
+# Lines are read chunkRows at a time. Only the email column of the chunk is cut out of the lines
+# (a split that stops after that column), then lower-cased and looked up in the contact index
+# as a whole column. The full split and the import record (same as the row parser) are only done
+# for the rows that match.
+def iterColumnarRows(contentLines, schema, contactIndex, fileStats, chunkRows=20000):
+
+    schemaLayout = getSchemaLayout(schema)
+    columnCount = schemaLayout['columnCount']
+    fieldNames = schemaLayout['fieldNames']
+    getFields = schemaLayout['getFields']
+
+    contentLines = iter(contentLines)
+    next(contentLines, None)
+
+    while True:
+        chunk = list(itertools.islice(contentLines, chunkRows))
+        if not chunk:
+            break
+
+        fileStats['records'] = fileStats['records'] + len(chunk)
+
+        # Email column of the chunk, lower-cased in one go (rows too short to hold it never match)
+        emails = '\n'.join(cutEmailColumn(chunk, schemaLayout['emailColumn'])).lower().encode('utf-8').split(b'\n')
+
+        for rowIndex in itertools.compress(itertools.count(), matchContactEmails(contactIndex, emails)):
+            row = chunk[rowIndex].rstrip('\r\n').split('|')
+            if len(row) < columnCount:
+                continue
+            fileStats['matched'] = fileStats['matched'] + 1
+            yield dict(zip(fieldNames, getFields(row)))
+
+
+
+#Download a file served over HTTP (ie. a presigned S3 url) once into stagingDir, returns the local path
+def stageUrlToFile(url, stagingDir, fileName, bufferSize=1048576):
+
+    os.makedirs(stagingDir, exist_ok=True)
+
+    stagedFile, stagedPath = tempfile.mkstemp(dir=stagingDir, suffix='_' + fileName)
+
+    bucketData = getHttpSession().get(url, stream=True)
+    try:
+        bucketData.raise_for_status()
+        with os.fdopen(stagedFile, 'wb') as stagingFile:
+            for content in bucketData.iter_content(bufferSize):
+                stagingFile.write(content)
+    except BaseException:
+        os.remove(stagedPath)
+        raise
+    finally:
+        bucketData.close()
+
+    return stagedPath
+
+
+
+#Parse a staged Kore file through mmap, decoding only the rows that belong to Eloqua contacts
+#
+# Same chunked column filter as iterColumnarRows but on the raw bytes of the file: the email
+# column of a chunk is cut out, lower-cased and checked against the contact index (getContactEmailIndex)
+# without decoding, the fields of a row are only decoded when its email address matches. Yields the
+# same import records. The staged file is removed once parsed unless keepFile.
+def iterStagedRows(stagedPath, schema, contactIndex, fileStats, chunkRows=20000, encoding='utf-8', keepFile=False):
+
+    schemaLayout = getSchemaLayout(schema)
+    columnCount = schemaLayout['columnCount']
+    fieldNames = schemaLayout['fieldNames']
+    getFields = schemaLayout['getFields']
+
+    try:
+        if os.path.getsize(stagedPath) == 0:
+            return
+
+        with open(stagedPath, 'rb') as stagedFile, mmap.mmap(stagedFile.fileno(), 0, access=mmap.ACCESS_READ) as stagedContent:
+
+            contentLines = iter(stagedContent.readline, b'')
+            next(contentLines, None)
+
+            while True:
+                chunk = list(itertools.islice(contentLines, chunkRows))
+                if not chunk:
+                    break
+
+                fileStats['records'] = fileStats['records'] + len(chunk)
+
+                # Email column of the chunk (rows too short to hold it never match)
+                emails = b'\n'.join(cutEmailColumn(chunk, schemaLayout['emailColumn']))
+
+                # Plain ASCII columns are lower-cased as bytes, others are decoded to lower-case them
+                if emails.isascii() and encoding in ('utf-8', 'ascii'):
+                    emails = emails.lower().split(b'\n')
+                else:
+                    emails = emails.decode(encoding, 'replace').lower().encode('utf-8').split(b'\n')
+
+                for rowIndex in itertools.compress(itertools.count(), matchContactEmails(contactIndex, emails)):
+                    row = chunk[rowIndex].decode(encoding).rstrip('\r\n').split('|')
+                    if len(row) < columnCount:
+                        continue
+                    fileStats['matched'] = fileStats['matched'] + 1
+                    yield dict(zip(fieldNames, getFields(row)))
+    finally:
+        if not keepFile:
+            os.remove(stagedPath)
+
+
+
+#Fields of the bulk import definition (import field name -> Eloqua CDO field) described by a schema
+def getImportFields(schema):
+
+    return dict((fieldName, eloquaField) for fieldName, column, eloquaField in schema['fields'])
+
+
+
+# Context shared by the files handled in a worker process, set once per process by setWorkerContext
+workerContext = None
+
+
+
+def setWorkerContext(context):
+
+    global workerContext
+    workerContext = context
+
+
+
+def runFileWorker(fileFunction, keyString):
+
+    return fileFunction(workerContext, keyString)
+
+
+
+#Run fileFunction(fileContext, keyString) for every Kore file key, parallelism files at a time
+#
+# With useProcesses the files are spread over a pool of worker processes, so the CPU bound parsing
+# of several files runs on several cores; fileContext (contact emails, access, settings) is sent
+# once to each process rather than once per file. Otherwise a thread pool is used, which is enough
+# when the files are small and the time goes into downloads and imports.
+# fileDone(keyString, fileResult) is called in this process as the results come in (in key order).
+# Returns the results of fileFunction in the order of keyStrings.
+def processFilesConcurrently(keyStrings, fileFunction, fileContext, parallelism=1, useProcesses=False, fileDone=None):
+
+    if parallelism <= 1 or len(keyStrings) <= 1:
+        pool = None
+        fileResults = (fileFunction(fileContext, keyString) for keyString in keyStrings)
+    elif useProcesses:
+        pool = ProcessPoolExecutor(max_workers=parallelism, initializer=setWorkerContext, initargs=(fileContext,))
+        fileResults = pool.map(runFileWorker, itertools.repeat(fileFunction), keyStrings)
+    else:
+        pool = ThreadPoolExecutor(max_workers=parallelism)
+        fileResults = pool.map(lambda keyString: fileFunction(fileContext, keyString), keyStrings)
+
+    results = []
+    try:
+        for keyString, fileResult in zip(keyStrings, fileResults):
+            if fileDone is not None:
+                fileDone(keyString, fileResult)
+            results.append(fileResult)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    return results
+
+
+
+#Load the manifest of the Kore files already processed (keyString -> key entry), empty when missing
+def loadKeyManifest(manifestPath):
+
+    if not os.path.exists(manifestPath):
+        return {}
+
+    with open(manifestPath) as manifestFile:
+        return json.load(manifestFile)
+
+
+
+#Write the manifest of the processed Kore files, replacing the previous file in one step
+def saveKeyManifest(manifestPath, keyManifest):
+
+    manifestDir = os.path.dirname(manifestPath)
+    if manifestDir:
+        os.makedirs(manifestDir, exist_ok=True)
+
+    with open(manifestPath + '.tmp', 'w') as manifestFile:
+        json.dump(keyManifest, manifestFile, indent=2, sort_keys=True)
+
+    os.replace(manifestPath + '.tmp', manifestPath)
+
+
+
+#Manifest entry of a key listed from the S3 bucket
+def getKeyEntry(key):
+
+    keyEntry = {}
+    keyEntry['keyString'] = str(key.key)
+    keyEntry['etag'] = key.etag
+    keyEntry['size'] = key.size
+    keyEntry['lastModified'] = key.last_modified
+
+    return keyEntry
+
+
+
+#True when the same version of the key (etag, size and last modified) has been processed before
+def isKeyProcessed(keyManifest, keyEntry):
+
+    processedEntry = keyManifest.get(keyEntry['keyString'])
+    if processedEntry is None:
+        return False
+
+    for fieldName in ('etag', 'size', 'lastModified'):
+        if processedEntry.get(fieldName) != keyEntry[fieldName]:
+            return False
+
+    return True
+
+
+
+#Record a key as processed and save the manifest straight away, so a retry resumes after it
+def markKeyProcessed(manifestPath, keyManifest, keyEntry):
+
+    processedEntry = dict(keyEntry)
+    processedEntry['processedAt'] = datetime.datetime.now().strftime(STAMP_FORMAT)
+
+    keyManifest[keyEntry['keyString']] = processedEntry
+    saveKeyManifest(manifestPath, keyManifest)
+
+
+
+#Write a set of keys (ie. the PKs of a Kore file) one per line, replacing the previous file in one step
+def saveKeySet(keySetPath, keySet):
+
+    keySetDir = os.path.dirname(keySetPath)
+    if keySetDir:
+        os.makedirs(keySetDir, exist_ok=True)
+
+    with open(keySetPath + '.tmp', 'w') as keySetFile:
+        keySetFile.writelines(str(key) + '\n' for key in keySet)
+
+    os.replace(keySetPath + '.tmp', keySetPath)
+
+
+
+#Read a set of keys written by saveKeySet
+def loadKeySet(keySetPath):
+
+    with open(keySetPath) as keySetFile:
+        return set(line.rstrip('\n') for line in keySetFile if line.rstrip('\n'))
+
+
+
+#Open the run journal of runName on runDate (SQLite file journalPath), a run started again on the same day resumes from it
+#
+# The journal holds the status, attempts and (for the stages skipped once done) the result of each
+# stage of the run (runJournalStage) and the rows of each Kore file staged into the import so far
+# (recordFileOffset), along with the etag and size of the version of the file they were read from.
+# The journal is a plain dict, it can be handed over to the file workers; every call opens its own
+# short lived connection.
+def openRunJournal(journalPath, runName, runDate):
+
+    journalDir = os.path.dirname(journalPath)
+    if journalDir:
+        os.makedirs(journalDir, exist_ok=True)
+
+    db = sqlite3.connect(journalPath, timeout=600)
+    with db:
+        # Journals written before the stage results were kept run every stage again
+        stageColumns = [row[1] for row in db.execute('pragma table_info(runStage)')]
+        if stageColumns and 'result' not in stageColumns:
+            db.execute('drop table runStage')
+        db.execute('create table if not exists runStage (runId text, stage text, status text, attempts integer, result text, updatedAt text, primary key (runId, stage))')
+        # Journals written before the file versions were kept lose their file offsets, the files are staged again
+        fileColumns = [row[1] for row in db.execute('pragma table_info(runFile)')]
+        if fileColumns and 'etag' not in fileColumns:
+            db.execute('drop table runFile')
+        db.execute('create table if not exists runFile (runId text, keyString text, etag text, size integer, rowsStaged integer, status text, updatedAt text, primary key (runId, keyString))')
+    db.close()
+
+    journal = {}
+    journal['path'] = journalPath
+    journal['runName'] = runName
+    journal['runId'] = runName + ' ' + runDate
+
+    return journal
+
+
+
+#Run a statement against the run journal in its own transaction, returns the rows selected
+def executeRunJournal(journal, statement, parameters):
+
+    db = sqlite3.connect(journal['path'], timeout=600)
+    try:
+        with db:
+            return db.execute(statement, parameters).fetchall()
+    finally:
+        db.close()
+
+
+
+#Record the status of a stage of the run, with its result (json) once done
+def recordStage(journal, stage, status, attempts, result=None):
+
+    executeRunJournal(
+        journal,
+        'insert or replace into runStage (runId, stage, status, attempts, result, updatedAt) values (?, ?, ?, ?, ?, ?)',
+        (journal['runId'], stage, status, attempts, result, datetime.datetime.now().strftime(STAMP_FORMAT))
+        )
+
+
+
+#Run a stage of the run and record it in the journal, retried after retryPolicy
+#
+# retryPolicy holds the attempts of the stage and the delay before the first retry, doubled on every
+# retry up to maxDelay (seconds). Returns the result of stageFunction, the last error is raised once
+# the attempts are exhausted.
+#
+# A skipDone stage is run once per run: its result (json) is kept in the journal and a run started
+# again returns it instead of running the stage after it is done.
+def runJournalStage(journal, stage, stageFunction, retryPolicy, skipDone=False):
+
+    if skipDone:
+        stageRows = executeRunJournal(
+            journal,
+            'select status, result from runStage where runId = ? and stage = ?',
+            (journal['runId'], stage)
+            )
+        if stageRows and stageRows[0][0] == 'done':
+            print('Stage {} already done by this run, skipping...'.format(stage))
+            return json.loads(stageRows[0][1])
+
+    attempts = retryPolicy.get('attempts', 1)
+    delay = retryPolicy.get('delay', 0)
+
+    for attempt in range(1, attempts + 1):
+
+        recordStage(journal, stage, 'running', attempt)
+
+        try:
+            result = stageFunction()
+        except Exception as error:
+            recordStage(journal, stage, 'failed', attempt)
+            if attempt == attempts:
+                raise
+            print('Stage {} failed ({}), retrying in {}s (attempt {} of {})...'.format(stage, error, delay, attempt, attempts))
+            time.sleep(delay)
+            delay = min(delay * 2, retryPolicy.get('maxDelay', delay))
+        else:
+            recordStage(journal, stage, 'done', attempt, json.dumps(result) if skipDone else None)
+            return result
+
+
+
+#Rows of a Kore file (keyEntry, see getKeyEntry) already staged into the import by this run and the status of the file
+#
+# (0, None) when none, or when they were read from another version of the file (etag or size differ).
+def getFileOffset(journal, keyEntry):
+
+    rows = executeRunJournal(
+        journal,
+        'select rowsStaged, status, etag, size from runFile where runId = ? and keyString = ?',
+        (journal['runId'], keyEntry['keyString'])
+        )
+
+    if not rows or rows[0][2] != keyEntry['etag'] or rows[0][3] != keyEntry['size']:
+        return (0, None)
+
+    return rows[0][:2]
+
+
+
+#Record the rows of a Kore file (keyEntry, see getKeyEntry) staged so far
+#
+# status is 'staging' while the file is pushed, 'staged' once the whole file is and 'synced' once the
+# sync of the run took the staged rows in.
+def recordFileOffset(journal, keyEntry, rowsStaged, status='staging'):
+
+    executeRunJournal(
+        journal,
+        'insert or replace into runFile (runId, keyString, etag, size, rowsStaged, status, updatedAt) values (?, ?, ?, ?, ?, ?, ?)',
+        (journal['runId'], keyEntry['keyString'], keyEntry['etag'], keyEntry['size'], rowsStaged, status, datetime.datetime.now().strftime(STAMP_FORMAT))
+        )
+
+
+
+#Cut the rows of a Kore file already staged by this run (resumeOffset, see getFileOffset) off its import batches
+#
+# Yields each batch with its rows still to stage, an empty list for a batch staged whole. The rows of
+# the file have to come out in the order they did for the earlier attempt (see getRunContactIndex).
+def iterResumedBatches(importBatches, resumeOffset):
+
+    rowOffset = 0
+    for importBatch in importBatches:
+        yield importBatch, importBatch[max(resumeOffset - rowOffset, 0):]
+        rowOffset = rowOffset + len(importBatch)
@@ -11,6 +11,43 @@
 # UPDATES
 #
 #
+# Version 1.5:
+# - replaced the recursive sync() polling with waitForSync (exponential backoff with jitter and an overall deadline)
+# - contact email export pages are now downloaded concurrently (iterExportPages)
+# - the contact email set and the summary counts are built while streaming the export pages (iterExportRecords)
+# - the integration summary reads the created/updated counts from totalResults instead of downloading every row (countOnly)
+# - the integration summary exports are created, synced and checked by runBulkExport
+# - contact email addresses are cached on disk and refreshed with the contacts modified since the last run
+# - all Eloqua, S3 and Mailgun calls go through one shared keep-alive HTTP session (getHttpSession)
+# - the Eloqua base url and auth headers are cached (getEloquaAccessContext) and passed to every stage, bulkUrl/restUrl come from it
+# - Kore files are streamed from S3 line by line and parsed rows go straight to the import batches (iterUrlLines, iterBatches)
+# - the Kore files of a run are processed in parallel over a pool of worker processes (processFilesConcurrently)
+# - processed S3 keys are recorded in a manifest, only new or changed Kore files are picked up (and a retry resumes)
+# - the file layout is declared once (get*Schema), the row parser is built from it and yields the import records
+#   directly, the import definition fields come from the same schema
+# - large Kore files can be parsed column-wise a chunk of lines at a time (columnarParsing, iterColumnarRows)
+# - Kore files can be staged on local disk and parsed through mmap, only matching rows are decoded (stageFiles)
+# - staged files are checked against a hashed contact index (optionally behind a Bloom filter) on the raw email column
+# - the contact email set is replaced by the compact contact index of getContactEmailIndex (sorted 64-bit hashes),
+#   shared by the runs within emailIndexReuseMinutes
+# - download, parse/batching and import of a file run as pipeline stages connected by bounded queues (iterPipelined)
+# - the import block is replaced by the import uploader, several batches are uploaded at once behind an adaptive
+#   throttle (429 rate limits) and every sync is followed to completion (importEnabled, importWorkers)
+# - one import definition per run (looked up by name or created), the file workers only stage batches into it and
+#   the run syncs it once, after every file is staged
+# - import batches are sized by serialized bytes, adapted to the upload latency and errors (getBatchSizer)
+# - the CDO instances to reconcile are read concurrently at the largest REST page size, keeping only id and pk
+#   (getRestInstanceKeys)
+# - the CDO snapshot of the reconciliation comes from a bulk export of only the pk and instance id (getExportInstanceKeys)
+# - the commented DELETE block is replaced by deleteCustomObjectInstances (deleteEnabled), a bulk delete with a fallback
+#   to concurrent throttled REST deletes, checkpointed so an interrupted purge resumes
+# - the reconciliation runs once per run (reconcileMembershipCDO) instead of once per file, against the PKs of all
+#   the membership files merged into one set (each file's PKs are kept under pkSetDir)
+# - the whole run retried 5 times with 5 minute sleeps is replaced by stages retried after their own policy
+#   (stageRetries) and a run journal (runJournalPath), a retry resumes after the files processed and the rows
+#   of a file already staged instead of starting over; every attempt of a run matches the files against the same
+#   contact index (getRunContactIndex) and the reconcile and summary stages are not run again once done
+#
 # Version 1.4:
 # - updated to Python3 syntax
 #
@@ -31,35 +68,11 @@ import boto
 from boto.s3.connection import S3Connection
 import sys, os
 from boto.s3.key import Key
-import urllib.request
 import csv
 import codecs
-import requests
-import json
-import base64
-import time
 import datetime
 import pyodbc
-
-
-
-#Sync function for retreiving exports/imports from Eloqua
-def sync(uri, response, base_url):
-    if response.json()['status'] == 'pending':
-        syncrequest = requests.get(base_url + '/api/bulk/2.0' + uri, headers=headers)
-        if syncrequest.json()['status'] == 'success':
-            return True
-        elif syncrequest.json()['status'] == 'pending':
-            print('Sync Pending')
-            sync(uri, response, base_url)
-        elif syncrequest.json()['status'] == 'active':
-            print('Sync Churning')
-            sync(uri, response, base_url)
-        elif syncrequest.json()['status'] == 'warning' or 'error':
-            print((requests.get(base_url + '/api/bulk/2.0' + uri +'/logs', headers=headers)).json())
-        else:
-            print(syncrequest.json())
-            print('Sync Failed')
+from Kore_Integration_Utils import runBulkExport, iterExportRecords, getExportCount, getRunContactIndex, getHttpSession, getEloquaAccessContext, iterUrlLines, iterSizedBatches, getBatchSizer, processFilesConcurrently, loadKeyManifest, getKeyEntry, isKeyProcessed, markKeyProcessed, compileRowParser, getImportFields, iterColumnarRows, stageUrlToFile, iterStagedRows, iterPipelined, getImportDefinitionUri, startImportUploader, getFileImportWorkers, submitImportBatch, finishImportUploader, syncImportDefinition, isSyncDone, getRestInstanceKeys, getExportInstanceKeys, deleteCustomObjectInstances, saveKeySet, loadKeySet, openRunJournal, runJournalStage, getFileOffset, recordFileOffset, iterResumedBatches
 
 
 
@@ -70,26 +83,10 @@ def getEloquaAccess():
     username = ''
     pw = ''
 
-    # Set up authentication encoding  
-    key = site+'\\'+username+':'+pw
-    authKey = base64.b64encode(site + '\\' + username + ':' + pw)
-
-    # Key and JSON signals to Eloqua
-    headers = {
-        "Authorization": "Basic " + authKey.strip(),
-        "content-type":"application/json",
-        "Accept":"application/json; encoding='utf8'"
-    }
+    # Base URL and headers are looked up once and cached for ACCESS_TTL seconds
+    ACCESS_TTL = 3600
 
-    r = requests.get('https://login.eloqua.com/id', headers=headers)
-    baseUrl = r.json()['urls']['base']
-
-    apiAccess = {}
-    apiAccess['sitename'] = site
-    apiAccess['headers'] = headers
-    apiAccess['baseUrl'] = baseUrl
-    
-    return apiAccess
+    return getEloquaAccessContext(site, username, pw, ttl=ACCESS_TTL)
 
 
 
@@ -113,514 +110,664 @@ def getBucketInfo():
 
 
 
-def getMembershipIntegrationSummary():                
+def getRunSettings():
+
+    # Polling of Eloqua syncs, delays and deadline are in seconds
+    SYNC_MAX_DELAY = 60
+    SYNC_DEADLINE = 3600
+
+    # Bulk export paging, number of records per page and pages downloaded at the same time
+    EXPORT_PAGE_SIZE = 50000
+    EXPORT_WORKERS = 4
+
+    # Integration summary only reads the record counts of the CDO exports (no paging through the data)
+    SUMMARY_COUNT_ONLY = True
+
+    # Import the parsed rows into the CDO (IMPORT_PATH relative to the bulk API), IMPORT_WORKERS batches at a time
+    # for the whole run, whatever the number of FILE_WORKERS
+    IMPORT_ENABLED = False
+    IMPORT_PATH = '/customObjects/<customDataObjectId>/imports'
+    IMPORT_WORKERS = 4
+
+    # Import batches are cut by serialized size, starting at IMPORT_BATCH_BYTES and adapted between IMPORT_BATCH_MIN_BYTES
+    # and IMPORT_BATCH_MAX_BYTES so that an upload takes about IMPORT_BATCH_SECONDS; at most IMPORT_BATCH_SIZE rows per batch
+    IMPORT_BATCH_BYTES = 4194304
+    IMPORT_BATCH_MIN_BYTES = 262144
+    IMPORT_BATCH_MAX_BYTES = 20971520
+    IMPORT_BATCH_SECONDS = 10
+    IMPORT_BATCH_SIZE = 50000
+
+    # Download, parse/batching and import of a file run as pipeline stages (iterPipelined), each stage runs at most
+    # PIPELINE_QUEUE_SIZE chunks (of PIPELINE_LINE_CHUNK lines for the download) ahead of the next one
+    PIPELINE_QUEUE_SIZE = 4
+    PIPELINE_LINE_CHUNK = 10000
+
+    # Parse the Kore files a chunk of COLUMNAR_CHUNK_ROWS lines at a time (iterColumnarRows) instead of line by line
+    COLUMNAR_PARSING = True
+    COLUMNAR_CHUNK_ROWS = 20000
+
+    # Download each Kore file once into STAGING_DIR and parse it from there (iterStagedRows) instead of streaming it;
+    # parsing then only starts once the whole file is on disk
+    STAGE_FILES = False
+    STAGING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'staging', 'membership')
+
+    # Number of Kore files processed at the same time, in worker processes (or threads when False)
+    FILE_WORKERS = 4
+    FILE_WORKER_PROCESSES = True
+
+    # Manifest of the Kore files (S3 keys) already processed
+    KEY_MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'membership_key_manifest.json')
+
+    # Journal of the runs (SQLite, shared by the Kore templates), a run started again on the same day resumes from it
+    RUN_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'kore_run_journal.db')
+
+    # Retry policy of each stage of a run: attempts, seconds before the first retry and longest wait (doubled per retry)
+    STAGE_RETRIES = {
+        'access' : {'attempts' : 5, 'delay' : 30, 'maxDelay' : 300},
+        'contacts' : {'attempts' : 3, 'delay' : 60, 'maxDelay' : 300},
+        'files' : {'attempts' : 5, 'delay' : 10, 'maxDelay' : 300},
+        'reconcile' : {'attempts' : 3, 'delay' : 60, 'maxDelay' : 300},
+        'summary' : {'attempts' : 3, 'delay' : 30, 'maxDelay' : 300},
+        }
+
+    # Snapshot of the Membership CDO instances to reconcile, read with a bulk export (of the pk and RECONCILE_ID_FIELD)
+    RECONCILE_FROM_EXPORT = True
+    RECONCILE_EXPORT_PATH = '/customObjects/<customDataObjectId>/exports'
+    RECONCILE_ID_FIELD = '{{CustomObject[<customDataObjectId>].Id}}'
+
+    # or else through REST, page size (1000 at most) and pages read at the same time
+    RECONCILE_PAGE_SIZE = 1000
+    RECONCILE_WORKERS = 4
+
+    # Delete the CDO instances whose pk is no longer in the Kore file (the DELETE block used to be commented out),
+    # through a bulk delete definition on DELETE_BULK_PATH (None to go straight to REST deletes), or else
+    # DELETE_WORKERS REST deletes at a time; deleted ids are checkpointed in DELETE_CHECKPOINT_PATH
+    DELETE_ENABLED = False
+    DELETE_BULK_PATH = '/customObjects/<customDataObjectId>/imports/deletes'
+    DELETE_WORKERS = 4
+    DELETE_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'membership_delete.checkpoint')
+
+    # PKs of each processed Kore file, the CDO is reconciled against the PKs of all the membership files of the bucket
+    PK_SET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'membership_pks')
+
+    # Local cache of the contact email addresses (one per Eloqua site, the site name is added to EMAIL_CACHE_PATH),
+    # fully re-exported every EMAIL_CACHE_FULL_REFRESH_DAYS
+    EMAIL_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'contact_emails.db')
+    EMAIL_CACHE_FULL_REFRESH_DAYS = 7
+
+    # Contact index (sorted email hashes) saved with the cache, reused as is by runs within EMAIL_INDEX_REUSE_MINUTES
+    # of the last export; Bloom filter bits per contact in front of it (0 for none); confirm matches against the cache
+    EMAIL_INDEX_REUSE_MINUTES = 30
+    CONTACT_BLOOM_BITS = 0
+    CONTACT_EXACT_CHECK = False
+
+    runSettings = {}
+    runSettings['syncMaxDelay'] = SYNC_MAX_DELAY
+    runSettings['syncDeadline'] = SYNC_DEADLINE
+    runSettings['exportPageSize'] = EXPORT_PAGE_SIZE
+    runSettings['exportWorkers'] = EXPORT_WORKERS
+    runSettings['summaryCountOnly'] = SUMMARY_COUNT_ONLY
+    runSettings['importEnabled'] = IMPORT_ENABLED
+    runSettings['importPath'] = IMPORT_PATH
+    runSettings['importWorkers'] = IMPORT_WORKERS
+    runSettings['importBatchSize'] = IMPORT_BATCH_SIZE
+    runSettings['importBatchBytes'] = IMPORT_BATCH_BYTES
+    runSettings['importBatchMinBytes'] = IMPORT_BATCH_MIN_BYTES
+    runSettings['importBatchMaxBytes'] = IMPORT_BATCH_MAX_BYTES
+    runSettings['importBatchSeconds'] = IMPORT_BATCH_SECONDS
+    runSettings['pipelineQueueSize'] = PIPELINE_QUEUE_SIZE
+    runSettings['pipelineLineChunk'] = PIPELINE_LINE_CHUNK
+    runSettings['columnarParsing'] = COLUMNAR_PARSING
+    runSettings['columnarChunkRows'] = COLUMNAR_CHUNK_ROWS
+    runSettings['stageFiles'] = STAGE_FILES
+    runSettings['stagingDir'] = STAGING_DIR
+    runSettings['fileWorkers'] = FILE_WORKERS
+    runSettings['fileWorkerProcesses'] = FILE_WORKER_PROCESSES
+    runSettings['keyManifestPath'] = KEY_MANIFEST_PATH
+    runSettings['runJournalPath'] = RUN_JOURNAL_PATH
+    runSettings['stageRetries'] = STAGE_RETRIES
+    runSettings['reconcileFromExport'] = RECONCILE_FROM_EXPORT
+    runSettings['reconcileExportPath'] = RECONCILE_EXPORT_PATH
+    runSettings['reconcileIdField'] = RECONCILE_ID_FIELD
+    runSettings['reconcilePageSize'] = RECONCILE_PAGE_SIZE
+    runSettings['reconcileWorkers'] = RECONCILE_WORKERS
+    runSettings['deleteEnabled'] = DELETE_ENABLED
+    runSettings['deleteBulkPath'] = DELETE_BULK_PATH
+    runSettings['deleteWorkers'] = DELETE_WORKERS
+    runSettings['deleteCheckpointPath'] = DELETE_CHECKPOINT_PATH
+    runSettings['pkSetDir'] = PK_SET_DIR
+    runSettings['emailCachePath'] = EMAIL_CACHE_PATH
+    runSettings['emailCacheFullRefreshDays'] = EMAIL_CACHE_FULL_REFRESH_DAYS
+    runSettings['emailIndexReuseMinutes'] = EMAIL_INDEX_REUSE_MINUTES
+    runSettings['contactBloomBits'] = CONTACT_BLOOM_BITS
+    runSettings['contactExactCheck'] = CONTACT_EXACT_CHECK
+
+    return runSettings
+
+
+
+#Layout of the Kore Membership file: CDO import field name, column in the file and Eloqua CDO field
+#
+# The row parser (compileRowParser) and the fields of the import definition are both built from it.
+def getMembershipSchema():
 
-    apiAccess = getEloquaAccess()
-    sitename = apiAccess['site']
-    headers = apiAccess['headers']
-    baseUrl = apiAccess['baseUrl']
+    MEMBERSHIP_FIELDS = [
+        ('pk', 0, '{{CustomObject[13].Field[190]}}'),
+        ('email', 1, '{{CustomObject[13].Field[191]}}'),
+        ('ticket_group_category', 2, '{{CustomObject[13].Field[192]}}'),
+        ('ticket_group_name', 3, '{{CustomObject[13].Field[193]}}'),
+        ('ticket_group_display_name', 4, '{{CustomObject[13].Field[194]}}'),
+        ('season', 5, '{{CustomObject[13].Field[195]}}'),
+        ('ticketing_system', 6, '{{CustomObject[13].Field[196]}}')
+        ]
 
-    print('Retrieving Membership CDO Data Created Today...')
+    membershipSchema = {}
+    membershipSchema['name'] = 'membership'
+    membershipSchema['fields'] = MEMBERSHIP_FIELDS
+    membershipSchema['emailField'] = 'email'
+
+    return membershipSchema
 
-    cdoData = json.dumps({
-        "name" : "Retrieve SYSTEM - KORE Membership CDO Data Created Today",
-        "fields" : {
-            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
-            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
-        },
-        "filter" : "'{{CustomObject[<customDataObjectId>].CreatedAt}}' >= '" + todayDate + "'"
-    })
 
-    cdoUrl = baseUrl + '/api/bulk/2.0/customObjects/<customDataObjectId>/exports'
-    cdoReqExport = requests.post(cdoUrl, headers=headers, data=cdoData)
 
-    cdoExportUri = cdoReqExport.json()["uri"]
+#Parse the lines of a Kore Membership file, yields the rows belonging to Eloqua contacts
+#
+# Built from getMembershipSchema (compileRowParser), counts of parsed and matching rows are kept in fileStats.
+parseMembershipRows = compileRowParser(getMembershipSchema())
 
-    # Setup sync instance 
-    cdoReqExportSyncData = json.dumps({
-        "syncedInstanceUri" : cdoExportUri}
-    )
 
-    # Sync the data retrieval
-    cdoReqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=cdoReqExportSyncData)
 
-    if cdoReqSync.status_code == 201:
-        cdoSyncUri = cdoReqSync.json()['uri']
-        sync(cdoSyncUri, cdoReqSync, bulkUrl)
-    else: 
-        print('cdoReqSync status code failed to process...')
-        #quit()
+#Bulk import definition of the Membership CDO, looked up (or created) once per run by getImportDefinitionUri
+def getMembershipImportDefinition():
 
-    # Get the Sync Instance URI
-    cdoReqSyncInstanceUri = cdoReqSync.json()['syncedInstanceUri']
+    membershipSchema = getMembershipSchema()
 
-    # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-    # Keep trying to retrieve the data until successful
-    cdoCount = 0
-    cdoHasMore = 'False'
+    importDefinition = {
+        "name": "SYSTEM - KORE Membership CDO Import",
+        "fields": getImportFields(membershipSchema),
+        "identifierFieldName" : "pk",
+        "isSyncTriggeredOnImport" : "false",
+        "mapDataCards" : "true",
+        "mapDataCardsEntityType" : "Contact",
+        "mapDataCardsSourceField": membershipSchema['emailField'],
+        "mapDataCardsEntityField" : "{{Contact.Field(C_EmailAddress)}}",
+        }
 
-    cdoReqData = requests.get(baseUrl + '/api/bulk/2.0' + cdoReqSyncInstanceUri + '/data', params='limit=50000', headers=headers)
-    #parsedResponse = r.json()
-    cdoReqDataCount = int(cdoReqData.json()['count'])
+    return importDefinition
 
-    print('Retrieving first 50000 CDO records...')
-    membershipDataCreated = []
 
-    if cdoReqDataCount > 0:
-        cdoReqDataItems = cdoReqData.json()['items']
-    else:
-        cdoReqDataItems = []
-
-    for element in cdoReqDataItems:
-        elem = {}
-        elem['pk'] = element['pk']
-        elem['emailAddress'] = element['emailAddress'].lower()
-        elem['createDate'] = element['createDate']
-        elem['updateDate'] = element['updateDate']
-        membershipDataCreated.append(elem)
-
-    cdoHasMore = cdoReqData.json()["hasMore"]
-    cdoOffsetNum = 0
-    #orig_url = url
-
-    while cdoHasMore is True:
-        cdoOffsetNum = cdoOffsetNum + 50000
-        print('Retrieving next {} CDO records...'.format(cdoOffsetNum))
-        cdoReqUrl = bulkUrl + cdoReqSyncInstanceUri + '/data' + '?offset=%d' % cdoOffsetNum
-
-        cdoReqData = requests.get(cdoReqUrl, params='limit=50000', headers=headers)
-        cdoReqDataCount = int(cdoReqData.json()['count'])
-
-        if cdoReqDataCount > 0:
-            cdoReqDataItems = cdoReqData.json()['items']
+
+#Download, parse and import a single Kore Membership file
+#
+# Runs in a worker of processFilesConcurrently, fileContext holds the access context, bucket info,
+# contact index and run settings. Returns the counts of the file.
+def processMembershipFile(fileContext, keyString):
+
+    apiAccess = fileContext['apiAccess']
+    bucketInfo = fileContext['bucketInfo']
+    contactIndex = fileContext['contactIndex']
+    runSettings = fileContext['runSettings']
+    membershipSchema = getMembershipSchema()
+
+    filename = keyString.split('/')[-1]
+    print('Filename : {}'.format(str(filename)))
+
+    # Each file (worker) uses its own S3 connection
+    conn = boto.connect_s3(bucketInfo['accessKey'],
+                    bucketInfo['secretAccessKey'])
+
+    url = conn.generate_url(
+        60,
+        'GET',
+        bucketInfo['bucketName'],
+        keyString
+        )
+
+    # The staged file is removed once the file is done or failed, whatever step it failed at
+    stagedPath = None
+    try:
+        # Stage the file locally or stream it, rows are parsed and filtered as the lines come in
+        fileStats = {'records' : 0, 'matched' : 0}
+        if runSettings['stageFiles']:
+            stagedPath = stageUrlToFile(url, runSettings['stagingDir'], filename)
+            exportRows = iterStagedRows(stagedPath, membershipSchema, contactIndex, fileStats, runSettings['columnarChunkRows'], keepFile=True)
         else:
-            cdoReqDataItems = []
-
-        for element in cdoReqDataItems:
-            elem = {}
-            elem['pk'] = element['pk']
-            elem['emailAddress'] = element['emailAddress'].lower()
-            elem['createDate'] = element['createDate']
-            elem['updateDate'] = element['updateDate']
-            membershipDataCreated.append(elem)
-        
-        cdoHasMore = cdoReqData.json()["hasMore"]
-      
-    print('Number of Membership Data Created : {}'.format(len(membershipDataCreated)))
+            # Download stage, the lines are read ahead of the parser in chunks of pipelineLineChunk
+            contentLines = iterPipelined(iterUrlLines(url), runSettings['pipelineQueueSize'], runSettings['pipelineLineChunk'])
+            if runSettings['columnarParsing']:
+                exportRows = iterColumnarRows(contentLines, membershipSchema, contactIndex, fileStats, runSettings['columnarChunkRows'])
+            else:
+                exportRows = parseMembershipRows(contentLines, contactIndex, fileStats)
+
+        # Parse and batching stage, the next import batches are prepared while the current one is imported
+        batchSizer = getBatchSizer(
+            initialBytes=runSettings['importBatchBytes'],
+            minBytes=runSettings['importBatchMinBytes'],
+            maxBytes=runSettings['importBatchMaxBytes'],
+            maxRows=runSettings['importBatchSize'],
+            targetSeconds=runSettings['importBatchSeconds']
+            )
+        importBatches = iterPipelined(iterSizedBatches(exportRows, batchSizer), runSettings['pipelineQueueSize'])
+
+        # NOTE - set IMPORT_ENABLED (getRunSettings) to import the Kore Membership file contents into the CDO,
+        #        batches are staged importWorkers at a time while the file is still being parsed, less the
+        #        rows of the file staged by an earlier attempt of the run (journal); the run syncs them once
+        journal = fileContext['journal']
+        keyEntry = fileContext['keyEntries'][keyString]
+        uploader = None
+        resumeOffset = 0
+        if fileContext['importUri'] is not None:
+            resumeOffset = getFileOffset(journal, keyEntry)[0]
+            if resumeOffset:
+                print('Resuming {} after the {} rows already staged'.format(keyString, resumeOffset))
+            uploader = startImportUploader(
+                apiAccess,
+                fileContext['importUri'],
+                maxWorkers=fileContext['importWorkers'],
+                maxDelay=runSettings['syncMaxDelay'],
+                deadline=runSettings['syncDeadline'],
+                batchSizer=batchSizer,
+                rowOffset=resumeOffset,
+                stagedDone=lambda rowsStaged: recordFileOffset(journal, keyEntry, rowsStaged)
+                )
 
-    print('Retrieving Membership CDO Data Updated Today...')
+        importCounter = 1
+        rowOffset = 0
 
-    cdoData = json.dumps({
-        "name" : "Retrieve SYSTEM - KORE Membership CDO Data Updated Today",
-        "fields" : {
-            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
-            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
-        },
-        "filter" : "'{{CustomObject[<customDataObjectId>].UpdatedAt}}' >= '" + todayDate + "' AND '{{CustomObject[<customDataObjectId>].CreatedAt}}' < '" + todayDate + "'"
-    })
+        # Set of the PKs in the file, used to find the CDO records to delete (reconcileMembershipCDO)
+        existingPKSet = set()
 
-    cdoUrl = baseUrl + '/api/bulk/2.0/customObjects/<customDataObjectId>/exports'
-    cdoReqExport = requests.post(cdoUrl, headers=headers, data=cdoData)
+        # Rows come out of the parser as import records already, less the rows staged before
+        for i, importContents in iterResumedBatches(importBatches, resumeOffset):
 
-    cdoExportUri = cdoReqExport.json()["uri"]
+            existingPKSet.update(j['pk'] for j in i)
 
-    # Setup sync instance 
-    cdoReqExportSyncData = json.dumps({
-        "syncedInstanceUri" : cdoExportUri}
-    )
+            rowOffset += len(i)
 
-    # Sync the data retrieval
-    cdoReqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=cdoReqExportSyncData)
+            if not importContents:
+                print('Import batch {} already staged, skipping...'.format(importCounter))
+                importCounter += 1
+                continue
 
-    if cdoReqSync.status_code == 201:
-        cdoSyncUri = cdoReqSync.json()['uri']
-        sync(cdoSyncUri, cdoReqSync, bulkUrl)
-    else: 
-        print 'cdoReqSync status code failed to process...'
-        #quit()
+            print('Import records into CDO batch {}...'.format(importCounter))
+            print('Number of records to import: {}'.format(len(importContents)))
 
-    # Get the Sync Instance URI
-    cdoReqSyncInstanceUri = cdoReqSync.json()["syncedInstanceUri"]
+            if uploader is not None:
+                submitImportBatch(uploader, importCounter, importContents)
+            importCounter += 1
 
-    # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-    # Keep trying to retrieve the data until successful
-    cdoCount = 0
-    cdoHasMore = "False"
+        if uploader is not None:
+            importResult = finishImportUploader(uploader, sync=False)
+            print('Import batches staged : {}'.format(len(importResult['batches'])))
+            recordFileOffset(journal, keyEntry, rowOffset, 'staged')
 
-    cdoReqData = requests.get(baseUrl + '/api/bulk/2.0' + cdoReqSyncInstanceUri + '/data', params='limit=50000', headers=headers)
-    cdoReqDataCount = int(cdoReqData.json()['count'])
+        print('Number of records processed : {}'.format(fileStats['records']))
+        print('Number of records to import : {}'.format(fileStats['matched']))
 
-    print('Retrieving first 50000 CDO records...')
-    membershipDataUpdated = []
+        # The PKs of the file are kept with the run state, the CDO is reconciled once against the PKs of every file
+        pkSetPath = os.path.join(runSettings['pkSetDir'], keyString.replace('/', '_') + '.pks')
+        saveKeySet(pkSetPath, existingPKSet)
 
-    if cdoReqDataCount > 0:
-        cdoReqDataItems = cdoReqData.json()['items']
-    else:
-        cdoReqDataItems = []
+        fileStats['keyString'] = keyString
+        fileStats['pkSetPath'] = pkSetPath
 
-    for element in cdoReqDataItems:
-        elem = {}
-        elem['pk'] = element['pk']
-        elem['emailAddress'] = element['emailAddress'].lower()
-        elem['createDate'] = element['createDate']
-        elem['updateDate'] = element['updateDate']
-        membershipDataUpdated.append(elem)
+        return fileStats
 
-    cdoHasMore = cdoReqData.json()["hasMore"]
-    cdoOffsetNum = 0
+    finally:
+        if stagedPath is not None and os.path.exists(stagedPath):
+            os.remove(stagedPath)
 
-    while cdoHasMore is True:
-        cdoOffsetNum = cdoOffsetNum + 50000
-        print('Retrieving next {} CDO records...'.format(cdoOffsetNum))
-        cdoReqUrl = bulkUrl + cdoReqSyncInstanceUri + '/data' + '?offset=%d' % cdoOffsetNum
 
-        cdoReqData = requests.get(cdoReqUrl, params='limit=50000', headers=headers)
-        cdoReqDataCount = int(cdoReqData.json()['count'])
 
-        if cdoReqDataCount > 0:
-            cdoReqDataItems = cdoReqData.json()['items']
+#Delete the Membership CDO instances whose pk is in none of the Kore membership files (membershipKeyStrings)
+#
+# Runs once per run, against the PKs of every file merged into one set, the instance id -> pk snapshot
+# of the CDO is read once and diffed in a single pass. Without the PKs of one of the files nothing is deleted.
+def reconcileMembershipCDO(apiAccess, runSettings, membershipKeyStrings):
+
+    membershipSchema = getMembershipSchema()
+    restUrl = apiAccess['restUrl']
+
+    existingPKSet = set()
+    missingPKSets = []
+    for keyString in membershipKeyStrings:
+        pkSetPath = os.path.join(runSettings['pkSetDir'], keyString.replace('/', '_') + '.pks')
+        if os.path.exists(pkSetPath):
+            existingPKSet.update(loadKeySet(pkSetPath))
         else:
-            cdoReqDataItems = []
-
-        for element in cdoReqDataItems:
-            elem = {}
-            elem['pk'] = element['pk']
-            elem['emailAddress'] = element['emailAddress'].lower()
-            elem['createDate'] = element['createDate']
-            elem['updateDate'] = element['updateDate']
-            membershipDataUpdated.append(elem)
-        
-        cdoHasMore = cdoReqData.json()["hasMore"]
-      
-    print('Number of Membership Data Updated : {}'.format(len(membershipDataUpdated)))
+            missingPKSets.append(keyString)
+
+    if not membershipKeyStrings or missingPKSets:
+        print('No PKs recorded for {}, skipping the reconciliation of the Membership CDO'.format(missingPKSets or 'the bucket'))
+        return {}
+
+    #
+    # Start of Delete non-existing PKs from Membership CDO
+    #
+
+    print('Start of deleting non-existant PKs from Membership CDO...')
+
+    # Instance id -> pk of the CDO, from a bulk export of the two fields or from the REST instances
+    # (pages of reconcilePageSize read reconcileWorkers at a time)
+    if runSettings['reconcileFromExport']:
+        instanceKeys = getExportInstanceKeys(
+            apiAccess,
+            runSettings['reconcileExportPath'],
+            getImportFields(membershipSchema)['pk'],
+            runSettings['reconcileIdField'],
+            limit=runSettings['exportPageSize'],
+            maxWorkers=runSettings['exportWorkers'],
+            maxDelay=runSettings['syncMaxDelay'],
+            deadline=runSettings['syncDeadline']
+            )
+    else:
+        url = restUrl + '/data/customObject/<customDataObjectId>/instances'
+        instanceKeys = getRestInstanceKeys(
+            apiAccess,
+            url,
+            '<CDO fieldId of pk in Membership CDO>',
+            count=runSettings['reconcilePageSize'],
+            maxWorkers=runSettings['reconcileWorkers']
+            )
+
+    print('Number of IDs : {}'.format(len(instanceKeys)))
+
+    staleInstances = {instanceId : pk for instanceId, pk in instanceKeys.items() if pk not in existingPKSet}
+
+    print('Number of IDs to delete : {}'.format(len(staleInstances)))
+
+    if runSettings['deleteEnabled']:
+        url = restUrl + '/data/customObject/<customDataObjectId>/instance/'
+        deleteResult = deleteCustomObjectInstances(
+            apiAccess,
+            staleInstances,
+            runSettings['deleteCheckpointPath'],
+            url,
+            bulkDeletePath=runSettings['deleteBulkPath'],
+            keyField=getImportFields(membershipSchema)['pk'],
+            maxWorkers=runSettings['deleteWorkers'],
+            maxDelay=runSettings['syncMaxDelay'],
+            deadline=runSettings['syncDeadline']
+            )
+        print('Number of IDs deleted : {} ({} deletes, {} resumed from the checkpoint)'.format(
+            deleteResult['deleted'] + deleteResult['resumed'], deleteResult['method'], deleteResult['resumed']))
+
+    #
+    # End of Delete non-existing PKs from Membership CDO
+    #
+
+    return staleInstances
+
+
+
+def getMembershipIntegrationSummary(apiAccess, countOnly=True):                
+
+    runSettings = getRunSettings()
+
+    todayDate = datetime.datetime.today().strftime('%Y-%m-%d')
+
+    print('Retrieving Membership CDO Data Created Today...')
+
+    cdoData = {
+        "name" : "Retrieve SYSTEM - KORE Membership CDO Data Created Today",
+        "fields" : {
+            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
+            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
+        },
+        "filter" : "'{{CustomObject[<customDataObjectId>].CreatedAt}}' >= '" + todayDate + "'"
+    }
+
+    # Create the export, sync it and wait for the sync (raises when the sync does not go through)
+    cdoReqSyncInstanceUri = runBulkExport(
+        apiAccess,
+        '/customObjects/<customDataObjectId>/exports',
+        cdoData,
+        maxDelay=runSettings['syncMaxDelay'],
+        deadline=runSettings['syncDeadline']
+        )
+
+    # Using the Sync Instance URI, count the records from Eloqua API
+    if countOnly:
+        membershipDataCreated = getExportCount(apiAccess, cdoReqSyncInstanceUri)
+    else:
+        membershipDataCreated = 0
+        for element in iterExportRecords(apiAccess, cdoReqSyncInstanceUri, limit=runSettings['exportPageSize'], maxWorkers=runSettings['exportWorkers']):
+            membershipDataCreated = membershipDataCreated + 1
+
+    print('Number of Membership Data Created : {}'.format(membershipDataCreated))
+
+    print('Retrieving Membership CDO Data Updated Today...')
+
+    cdoData = {
+        "name" : "Retrieve SYSTEM - KORE Membership CDO Data Updated Today",
+        "fields" : {
+            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
+            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
+        },
+        "filter" : "'{{CustomObject[<customDataObjectId>].UpdatedAt}}' >= '" + todayDate + "' AND '{{CustomObject[<customDataObjectId>].CreatedAt}}' < '" + todayDate + "'"
+    }
+
+    # Create the export, sync it and wait for the sync (raises when the sync does not go through)
+    cdoReqSyncInstanceUri = runBulkExport(
+        apiAccess,
+        '/customObjects/<customDataObjectId>/exports',
+        cdoData,
+        maxDelay=runSettings['syncMaxDelay'],
+        deadline=runSettings['syncDeadline']
+        )
+
+    # Using the Sync Instance URI, count the records from Eloqua API
+    if countOnly:
+        membershipDataUpdated = getExportCount(apiAccess, cdoReqSyncInstanceUri)
+    else:
+        membershipDataUpdated = 0
+        for element in iterExportRecords(apiAccess, cdoReqSyncInstanceUri, limit=runSettings['exportPageSize'], maxWorkers=runSettings['exportWorkers']):
+            membershipDataUpdated = membershipDataUpdated + 1
+
+    print('Number of Membership Data Updated : {}'.format(membershipDataUpdated))
 
     membershipIntegrationSummary = {}
-    membershipIntegrationSummary['dataCreated'] = len(membershipDataCreated)
-    membershipIntegrationSummary['dataUpdated'] = len(membershipDataUpdated)
+    membershipIntegrationSummary['dataCreated'] = membershipDataCreated
+    membershipIntegrationSummary['dataUpdated'] = membershipDataUpdated
 
     return membershipIntegrationSummary
 
 
 
+#Process the Kore Membership files of the bucket that are new or changed since they were last processed
+#
+# Returns the keys of every membership file of the bucket (the unchanged ones included) and the results of the files processed.
+def processMembershipFiles(apiAccess, contactIndex, runSettings, journal):
+
+    # Connect to the bucket
+    bucketInfo = getBucketInfo()
+    conn = boto.connect_s3(bucketInfo['accessKey'],
+                    bucketInfo['secretAccessKey'])
+    bucket = conn.get_bucket(bucketInfo['bucketName'], validate=False)
+    # go through the list of files
+    bucket_list = bucket.list(prefix=bucketInfo['prefix'])
+
+    # Only pick up the files that are new or changed since they were last processed
+    keyManifest = loadKeyManifest(runSettings['keyManifestPath'])
+    keyEntries = {}
+
+    keyStringArray = []
+    membershipKeyStrings = []
+    for l in bucket_list:
+        if 'membership' in str(l.key):
+            keyString = str(l.key)
+            keyEntry = getKeyEntry(l)
+            membershipKeyStrings.append(keyString)
+            if isKeyProcessed(keyManifest, keyEntry):
+                print('Keystring already processed : {}'.format(str(keyString)))
+                continue
+            print('Keystring : {}'.format(str(keyString)))
+            keyStringArray.append(keyString)
+            keyEntries[keyString] = keyEntry
+
+    fileContext = {}
+    fileContext['apiAccess'] = apiAccess
+    fileContext['bucketInfo'] = bucketInfo
+    fileContext['contactIndex'] = contactIndex
+    fileContext['runSettings'] = runSettings
+    fileContext['journal'] = journal
+    fileContext['keyEntries'] = keyEntries
+
+    # One import definition for all the files (and retries) of the run
+    if runSettings['importEnabled']:
+        fileContext['importUri'] = getImportDefinitionUri(apiAccess, runSettings['importPath'], getMembershipImportDefinition())
+    else:
+        fileContext['importUri'] = None
+
+    # Files staged whole by an earlier attempt of the run only wait for the sync
+    pendingKeyStrings = keyStringArray
+    if fileContext['importUri'] is not None:
+        pendingKeyStrings = []
+        for keyString in keyStringArray:
+            if getFileOffset(journal, keyEntries[keyString])[1] == 'staged':
+                print('Keystring already staged : {}'.format(str(keyString)))
+            else:
+                pendingKeyStrings.append(keyString)
+
+    # Import requests in flight for the whole run (importWorkers), shared by the file workers of a process
+    # and split over the worker processes
+    fileContext['importWorkers'] = getFileImportWorkers(
+        runSettings['importWorkers'],
+        runSettings['fileWorkers'],
+        runSettings['fileWorkerProcesses'],
+        len(pendingKeyStrings)
+        )
+
+    # Without imports a file is done once parsed, with imports once the sync of the run took its rows in
+    fileDone = None
+    if fileContext['importUri'] is None:
+        fileDone = lambda keyString, fileResult: markKeyProcessed(runSettings['keyManifestPath'], keyManifest, keyEntries[keyString])
+
+    fileResults = processFilesConcurrently(
+        pendingKeyStrings,
+        processMembershipFile,
+        fileContext,
+        parallelism=runSettings['fileWorkers'],
+        useProcesses=runSettings['fileWorkerProcesses'],
+        fileDone=fileDone
+        )
+
+    # One sync of the import definition for the run, once every file is staged. When it fails the rows
+    # of the run are staged again by the next attempt; a sync ending with a warning only left out the
+    # rows Eloqua rejected, the files are done.
+    if fileContext['importUri'] is not None and keyStringArray:
+        syncResult = syncImportDefinition(apiAccess, fileContext['importUri'], maxDelay=runSettings['syncMaxDelay'], deadline=runSettings['syncDeadline'])
+        if not isSyncDone(syncResult):
+            for keyString in keyStringArray:
+                recordFileOffset(journal, keyEntries[keyString], 0, 'failed')
+            raise Exception('Import sync of the run finished with status {}'.format(syncResult['status']))
+
+        for keyString in keyStringArray:
+            recordFileOffset(journal, keyEntries[keyString], getFileOffset(journal, keyEntries[keyString])[0], 'synced')
+            markKeyProcessed(runSettings['keyManifestPath'], keyManifest, keyEntries[keyString])
+
+    return membershipKeyStrings, fileResults
+
+
+
 def startMembershipIntegration(clientName):
 
-    apiAccess = getEloquaAccess()
-    sitename = apiAccess['site']
-    headers = apiAccess['headers']
-    baseUrl = apiAccess['baseUrl']
+    runSettings = getRunSettings()
 
     successFlag = True
-    numOfRetries = 1
-    actualRetries = 1
 
     todayDate = datetime.datetime.today().strftime('%Y-%m-%d')
 
     print('\n')
     print('Started running {} - Membership.py : {}'.format(clientName, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
 
-    while numOfRetries <= 5:
+    # Journal of today's run, every stage is retried after its own policy (stageRetries) and a run
+    # started again today resumes from the stages, files and import syncs recorded in it (the contact
+    # index of the run included, the staged rows of a file are counted against it)
+    journal = openRunJournal(runSettings['runJournalPath'], 'Membership ' + clientName, todayDate)
+    stageRetries = runSettings['stageRetries']
+
+    try:
+
+        # Cached access context, a retry only logs in again once the cached one has expired
+        apiAccess = runJournalStage(journal, 'access', getEloquaAccess, stageRetries['access'])
+        sitename = apiAccess['sitename']
+
+        print('Retrieving all Email Addresses ' + sitename + ' in Instance...')
+        contactIndex = runJournalStage(
+            journal,
+            'contacts',
+            lambda: getRunContactIndex(
+                journal,
+                apiAccess,
+                runSettings['emailCachePath'],
+                fullRefreshDays=runSettings['emailCacheFullRefreshDays'],
+                limit=runSettings['exportPageSize'],
+                maxWorkers=runSettings['exportWorkers'],
+                maxDelay=runSettings['syncMaxDelay'],
+                deadline=runSettings['syncDeadline'],
+                reuseMinutes=runSettings['emailIndexReuseMinutes'],
+                bloomBitsPerEmail=runSettings['contactBloomBits'],
+                exactCheck=runSettings['contactExactCheck']
+                ),
+            stageRetries['contacts']
+            )
+
+        print('Number of Email Addresses : {}'.format(len(contactIndex['hashes'])))
 
-        print('Running script {} of 5 times...'.format(numOfRetries))
+        print('Processing KORE files for the ' + clientName)
 
-        try:
+        # A retry only goes through the files not processed yet (key manifest) and the rows of a file not synced yet (journal)
+        membershipKeyStrings, fileResults = runJournalStage(
+            journal,
+            'files',
+            lambda: processMembershipFiles(apiAccess, contactIndex, runSettings, journal),
+            stageRetries['files']
+            )
+
+        print('Number of files processed : {}'.format(len(fileResults)))
+        print('Total number of records processed : {}'.format(sum(fileResult['records'] for fileResult in fileResults)))
+        print('Total number of records to import : {}'.format(sum(fileResult['matched'] for fileResult in fileResults)))
+
+        # One reconciliation for the run, against the PKs of every membership file, resumed from its delete checkpoint
+        runJournalStage(
+            journal,
+            'reconcile',
+            lambda: reconcileMembershipCDO(apiAccess, runSettings, membershipKeyStrings),
+            stageRetries['reconcile'],
+            skipDone=True
+            )
 
-            print('Retrieving all Email Addresses ' + sitename + ' in Instance...')
-            reqExportData = json.dumps({
-                'name' : 'All Email Addresses',
-                'fields' : {
-                    'emailAddress' : '{{Contact.Field(C_EmailAddress)}}',
-                    },
-                })
+        successFlag = True
 
-            reqExport = requests.post(baseUrl + '/api/bulk/2.0/contacts/exports', headers=headers, data=reqExportData)
+        membershipIntegrationSummary = runJournalStage(
+            journal,
+            'summary',
+            lambda: getMembershipIntegrationSummary(apiAccess, runSettings['summaryCountOnly']),
+            stageRetries['summary'],
+            skipDone=True
+            )
+        membershipDataCreated = membershipIntegrationSummary['dataCreated']
+        membershipDataUpdated = membershipIntegrationSummary['dataUpdated']
+        writeToMembershipSummaryTable(successFlag, clientName, membershipDataCreated, membershipDataUpdated)
 
-            reqExportUri = reqExport.json()["uri"]
+    except Exception as e:
 
-            # Setup sync instance 
-            reqSyncData = json.dumps({
-                'syncedInstanceUri' : reqExportUri}
-                )
+        print(e)
+        print('Failed to run.')
 
-            # Sync the data retrieval
-            reqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=reqSyncData)
-
-            if reqSync.status_code == 201:
-                syncUri = reqSync.json()['uri']
-                sync(syncUri, reqSync, bulkUrl)
-            else: 
-                print('Failed to sync...')
-                #quit()
-
-            # Get the Sync Instance URI
-            reqSyncInstanceUri = reqSync.json()['syncedInstanceUri']
-
-            # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-            # Keep trying to retrieve the data until successful
-            reqDataUrl = baseUrl + '/api/bulk/2.0' + reqSyncInstanceUri + '/data'
-            count = 0
-            hasMore = 'False'
-
-            reqData = requests.get(reqDataUrl, params='limit=50000', headers=headers)
-
-            print('Retrieving first 50000 records...')
-            emailAddress = []
-            for element in reqData.json()['items']:
-                emailAddress.append(element['emailAddress'].lower())
-
-            hasMore = reqData.json()['hasMore']
-            offsetNum = 0
-
-            while hasMore is True:
-                offsetNum = offsetNum + 50000
-                print('Retrieving next {} records...'.format(offsetNum))
-                reqDataUrl = baseUrl + '/api/bulk/2.0' + reqSyncInstanceUri + '/data' + '?offset=%d' % offsetNum
-
-                reqData = requests.get(reqDataUrl, params='limit=50000', headers=headers)
-
-                for element in reqData.json()['items']:
-                    emailAddress.append(element['emailAddress'].lower())
-                
-                hasMore = reqData.json()['hasMore']
-              
-            print('Number of Email Addresses : {}'.format(len(emailAddress)))
-
-            print('Setting up Email Address Set...')
-            emailAddressSet = set(emailAddress)
-
-            print('Processing KORE files for the ' + clientName)
-
-            # Connect to the bucket
-            conn = boto.connect_s3(AWS_ACCESS_KEY_ID,
-                            AWS_SECRET_ACCESS_KEY)
-            bucket = conn.get_bucket(bucket_name, validate=False)
-            # go through the list of files
-            bucket_list = bucket.list(prefix=prefix)
-
-            keyStringArray = []
-            for l in bucket_list:
-                if 'membership' in str(l.key):
-                    keyString = str(l.key)
-                    print('Keystring : {}'.format(str(keyString)))
-                    keyStringArray.append(keyString)
-
-            fileNum = 1
-            for keyString in keyStringArray:
-                filename = keyString.split('/')[-1]
-                print('Filename : {}'.format(str(filename)))
-
-                key=bucket.get_key(keyString)
-                print('Key : {}'.format(str(key)))
-
-                url = conn.generate_url(
-                    60,
-                    'GET',
-                    bucket_name,
-                    keyString
-                    )
-
-                bucketData = urllib.request.urlopen(url)
-                contentOrig = []
-                for line in bucketData:
-                    contentOrig.append(line.decode('utf-8'))
-
-                print('Number of records to process : {}'.format(len(contentOrig)))
-
-                #continue 
-
-                exportData = []
-                counter = 0
-                fieldnameFlag = 0
-                for i in contentOrig:
-
-                    if counter == 0:
-                        counter = counter + 1
-                        continue
-
-                    contentSplit = i.split('|')
-                    try:
-                        elem = {}
-                        elem['pk'] = contentSplit[0]
-                        elem['email'] = contentSplit[1]
-                        elem['ticketGroupCategory'] = contentSplit[2]
-                        elem['ticketGroupName'] = contentSplit[3]
-                        elem['ticketGroupDisplayName'] = contentSplit[4]
-                        elem['season'] = contentSplit[5]
-                        elem['ticketingSystem'] = contentSplit[6].replace('\n','')
-                    except:
-                        continue
-
-                    if elem['email'].lower() in emailAddressSet:
-                        exportData.append(elem)
-
-                print('Number of records to import : {}'.format(len(exportData)))
-
-                #
-                # Start of Delete non-existing PKs from Membership CDO
-                #
-
-                print 'Start of deleting non-existant PKs from Membership CDO...'
-
-                url = restUrl + '/data/customObject/<customDataObjectId>/instances'
-                r = requests.get(url, headers=headers)
-                totalElem = r.json()['total']
-
-                arrayId = []
-                c = 0
-                page = 1
-                while c < totalElem:
-                    r = requests.get(url + '?page=' + str(page), headers=headers)
-                    D = r.json()['elements']
-
-                    for i in D:
-                        for j in i['fieldValues']:
-                            if j['id'] == '<CDO fieldId of pk in Membership CDO>':
-                                elem = {}
-                                elem['id'] = i['id']
-                                elem['pk'] = j['value']
-                                arrayId.append(elem) 
-
-                    c = len(arrayId)
-                    page = page + 1
-
-                print 'Number of IDs : %d' % len(arrayId)
-
-                # quit()
-
-                # Create set of current existing PKs
-                existingPK = []
-                for p in exportData:
-                    existingPK.append(p['pk'])
-                existingPKSet = set(existingPK)
-
-                arrayIdToDelete = []
-                for i in arrayId:
-                    if i['pk'] not in existingPKSet:
-                        arrayIdToDelete.append(i['id'])
-
-                print 'Number of IDs to delete : %d' % len(arrayIdToDelete)
-
-                # ########## DELETE
-                # url = restUrl + '/data/customObject/<customDataObjectId>/instance/'
-                # for x in arrayIdToDelete:
-                #     r = requests.delete(url + str(x), headers=headers)
-                # ########## DELETE
-
-                #
-                # End of Delete non-existing PKs from Membership CDO
-                #
-
-                fileNum = fileNum + 1
-                content_array = [exportData[x:x+10000] for x in xrange(0, len(exportData), 10000)]
-                importCounter = 1
-
-                print('Length of content_array : {}'.format(len(content_array)))
-
-                for i in content_array:
-
-                    importContents = []
-                    for j in i:
-                        tmp_contents = {
-                            "email" : i['email'],
-                            "ticket_group_category" : i['ticketGroupCategory'],
-                            "ticket_group_name" : i['ticketGroupName'],
-                            "ticket_group_display_name" : i['ticketGroupDisplayName'],
-                            "season" : i['season'],
-                            "ticketing_system" : i['ticketingSystem']
-                            }
-
-                        importContents.append(tmp_contents)
-
-                    print('Import records into CDO {} of {}...'.format(importCounter, len(content_array)))
-                    print('Number of records to import: {}'.format(len(importContents)))
-
-                    data = {
-                        "name": "SYSTEM - KORE Membership CDO Import",
-                        "fields": {
-                            "pk" : "{{CustomObject[13].Field[190]}}",
-                            "email" : "{{CustomObject[13].Field[191]}}",
-                            "ticket_group_category" : "{{CustomObject[13].Field[192]}}",
-                            "ticket_group_name" : "{{CustomObject[13].Field[193]}}",
-                            "ticket_group_display_name" : "{{CustomObject[13].Field[194]}}",
-                            "season" : "{{CustomObject[13].Field[195]}}",
-                            "ticketing_system" : "{{CustomObject[13].Field[196]}}"
-                            },
-                        "identifierFieldName" : "pk",
-                        "isSyncTriggeredOnImport" : "true",
-                        "mapDataCards" : "true",
-                        "mapDataCardsEntityType" : "Contact",
-                        "mapDataCardsSourceField": "email",
-                        "mapDataCardsEntityField" : "{{Contact.Field(C_EmailAddress)}}",
-                        }
-
-                     # To String
-                    data = json.dumps(data)
-
-                    importAttempt = 1
-
-                    # NOTE - Uncomment the sections between the IMPORT lines to allow of import of Kore Membership file contents
-                    #        into Ticket Activity CDO
-                    # ########## IMPORT
-                    # while importAttempt < 6:
-                    #     print('Tickets_Daily Import Attempt ' + str(importAttempt) + ' of 5')
-                
-                    #     try:
-                    #         # Post to create Export
-                    #         r = requests.post(bulkUrl+'/customObjects/<customDataObjectId>/imports', data=data, headers=headers)
-                    #         importuri = r.json()['uri'] #retrieve uri of import
-
-                    #         # Push data to staging area
-                    #         import_contents = json.dumps(importContents)
-                    #         importResponse = requests.post(bulkUrl+importuri+'/data', data=import_contents, headers=headers)
-
-                    #         #Execute Sync with import uri
-                    #         data2 = {
-                    #           'syncedInstanceUri' : importuri
-                    #         }
-                    #         data2 = json.dumps(data2)
-
-                    #         r = requests.post(bulkUrl+'/syncs', data=data2, headers=headers)
-
-                    #         importAttempt = 7
-
-                    #         print('Import Successful.')
-                    #     except:
-                    #         print('Import Unsuccessful.')
-                    #         importAttempt = importAttempt + 1
-                    #         time.sleep(60)
-                    # importCounter += 1
-                    # ########## IMPORT
-
-            successFlag = True
-
-            membershipIntegrationSummary = getMembershipIntegrationSummary()
-            membershipDataCreated = membershipIntegrationSummary['dataCreated']
-            membershipDataUpdated = membershipIntegrationSummary['dataUpdated']
-            writeToMembershipSummaryTable(successFlag, clientName, membershipCreated, membershipUpdated)
-
-            numOfRetries = 7
-
-        except Exception as e:
-
-            print(e)
-            print('Failed to run.')
-
-            numOfRetries += 1
-            actualRetries += 1
-
-            successFlag = False            
-            writeToMembershipSummaryTable(successFlag, clientName, '0', '0')
-
-            time.sleep(300)
+        successFlag = False
+        writeToMembershipSummaryTable(successFlag, clientName, '0', '0')
 
     return successFlag
 
 
 
-def writeToMembershipSummaryTable(sFlag, clientName, dataCreated, dataUpdated)
+def writeToMembershipSummaryTable(sFlag, clientName, dataCreated, dataUpdated):
 
     db = pyodbc.connect(driver='{ODBC Driver 17 for SQL Server}',server='',database='', uid='', pwd='')
 
@@ -634,7 +781,7 @@ def writeToMembershipSummaryTable(sFlag, clientName, dataCreated, dataUpdated)
             insert into <clientName>_Membership_Summary values (
                 convert(datetime, '{}', 120), 'Success', {}, {}, 0
             )
-            """.format(todayDatetime, len(dataCreated), len(dataUpdated))
+            """.format(todayDatetime, dataCreated, dataUpdated)
         c.execute(sqlStmt)
 
     else:
@@ -652,7 +799,7 @@ def writeToMembershipSummaryTable(sFlag, clientName, dataCreated, dataUpdated)
     c.close()
     db.close()
 
-    sendNotificationEmal(sFlag, clientName, dataCreated, dataUpdated)
+    sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated)
 
 
 
@@ -765,8 +912,8 @@ def sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated):
                             <p>
                             This is to inform the recipient(s) that the """ + clientName + """ - KORE Integration for Membership has successfully executed for """ + todayDate + """.
                             <br><br>
-                            Records created: """ + str(len(dataCreated)) + """<br>
-                            Records updated: """ + str(len(dataUpdated)) + """<br>
+                            Records created: """ + str(dataCreated) + """<br>
+                            Records updated: """ + str(dataUpdated) + """<br>
                             </p>
                           </td>
                         </tr>
@@ -794,7 +941,7 @@ def sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated):
         MAILGUN_API_KEY = ''
         MAILGUN_DOMAIN_NAME = ''
 
-        requests.post(
+        getHttpSession().post(
             MAILGUN_DOMAIN_NAME,
             auth=("api", MAILGUN_API_KEY),
             data={"from": "Example Name <example@test.com>",
@@ -906,7 +1053,7 @@ def sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated):
                           <td class='inner contents' style='padding-left:30px;padding-right:30px;padding-top:10px;padding-bottom:10px;font-family:Avenir TT Book, Arial, Helvetica, sans-serif;font-size:16px;color:#000000;width:100%;text-align:left;'>
                             
                             <p>
-                            This is to inform the recipient(s) that the """ + cilientName + """ - KORE Integration - Tickets Process has exceeded the 
+                            This is to inform the recipient(s) that the """ + clientName + """ - KORE Integration - Tickets Process has exceeded the 
                             max number of retries and failed to execute for """ + todayDate + """.
                             </p>
                           </td>
@@ -935,7 +1082,7 @@ def sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated):
         MAILGUN_API_KEY = ''
         MAILGUN_DOMAIN_NAME = ''
 
-        requests.post(
+        getHttpSession().post(
             MAILGUN_DOMAIN_NAME,
             auth=("api", MAILGUN_API_KEY),
             data={"from": "Example Name <example@test.com>",
@@ -11,6 +11,36 @@
 # UPDATES
 #
 #
+# Version 1.5:
+# - replaced the recursive sync() polling with waitForSync (exponential backoff with jitter and an overall deadline)
+# - contact email export pages are now downloaded concurrently (iterExportPages)
+# - the contact email set and the summary counts are built while streaming the export pages (iterExportRecords)
+# - the integration summary reads the created/updated counts from totalResults instead of downloading every row (countOnly)
+# - the integration summary exports are created, synced and checked by runBulkExport
+# - contact email addresses are cached on disk and refreshed with the contacts modified since the last run
+# - all Eloqua, S3 and Mailgun calls go through one shared keep-alive HTTP session (getHttpSession)
+# - the Eloqua base url and auth headers are cached (getEloquaAccessContext) and passed to every stage, bulkUrl/restUrl come from it
+# - Kore files are streamed from S3 line by line and parsed rows go straight to the import batches (iterUrlLines, iterBatches)
+# - the Kore files of a run are processed in parallel over a pool of worker processes (processFilesConcurrently)
+# - processed S3 keys are recorded in a manifest, only new or changed Kore files are picked up (and a retry resumes)
+# - the file layout is declared once (get*Schema), the row parser is built from it and yields the import records
+#   directly, the import definition fields come from the same schema
+# - large Kore files can be parsed column-wise a chunk of lines at a time (columnarParsing, iterColumnarRows)
+# - Kore files can be staged on local disk and parsed through mmap, only matching rows are decoded (stageFiles)
+# - staged files are checked against a hashed contact index (optionally behind a Bloom filter) on the raw email column
+# - the contact email set is replaced by the compact contact index of getContactEmailIndex (sorted 64-bit hashes),
+#   shared by the runs within emailIndexReuseMinutes
+# - download, parse/batching and import of a file run as pipeline stages connected by bounded queues (iterPipelined)
+# - the import block is replaced by the import uploader, several batches are uploaded at once behind an adaptive
+#   throttle (429 rate limits) and every sync is followed to completion (importEnabled, importWorkers)
+# - one import definition per run (looked up by name or created), the file workers only stage batches into it and
+#   the run syncs it once, after every file is staged
+# - import batches are sized by serialized bytes, adapted to the upload latency and errors (getBatchSizer)
+# - the whole run retried 5 times with 5 minute sleeps is replaced by stages retried after their own policy
+#   (stageRetries) and a run journal (runJournalPath), a retry resumes after the files processed and the rows
+#   of a file already staged instead of starting over; every attempt of a run matches the files against the same
+#   contact index (getRunContactIndex) and the summary stage is not run again once done
+#
 # Version 1.4:
 # - updated to Python3 syntax
 #
@@ -31,35 +61,11 @@ import boto
 from boto.s3.connection import S3Connection
 import sys, os
 from boto.s3.key import Key
-import urllib.request
 import csv
 import codecs
-import requests
-import json
-import base64
-import time
 import datetime
 import pyodbc
-
-
-
-#Sync function for retreiving exports/imports from Eloqua
-def sync(uri, response, base_url):
-    if response.json()['status'] == 'pending':
-        syncrequest = requests.get(base_url + '/api/bulk/2.0' + uri, headers=headers)
-        if syncrequest.json()['status'] == 'success':
-            return True
-        elif syncrequest.json()['status'] == 'pending':
-            print('Sync Pending')
-            sync(uri, response, base_url)
-        elif syncrequest.json()['status'] == 'active':
-            print('Sync Churning')
-            sync(uri, response, base_url)
-        elif syncrequest.json()['status'] == 'warning' or 'error':
-            print((requests.get(base_url + '/api/bulk/2.0' + uri + '/logs', headers=headers)).json())
-        else:
-            print(syncrequest.json())
-            print('Sync Failed')
+from Kore_Integration_Utils import runBulkExport, iterExportRecords, getExportCount, getRunContactIndex, getHttpSession, getEloquaAccessContext, iterUrlLines, iterSizedBatches, getBatchSizer, processFilesConcurrently, loadKeyManifest, getKeyEntry, isKeyProcessed, markKeyProcessed, compileRowParser, getImportFields, iterColumnarRows, stageUrlToFile, iterStagedRows, iterPipelined, getImportDefinitionUri, startImportUploader, getFileImportWorkers, submitImportBatch, finishImportUploader, syncImportDefinition, isSyncDone, openRunJournal, runJournalStage, getFileOffset, recordFileOffset, iterResumedBatches
 
 
 
@@ -70,27 +76,10 @@ def getEloquaAccess():
     username = ''
     pw = ''
 
-    # Set up authentication encoding  
-    key = site+'\\'+username+':'+pw
-    authKey = base64.b64encode(site + '\\' + username + ':' + pw)
+    # Base URL and headers are looked up once and cached for ACCESS_TTL seconds
+    ACCESS_TTL = 3600
 
-    # Key and JSON signals to Eloqua
-    headers = {
-        "Authorization": "Basic " + authKey.strip(),
-        "content-type":"application/json",
-        "Accept":"application/json; encoding='utf8'"
-    }
-
-    r = requests.get('https://login.eloqua.com/id', headers=headers)
-    baseUrl = r.json()['urls']['base']
-
-    apiAccess = {}
-
-    apiAccess['sitename'] = site
-    apiAccess['headers'] = headers
-    apiAccess['baseUrl'] = baseUrl
-    
-    return apiAccess
+    return getEloquaAccessContext(site, username, pw, ttl=ACCESS_TTL)
 
 
 
@@ -114,552 +103,559 @@ def getBucketInfo():
 
 
 
-def getTicketActivityIntegrationSummary():                
+def getRunSettings():
+
+    # Polling of Eloqua syncs, delays and deadline are in seconds
+    SYNC_MAX_DELAY = 60
+    SYNC_DEADLINE = 3600
+
+    # Bulk export paging, number of records per page and pages downloaded at the same time
+    EXPORT_PAGE_SIZE = 50000
+    EXPORT_WORKERS = 4
+
+    # Integration summary only reads the record counts of the CDO exports (no paging through the data)
+    SUMMARY_COUNT_ONLY = True
+
+    # Import the parsed rows into the CDO (IMPORT_PATH relative to the bulk API), IMPORT_WORKERS batches at a time
+    # for the whole run, whatever the number of FILE_WORKERS
+    IMPORT_ENABLED = False
+    IMPORT_PATH = '/customObjects/<customDataObjectId>/imports'
+    IMPORT_WORKERS = 4
+
+    # Import batches are cut by serialized size, starting at IMPORT_BATCH_BYTES and adapted between IMPORT_BATCH_MIN_BYTES
+    # and IMPORT_BATCH_MAX_BYTES so that an upload takes about IMPORT_BATCH_SECONDS; at most IMPORT_BATCH_SIZE rows per batch
+    IMPORT_BATCH_BYTES = 4194304
+    IMPORT_BATCH_MIN_BYTES = 262144
+    IMPORT_BATCH_MAX_BYTES = 20971520
+    IMPORT_BATCH_SECONDS = 10
+    IMPORT_BATCH_SIZE = 50000
+
+    # Download, parse/batching and import of a file run as pipeline stages (iterPipelined), each stage runs at most
+    # PIPELINE_QUEUE_SIZE chunks (of PIPELINE_LINE_CHUNK lines for the download) ahead of the next one
+    PIPELINE_QUEUE_SIZE = 4
+    PIPELINE_LINE_CHUNK = 10000
+
+    # Parse the Kore files a chunk of COLUMNAR_CHUNK_ROWS lines at a time (iterColumnarRows) instead of line by line
+    COLUMNAR_PARSING = True
+    COLUMNAR_CHUNK_ROWS = 20000
+
+    # Download each Kore file once into STAGING_DIR and parse it from there (iterStagedRows) instead of streaming it;
+    # parsing then only starts once the whole file is on disk
+    STAGE_FILES = False
+    STAGING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'staging', 'ticket_activity')
+
+    # Number of Kore files processed at the same time, in worker processes (or threads when False)
+    FILE_WORKERS = 4
+    FILE_WORKER_PROCESSES = True
+
+    # Manifest of the Kore files (S3 keys) already processed
+    KEY_MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'ticket_activity_key_manifest.json')
+
+    # Journal of the runs (SQLite, shared by the Kore templates), a run started again on the same day resumes from it
+    RUN_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'kore_run_journal.db')
+
+    # Retry policy of each stage of a run: attempts, seconds before the first retry and longest wait (doubled per retry)
+    STAGE_RETRIES = {
+        'access' : {'attempts' : 5, 'delay' : 30, 'maxDelay' : 300},
+        'contacts' : {'attempts' : 3, 'delay' : 60, 'maxDelay' : 300},
+        'files' : {'attempts' : 5, 'delay' : 10, 'maxDelay' : 300},
+        'summary' : {'attempts' : 3, 'delay' : 30, 'maxDelay' : 300},
+        }
+
+    # Local cache of the contact email addresses (one per Eloqua site, the site name is added to EMAIL_CACHE_PATH),
+    # fully re-exported every EMAIL_CACHE_FULL_REFRESH_DAYS
+    EMAIL_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'contact_emails.db')
+    EMAIL_CACHE_FULL_REFRESH_DAYS = 7
+
+    # Contact index (sorted email hashes) saved with the cache, reused as is by runs within EMAIL_INDEX_REUSE_MINUTES
+    # of the last export; Bloom filter bits per contact in front of it (0 for none); confirm matches against the cache
+    EMAIL_INDEX_REUSE_MINUTES = 30
+    CONTACT_BLOOM_BITS = 0
+    CONTACT_EXACT_CHECK = False
+
+    runSettings = {}
+    runSettings['syncMaxDelay'] = SYNC_MAX_DELAY
+    runSettings['syncDeadline'] = SYNC_DEADLINE
+    runSettings['exportPageSize'] = EXPORT_PAGE_SIZE
+    runSettings['exportWorkers'] = EXPORT_WORKERS
+    runSettings['summaryCountOnly'] = SUMMARY_COUNT_ONLY
+    runSettings['importEnabled'] = IMPORT_ENABLED
+    runSettings['importPath'] = IMPORT_PATH
+    runSettings['importWorkers'] = IMPORT_WORKERS
+    runSettings['importBatchSize'] = IMPORT_BATCH_SIZE
+    runSettings['importBatchBytes'] = IMPORT_BATCH_BYTES
+    runSettings['importBatchMinBytes'] = IMPORT_BATCH_MIN_BYTES
+    runSettings['importBatchMaxBytes'] = IMPORT_BATCH_MAX_BYTES
+    runSettings['importBatchSeconds'] = IMPORT_BATCH_SECONDS
+    runSettings['pipelineQueueSize'] = PIPELINE_QUEUE_SIZE
+    runSettings['pipelineLineChunk'] = PIPELINE_LINE_CHUNK
+    runSettings['columnarParsing'] = COLUMNAR_PARSING
+    runSettings['columnarChunkRows'] = COLUMNAR_CHUNK_ROWS
+    runSettings['stageFiles'] = STAGE_FILES
+    runSettings['stagingDir'] = STAGING_DIR
+    runSettings['fileWorkers'] = FILE_WORKERS
+    runSettings['fileWorkerProcesses'] = FILE_WORKER_PROCESSES
+    runSettings['keyManifestPath'] = KEY_MANIFEST_PATH
+    runSettings['runJournalPath'] = RUN_JOURNAL_PATH
+    runSettings['stageRetries'] = STAGE_RETRIES
+    runSettings['emailCachePath'] = EMAIL_CACHE_PATH
+    runSettings['emailCacheFullRefreshDays'] = EMAIL_CACHE_FULL_REFRESH_DAYS
+    runSettings['emailIndexReuseMinutes'] = EMAIL_INDEX_REUSE_MINUTES
+    runSettings['contactBloomBits'] = CONTACT_BLOOM_BITS
+    runSettings['contactExactCheck'] = CONTACT_EXACT_CHECK
+
+    return runSettings
+
+
+
+#Layout of the Kore Ticket Activity file: CDO import field name, column in the file and Eloqua CDO field
+#
+# The row parser (compileRowParser) and the fields of the import definition are both built from it.
+def getTicketActivitySchema():
+
+    TICKET_ACTIVITY_FIELDS = [
+        ('pk', 0, '{{CustomObject[14].Field[197]}}'),
+        ('acct_id', 1, '{{CustomObject[14].Field[198]}}'),
+        ('activity_name', 2, '{{CustomObject[14].Field[199]}}'),
+        ('add_datetime', 3, '{{CustomObject[14].Field[200]}}'),
+        ('add_user', 4, '{{CustomObject[14].Field[201]}}'),
+        ('assoc_acct_id', 5, '{{CustomObject[14].Field[202]}}'),
+        ('assoc_cust_name_id', 6, '{{CustomObject[14].Field[203]}}'),
+        ('buyer_email_addr', 7, '{{CustomObject[14].Field[204]}}'),
+        ('event_date', 8, '{{CustomObject[14].Field[205]}}'),
+        ('event_id', 9, '{{CustomObject[14].Field[232]}}'),
+        ('event_name', 10, '{{CustomObject[14].Field[233]}}'),
+        ('event_time', 11, '{{CustomObject[14].Field[206]}}'),
+        ('export_datetime', 12, '{{CustomObject[14].Field[207]}}'),
+        ('forward_to_email_addr', 13, '{{CustomObject[14].Field[208]}}'),
+        ('inet_transaction_amount', 14, '{{CustomObject[14].Field[209]}}'),
+        ('kore_updated', 15, '{{CustomObject[14].Field[210]}}'),
+        ('last_seat', 16, '{{CustomObject[14].Field[211]}}'),
+        ('name1', 17, '{{CustomObject[14].Field[212]}}'),
+        ('num_seats', 18, '{{CustomObject[14].Field[213]}}'),
+        ('order_line_item', 19, '{{CustomObject[14].Field[214]}}'),
+        ('order_line_item_seq', 20, '{{CustomObject[14].Field[215]}}'),
+        ('order_num', 21, '{{CustomObject[14].Field[216]}}'),
+        ('orig_purchase_price', 22, '{{CustomObject[14].Field[217]}}'),
+        ('plan_event_name', 23, '{{CustomObject[14].Field[218]}}'),
+        ('row_name', 24, '{{CustomObject[14].Field[219]}}'),
+        ('seat_num', 25, '{{CustomObject[14].Field[220]}}'),
+        ('section_name', 26, '{{CustomObject[14].Field[221]}}'),
+        ('seller_email_addr', 27, '{{CustomObject[14].Field[222]}}'),
+        ('te_posting_price', 28, '{{CustomObject[14].Field[223]}}'),
+        ('te_purchase_price', 29, '{{CustomObject[14].Field[224]}}'),
+        ('te_seller_fees', 30, '{{CustomObject[14].Field[225]}}'),
+        ('teamname', 31, '{{CustomObject[14].Field[226]}}'),
+        ('tm_event_name', 32, '{{CustomObject[14].Field[227]}}'),
+        ('tm_row_name', 33, '{{CustomObject[14].Field[228]}}'),
+        ('tm_section_name', 34, '{{CustomObject[14].Field[229]}}'),
+        ('seq_id', 35, '{{CustomObject[14].Field[230]}}'),
+        ('sort_seq', 36, '{{CustomObject[14].Field[231]}}')
+        ]
+
+    ticketActivitySchema = {}
+    ticketActivitySchema['name'] = 'ticket_activity'
+    ticketActivitySchema['fields'] = TICKET_ACTIVITY_FIELDS
+    ticketActivitySchema['emailField'] = 'buyer_email_addr'
+
+    return ticketActivitySchema
+
+
+
+#Parse the lines of a Kore Ticket Activity file, yields the rows belonging to Eloqua contacts
+#
+# Built from getTicketActivitySchema (compileRowParser), counts of parsed and matching rows are kept in fileStats.
+parseTicketActivityRows = compileRowParser(getTicketActivitySchema())
 
-    apiAccess = getEloquaAccess()
-    sitename = apiAccess['site']
-    headers = apiAccess['headers']
-    baseUrl = apiAccess['baseUrl']
 
-    print('Retrieving Ticket Activity CDO Data Created Today...')
 
-    cdoData = json.dumps({
-        "name" : "Retrieve SYSTEM - KORE Ticket Activity CDO Data Created Today",
-        "fields" : {
-            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
-            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
-        },
-        "filter" : "'{{CustomObject[<customDataObjectId>].CreatedAt}}' >= '" + todayDate + "'"
-    })
+#Bulk import definition of the Ticket Activity CDO, looked up (or created) once per run by getImportDefinitionUri
+def getTicketActivityImportDefinition():
 
-    cdoUrl = baseUrl + '/api/bulk/2.0/customObjects/<customDataObjectId>/exports'
-    cdoReqExport = requests.post(cdoUrl, headers=headers, data=cdoData)
+    ticketActivitySchema = getTicketActivitySchema()
 
-    cdoExportUri = cdoReqExport.json()["uri"]
+    importDefinition = {
+        "name": "SYSTEM - KORE Ticket Activity CDO Import",
+        "fields": getImportFields(ticketActivitySchema),
+        "identifierFieldName" : "pk",
+        "isSyncTriggeredOnImport" : "false",
+        "mapDataCards" : "true",
+        "mapDataCardsEntityType" : "Contact",
+        "mapDataCardsSourceField": ticketActivitySchema['emailField'],
+        "mapDataCardsEntityField" : "{{Contact.Field(C_EmailAddress)}}",
+        }
 
-    # Setup sync instance 
-    cdoReqExportSyncData = json.dumps({
-        "syncedInstanceUri" : cdoExportUri}
-    )
+    return importDefinition
 
-    # Sync the data retrieval
-    cdoReqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=cdoReqExportSyncData)
 
-    if cdoReqSync.status_code == 201:
-        cdoSyncUri = cdoReqSync.json()['uri']
-        sync(cdoSyncUri, cdoReqSync, baseUrl)
-    else: 
-        print('cdoReqSync status code failed to process...')
-        #quit()
 
-    # Get the Sync Instance URI
-    cdoReqSyncInstanceUri = cdoReqSync.json()['syncedInstanceUri']
+#Download, parse and import a single Kore Ticket Activity file
+#
+# Runs in a worker of processFilesConcurrently, fileContext holds the access context, bucket info,
+# contact index and run settings. Returns the counts of the file.
+def processTicketActivityFile(fileContext, keyString):
+
+    apiAccess = fileContext['apiAccess']
+    bucketInfo = fileContext['bucketInfo']
+    contactIndex = fileContext['contactIndex']
+    runSettings = fileContext['runSettings']
+    ticketActivitySchema = getTicketActivitySchema()
+
+    filename = keyString.split('/')[-1]
+    print('Filename : {}'.format(str(filename)))
+
+    # Each file (worker) uses its own S3 connection
+    conn = boto.connect_s3(bucketInfo['accessKey'],
+                    bucketInfo['secretAccessKey'])
+
+    url = conn.generate_url(
+        60,
+        'GET',
+        bucketInfo['bucketName'],
+        keyString
+        )
+
+    # The staged file is removed once the file is done or failed, whatever step it failed at
+    stagedPath = None
+    try:
+        # Stage the file locally or stream it, rows are parsed and filtered as the lines come in
+        fileStats = {'records' : 0, 'matched' : 0}
+        if runSettings['stageFiles']:
+            stagedPath = stageUrlToFile(url, runSettings['stagingDir'], filename)
+            exportRows = iterStagedRows(stagedPath, ticketActivitySchema, contactIndex, fileStats, runSettings['columnarChunkRows'], keepFile=True)
+        else:
+            # Download stage, the lines are read ahead of the parser in chunks of pipelineLineChunk
+            contentLines = iterPipelined(iterUrlLines(url), runSettings['pipelineQueueSize'], runSettings['pipelineLineChunk'])
+            if runSettings['columnarParsing']:
+                exportRows = iterColumnarRows(contentLines, ticketActivitySchema, contactIndex, fileStats, runSettings['columnarChunkRows'])
+            else:
+                exportRows = parseTicketActivityRows(contentLines, contactIndex, fileStats)
+
+        # Parse and batching stage, the next import batches are prepared while the current one is imported
+        batchSizer = getBatchSizer(
+            initialBytes=runSettings['importBatchBytes'],
+            minBytes=runSettings['importBatchMinBytes'],
+            maxBytes=runSettings['importBatchMaxBytes'],
+            maxRows=runSettings['importBatchSize'],
+            targetSeconds=runSettings['importBatchSeconds']
+            )
+        importBatches = iterPipelined(iterSizedBatches(exportRows, batchSizer), runSettings['pipelineQueueSize'])
+
+        # NOTE - set IMPORT_ENABLED (getRunSettings) to import the Kore Ticket Activity file contents into the CDO,
+        #        batches are staged importWorkers at a time while the file is still being parsed, less the
+        #        rows of the file staged by an earlier attempt of the run (journal); the run syncs them once
+        journal = fileContext['journal']
+        keyEntry = fileContext['keyEntries'][keyString]
+        uploader = None
+        resumeOffset = 0
+        if fileContext['importUri'] is not None:
+            resumeOffset = getFileOffset(journal, keyEntry)[0]
+            if resumeOffset:
+                print('Resuming {} after the {} rows already staged'.format(keyString, resumeOffset))
+            uploader = startImportUploader(
+                apiAccess,
+                fileContext['importUri'],
+                maxWorkers=fileContext['importWorkers'],
+                maxDelay=runSettings['syncMaxDelay'],
+                deadline=runSettings['syncDeadline'],
+                batchSizer=batchSizer,
+                rowOffset=resumeOffset,
+                stagedDone=lambda rowsStaged: recordFileOffset(journal, keyEntry, rowsStaged)
+                )
 
-    # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-    # Keep trying to retrieve the data until successful
-    cdoCount = 0
-    cdoHasMore = 'False'
+        importCounter = 1
+        rowOffset = 0
 
-    cdoReqData = requests.get(baseUrl + '/api/bulk/2.0' + cdoReqSyncInstanceUri + '/data', params='limit=50000', headers=headers)
-    #parsedResponse = r.json()
-    cdoReqDataCount = int(cdoReqData.json()['count'])
+        # Rows come out of the parser as import records already, less the rows staged before
+        for i, importContents in iterResumedBatches(importBatches, resumeOffset):
 
-    print('Retrieving first 50000 CDO records...')
-    ticketActivityDataCreated = []
+            rowOffset += len(i)
 
-    if cdoReqDataCount > 0:
-        cdoReqDataItems = cdoReqData.json()['items']
-    else:
-        cdoReqDataItems = []
-
-    for element in cdoReqDataItems:
-        elem = {}
-        elem['pk'] = element['pk']
-        elem['emailAddress'] = element['emailAddress'].lower()
-        elem['createDate'] = element['createDate']
-        elem['updateDate'] = element['updateDate']
-        ticketActivityDataCreated.append(elem)
-
-    cdoHasMore = cdoReqData.json()["hasMore"]
-    cdoOffsetNum = 0
-    #orig_url = url
-
-    while cdoHasMore is True:
-        cdoOffsetNum = cdoOffsetNum + 50000
-        print('Retrieving next {} CDO records...'.format(cdoOffsetNum))
-        cdoReqUrl = bulkUrl + cdoReqSyncInstanceUri + '/data' + '?offset=%d' % cdoOffsetNum
-
-        cdoReqData = requests.get(cdoReqUrl, params='limit=50000', headers=headers)
-        cdoReqDataCount = int(cdoReqData.json()['count'])
-
-        if cdoReqDataCount > 0:
-            cdoReqDataItems = cdoReqData.json()['items']
-        else:
-            cdoReqDataItems = []
-
-        for element in cdoReqDataItems:
-            elem = {}
-            elem['pk'] = element['pk']
-            elem['emailAddress'] = element['emailAddress'].lower()
-            elem['createDate'] = element['createDate']
-            elem['updateDate'] = element['updateDate']
-            ticketActivityDataCreated.append(elem)
-        
-        cdoHasMore = cdoReqData.json()["hasMore"]
-      
-    print('Number of Ticket Activity Data Created : {}'.format(len(ticketActivityDataCreated)))
+            if not importContents:
+                print('Import batch {} already staged, skipping...'.format(importCounter))
+                importCounter += 1
+                continue
 
-    print('Retrieving Ticket Activity CDO Data Updated Today...')
+            print('Import records into CDO batch {}...'.format(importCounter))
+            print('Number of records to import: {}'.format(len(importContents)))
 
-    cdoData = json.dumps({
-        "name" : "Retrieve SYSTEM - KORE Ticket Activity CDO Data Updated Today",
-        "fields" : {
-            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
-            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
-        },
-        "filter" : "'{{CustomObject[<customDataObjectId>].UpdatedAt}}' >= '" + todayDate + "' AND '{{CustomObject[<customDataObjectId>].CreatedAt}}' < '" + todayDate + "'"
-    })
+            if uploader is not None:
+                submitImportBatch(uploader, importCounter, importContents)
+            importCounter += 1
+
+        if uploader is not None:
+            importResult = finishImportUploader(uploader, sync=False)
+            print('Import batches staged : {}'.format(len(importResult['batches'])))
+            recordFileOffset(journal, keyEntry, rowOffset, 'staged')
 
-    cdoUrl = baseUrl + '/api/bulk/2.0/customObjects/<customDataObjectId>/exports'
-    cdoReqExport = requests.post(cdoUrl, headers=headers, data=cdoData)
+        print('Number of records processed : {}'.format(fileStats['records']))
+        print('Number of records to import : {}'.format(fileStats['matched']))
 
-    cdoExportUri = cdoReqExport.json()["uri"]
+        fileStats['keyString'] = keyString
 
-    # Setup sync instance 
-    cdoReqExportSyncData = json.dumps({
-        "syncedInstanceUri" : cdoExportUri}
-    )
+        return fileStats
 
-    # Sync the data retrieval
-    cdoReqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=cdoReqExportSyncData)
+    finally:
+        if stagedPath is not None and os.path.exists(stagedPath):
+            os.remove(stagedPath)
 
-    if cdoReqSync.status_code == 201:
-        cdoSyncUri = cdoReqSync.json()['uri']
-        sync(cdoSyncUri, cdoReqSync, bulkUrl)
-    else: 
-        print 'cdoReqSync status code failed to process...'
-        #quit()
 
-    # Get the Sync Instance URI
-    cdoReqSyncInstanceUri = cdoReqSync.json()["syncedInstanceUri"]
 
-    # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-    # Keep trying to retrieve the data until successful
-    cdoCount = 0
-    cdoHasMore = "False"
+def getTicketActivityIntegrationSummary(apiAccess, countOnly=True):                
 
-    cdoReqData = requests.get(baseUrl + '/api/bulk/2.0' + cdoReqSyncInstanceUri + '/data', params='limit=50000', headers=headers)
-    cdoReqDataCount = int(cdoReqData.json()['count'])
+    runSettings = getRunSettings()
 
-    print('Retrieving first 50000 CDO records...')
-    ticketActivityDataUpdated = []
+    todayDate = datetime.datetime.today().strftime('%Y-%m-%d')
 
-    if cdoReqDataCount > 0:
-        cdoReqDataItems = cdoReqData.json()['items']
+    print('Retrieving Ticket Activity CDO Data Created Today...')
+
+    cdoData = {
+        "name" : "Retrieve SYSTEM - KORE Ticket Activity CDO Data Created Today",
+        "fields" : {
+            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
+            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
+        },
+        "filter" : "'{{CustomObject[<customDataObjectId>].CreatedAt}}' >= '" + todayDate + "'"
+    }
+
+    # Create the export, sync it and wait for the sync (raises when the sync does not go through)
+    cdoReqSyncInstanceUri = runBulkExport(
+        apiAccess,
+        '/customObjects/<customDataObjectId>/exports',
+        cdoData,
+        maxDelay=runSettings['syncMaxDelay'],
+        deadline=runSettings['syncDeadline']
+        )
+
+    # Using the Sync Instance URI, count the records from Eloqua API
+    if countOnly:
+        ticketActivityDataCreated = getExportCount(apiAccess, cdoReqSyncInstanceUri)
     else:
-        cdoReqDataItems = []
+        ticketActivityDataCreated = 0
+        for element in iterExportRecords(apiAccess, cdoReqSyncInstanceUri, limit=runSettings['exportPageSize'], maxWorkers=runSettings['exportWorkers']):
+            ticketActivityDataCreated = ticketActivityDataCreated + 1
 
-    for element in cdoReqDataItems:
-        elem = {}
-        elem['pk'] = element['pk']
-        elem['emailAddress'] = element['emailAddress'].lower()
-        elem['createDate'] = element['createDate']
-        elem['updateDate'] = element['updateDate']
-        ticketActivityDataUpdated.append(elem)
+    print('Number of Ticket Activity Data Created : {}'.format(ticketActivityDataCreated))
 
-    cdoHasMore = cdoReqData.json()["hasMore"]
-    cdoOffsetNum = 0
+    print('Retrieving Ticket Activity CDO Data Updated Today...')
 
-    while cdoHasMore is True:
-        cdoOffsetNum = cdoOffsetNum + 50000
-        print('Retrieving next {} CDO records...'.format(cdoOffsetNum))
-        cdoReqUrl = bulkUrl + cdoReqSyncInstanceUri + '/data' + '?offset=%d' % cdoOffsetNum
+    cdoData = {
+        "name" : "Retrieve SYSTEM - KORE Ticket Activity CDO Data Updated Today",
+        "fields" : {
+            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
+            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
+        },
+        "filter" : "'{{CustomObject[<customDataObjectId>].UpdatedAt}}' >= '" + todayDate + "' AND '{{CustomObject[<customDataObjectId>].CreatedAt}}' < '" + todayDate + "'"
+    }
 
-        cdoReqData = requests.get(cdoReqUrl, params='limit=50000', headers=headers)
-        cdoReqDataCount = int(cdoReqData.json()['count'])
+    # Create the export, sync it and wait for the sync (raises when the sync does not go through)
+    cdoReqSyncInstanceUri = runBulkExport(
+        apiAccess,
+        '/customObjects/<customDataObjectId>/exports',
+        cdoData,
+        maxDelay=runSettings['syncMaxDelay'],
+        deadline=runSettings['syncDeadline']
+        )
+
+    # Using the Sync Instance URI, count the records from Eloqua API
+    if countOnly:
+        ticketActivityDataUpdated = getExportCount(apiAccess, cdoReqSyncInstanceUri)
+    else:
+        ticketActivityDataUpdated = 0
+        for element in iterExportRecords(apiAccess, cdoReqSyncInstanceUri, limit=runSettings['exportPageSize'], maxWorkers=runSettings['exportWorkers']):
+            ticketActivityDataUpdated = ticketActivityDataUpdated + 1
 
-        if cdoReqDataCount > 0:
-            cdoReqDataItems = cdoReqData.json()['items']
-        else:
-            cdoReqDataItems = []
-
-        for element in cdoReqDataItems:
-            elem = {}
-            elem['pk'] = element['pk']
-            elem['emailAddress'] = element['emailAddress'].lower()
-            elem['createDate'] = element['createDate']
-            elem['updateDate'] = element['updateDate']
-            ticketActivityDataUpdated.append(elem)
-        
-        cdoHasMore = cdoReqData.json()["hasMore"]
-      
-    print('Number of Ticket Activity Data Updated : {}'.format(len(ticketActivityDataUpdated)))
+    print('Number of Ticket Activity Data Updated : {}'.format(ticketActivityDataUpdated))
 
     ticketActivityIntegrationSummary = {}
-    ticketActivityIntegrationSummary['dataCreated'] = len(ticketActivityDataCreated)
-    ticketActivityIntegrationSummary['dataUpdated'] = len(ticketActivityDataUpdated)
+    ticketActivityIntegrationSummary['dataCreated'] = ticketActivityDataCreated
+    ticketActivityIntegrationSummary['dataUpdated'] = ticketActivityDataUpdated
 
     return ticketActivityIntegrationSummary
 
 
 
+#Process the Kore Ticket Activity files of the bucket that are new or changed since they were last processed
+def processTicketActivityFiles(apiAccess, contactIndex, runSettings, journal):
+
+    # Connect to the bucket
+    bucketInfo = getBucketInfo()
+    conn = boto.connect_s3(bucketInfo['accessKey'],
+                    bucketInfo['secretAccessKey'])
+    bucket = conn.get_bucket(bucketInfo['bucketName'], validate=False)
+    # go through the list of files
+    bucket_list = bucket.list(prefix=bucketInfo['prefix'])
+
+    # Only pick up the files that are new or changed since they were last processed
+    keyManifest = loadKeyManifest(runSettings['keyManifestPath'])
+    keyEntries = {}
+
+    keyStringArray = []
+    for l in bucket_list:
+        if 'ticketactivity' in str(l.key):
+            keyString = str(l.key)
+            keyEntry = getKeyEntry(l)
+            if isKeyProcessed(keyManifest, keyEntry):
+                print('Keystring already processed : {}'.format(str(keyString)))
+                continue
+            print('Keystring : {}'.format(str(keyString)))
+            keyStringArray.append(keyString)
+            keyEntries[keyString] = keyEntry
+
+    fileContext = {}
+    fileContext['apiAccess'] = apiAccess
+    fileContext['bucketInfo'] = bucketInfo
+    fileContext['contactIndex'] = contactIndex
+    fileContext['runSettings'] = runSettings
+    fileContext['journal'] = journal
+    fileContext['keyEntries'] = keyEntries
+
+    # One import definition for all the files (and retries) of the run
+    if runSettings['importEnabled']:
+        fileContext['importUri'] = getImportDefinitionUri(apiAccess, runSettings['importPath'], getTicketActivityImportDefinition())
+    else:
+        fileContext['importUri'] = None
+
+    # Files staged whole by an earlier attempt of the run only wait for the sync
+    pendingKeyStrings = keyStringArray
+    if fileContext['importUri'] is not None:
+        pendingKeyStrings = []
+        for keyString in keyStringArray:
+            if getFileOffset(journal, keyEntries[keyString])[1] == 'staged':
+                print('Keystring already staged : {}'.format(str(keyString)))
+            else:
+                pendingKeyStrings.append(keyString)
+
+    # Import requests in flight for the whole run (importWorkers), shared by the file workers of a process
+    # and split over the worker processes
+    fileContext['importWorkers'] = getFileImportWorkers(
+        runSettings['importWorkers'],
+        runSettings['fileWorkers'],
+        runSettings['fileWorkerProcesses'],
+        len(pendingKeyStrings)
+        )
+
+    # Without imports a file is done once parsed, with imports once the sync of the run took its rows in
+    fileDone = None
+    if fileContext['importUri'] is None:
+        fileDone = lambda keyString, fileResult: markKeyProcessed(runSettings['keyManifestPath'], keyManifest, keyEntries[keyString])
+
+    fileResults = processFilesConcurrently(
+        pendingKeyStrings,
+        processTicketActivityFile,
+        fileContext,
+        parallelism=runSettings['fileWorkers'],
+        useProcesses=runSettings['fileWorkerProcesses'],
+        fileDone=fileDone
+        )
+
+    # One sync of the import definition for the run, once every file is staged. When it fails the rows
+    # of the run are staged again by the next attempt; a sync ending with a warning only left out the
+    # rows Eloqua rejected, the files are done.
+    if fileContext['importUri'] is not None and keyStringArray:
+        syncResult = syncImportDefinition(apiAccess, fileContext['importUri'], maxDelay=runSettings['syncMaxDelay'], deadline=runSettings['syncDeadline'])
+        if not isSyncDone(syncResult):
+            for keyString in keyStringArray:
+                recordFileOffset(journal, keyEntries[keyString], 0, 'failed')
+            raise Exception('Import sync of the run finished with status {}'.format(syncResult['status']))
+
+        for keyString in keyStringArray:
+            recordFileOffset(journal, keyEntries[keyString], getFileOffset(journal, keyEntries[keyString])[0], 'synced')
+            markKeyProcessed(runSettings['keyManifestPath'], keyManifest, keyEntries[keyString])
+
+    return fileResults
+
+
+
 def startTicketActivityIntegration(clientName):
 
-    apiAccess = getEloquaAccess()
-    sitename = apiAccess['site']
-    headers = apiAccess['headers']
-    baseUrl = apiAccess['baseUrl']
+    runSettings = getRunSettings()
 
     successFlag = True
-    numOfRetries = 1
-    actualRetries = 1
 
     todayDate = datetime.datetime.today().strftime('%Y-%m-%d')
 
     print('\n')
     print('Started running {} - Ticket_Activity.py : {}'.format(clientName, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
 
-    while numOfRetries <= 5:
+    # Journal of today's run, every stage is retried after its own policy (stageRetries) and a run
+    # started again today resumes from the stages, files and import syncs recorded in it (the contact
+    # index of the run included, the staged rows of a file are counted against it)
+    journal = openRunJournal(runSettings['runJournalPath'], 'Ticket Activity ' + clientName, todayDate)
+    stageRetries = runSettings['stageRetries']
+
+    try:
+
+        # Cached access context, a retry only logs in again once the cached one has expired
+        apiAccess = runJournalStage(journal, 'access', getEloquaAccess, stageRetries['access'])
+        sitename = apiAccess['sitename']
+
+        print('Retrieving all Email Addresses ' + sitename + ' in Instance...')
+        contactIndex = runJournalStage(
+            journal,
+            'contacts',
+            lambda: getRunContactIndex(
+                journal,
+                apiAccess,
+                runSettings['emailCachePath'],
+                fullRefreshDays=runSettings['emailCacheFullRefreshDays'],
+                limit=runSettings['exportPageSize'],
+                maxWorkers=runSettings['exportWorkers'],
+                maxDelay=runSettings['syncMaxDelay'],
+                deadline=runSettings['syncDeadline'],
+                reuseMinutes=runSettings['emailIndexReuseMinutes'],
+                bloomBitsPerEmail=runSettings['contactBloomBits'],
+                exactCheck=runSettings['contactExactCheck']
+                ),
+            stageRetries['contacts']
+            )
 
-        print('Running script {} of 5 times...'.format(numOfRetries))
+        print('Number of Email Addresses : {}'.format(len(contactIndex['hashes'])))
 
-        try:
+        print('Processing KORE files for the ' + clientName)
 
-            print('Retrieving all Email Addresses ' + sitename + ' in Instance...')
-            reqExportData = json.dumps({
-                'name' : 'All Email Addresses',
-                'fields' : {
-                    'emailAddress' : '{{Contact.Field(C_EmailAddress)}}',
-                    },
-                })
+        # A retry only goes through the files not processed yet (key manifest) and the rows of a file not synced yet (journal)
+        fileResults = runJournalStage(
+            journal,
+            'files',
+            lambda: processTicketActivityFiles(apiAccess, contactIndex, runSettings, journal),
+            stageRetries['files']
+            )
 
-            reqExport = requests.post(baseUrl + '/api/bulk/2.0/contacts/exports', headers=headers, data=reqExportData)
+        print('Number of files processed : {}'.format(len(fileResults)))
+        print('Total number of records processed : {}'.format(sum(fileResult['records'] for fileResult in fileResults)))
+        print('Total number of records to import : {}'.format(sum(fileResult['matched'] for fileResult in fileResults)))
 
-            reqExportUri = reqExport.json()["uri"]
+        successFlag = True
 
-            # Setup sync instance 
-            reqSyncData = json.dumps({
-                'syncedInstanceUri' : reqExportUri}
-                )
+        ticketActivityIntegrationSummary = runJournalStage(
+            journal,
+            'summary',
+            lambda: getTicketActivityIntegrationSummary(apiAccess, runSettings['summaryCountOnly']),
+            stageRetries['summary'],
+            skipDone=True
+            )
+        ticketActivityDataCreated = ticketActivityIntegrationSummary['dataCreated']
+        ticketActivityDataUpdated = ticketActivityIntegrationSummary['dataUpdated']
+        writeToTicketSummaryTable(successFlag, clientName, ticketActivityDataCreated, ticketActivityDataUpdated)
 
-            # Sync the data retrieval
-            reqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=reqSyncData)
-
-            if reqSync.status_code == 201:
-                syncUri = reqSync.json()['uri']
-                sync(syncUri, reqSync, bulkUrl)
-            else: 
-                print('Failed to sync...')
-                #quit()
-
-            # Get the Sync Instance URI
-            reqSyncInstanceUri = reqSync.json()['syncedInstanceUri']
-
-            # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-            # Keep trying to retrieve the data until successful
-            reqDataUrl = baseUrl + '/api/bulk/2.0' + reqSyncInstanceUri + '/data'
-            count = 0
-            hasMore = 'False'
-
-            reqData = requests.get(reqDataUrl, params='limit=50000', headers=headers)
-
-            print('Retrieving first 50000 records...')
-            emailAddress = []
-            for element in reqData.json()['items']:
-                emailAddress.append(element['emailAddress'].lower())
-
-            hasMore = reqData.json()['hasMore']
-            offsetNum = 0
-
-            while hasMore is True:
-                offsetNum = offsetNum + 50000
-                print('Retrieving next {} records...'.format(offsetNum))
-                reqDataUrl = baseUrl + '/api/bulk/2.0' + reqSyncInstanceUri + '/data' + '?offset=%d' % offsetNum
-
-                reqData = requests.get(reqDataUrl, params='limit=50000', headers=headers)
-
-                for element in reqData.json()['items']:
-                    emailAddress.append(element['emailAddress'].lower())
-                
-                hasMore = reqData.json()['hasMore']
-              
-            print('Number of Email Addresses : {}'.format(len(emailAddress)))
-
-            print('Setting up Email Address Set...')
-            emailAddressSet = set(emailAddress)
-
-            print('Processing KORE files for the ' + clientName)
-
-            # Connect to the bucket
-            conn = boto.connect_s3(AWS_ACCESS_KEY_ID,
-                            AWS_SECRET_ACCESS_KEY)
-            bucket = conn.get_bucket(bucket_name, validate=False)
-            # go through the list of files
-            bucket_list = bucket.list(prefix=prefix)
-
-            keyStringArray = []
-            for l in bucket_list:
-                if 'ticketactivity' in str(l.key):
-                    keyString = str(l.key)
-                    print('Keystring : {}'.format(str(keyString)))
-                    keyStringArray.append(keyString)
-
-            fileNum = 1
-            for keyString in keyStringArray:
-                filename = keyString.split('/')[-1]
-                print('Filename : {}'.format(str(filename)))
-
-                key=bucket.get_key(keyString)
-                print('Key : {}'.format(str(key)))
-
-                url = conn.generate_url(
-                    60,
-                    'GET',
-                    bucket_name,
-                    keyString
-                    )
-
-                bucketData = urllib.request.urlopen(url)
-                contentOrig = []
-                for line in bucketData:
-                    contentOrig.append(line.decode('utf-8'))
-
-                print('Number of records to process : {}'.format(len(contentOrig)))
-
-                #continue 
-
-                exportData = []
-                counter = 0
-                fieldnameFlag = 0
-                for i in contentOrig:
-
-                    if counter == 0:
-                        counter = counter + 1
-                        continue
-
-                    contentSplit = i.split('|')
-                    try:
-                        elem = {}
-                        elem['pk'] = contentSplit[0]
-                        elem['acctId'] = contentSplit[1]
-                        elem['activityName'] = contentSplit[2]
-                        elem['addDatetime'] = contentSplit[3]
-                        elem['addUser'] = contentSplit[4]
-                        elem['assocAcctId'] = contentSplit[5]
-                        elem['assocCustNameId'] = contentSplit[6]
-                        elem['buyerEmailAddr'] = contentSplit[7]
-                        elem['eventDate'] = contentSplit[8]
-                        elem['eventId'] = contentSplit[9]
-                        elem['eventName'] = contentSplit[10]
-                        elem['eventTime'] = contentSplit[11]
-                        elem['exportDatetime'] = contentSplit[12]
-                        elem['forwardToEmailAddr'] = contentSplit[13]
-                        elem['inetTransactionAmount'] = contentSplit[14]
-                        elem['koreUpdated'] = contentSplit[15]
-                        elem['lastSeat'] = contentSplit[16]
-                        elem['name'] = contentSplit[17]
-                        elem['numSeats'] = contentSplit[18]
-                        elem['orderLineItem'] = contentSplit[19]
-                        elem['orderLineItemSeq'] = contentSplit[20]
-                        elem['orderNum'] = contentSplit[21]
-                        elem['origPurchasePrice'] = contentSplit[22]
-                        elem['planEventName'] = contentSplit[23]
-                        elem['rowName'] = contentSplit[24]
-                        elem['seatNum'] = contentSplit[25]
-                        elem['sectionName'] = contentSplit[26]
-                        elem['sellerEmailAddr'] = contentSplit[27]
-                        elem['tePostingPrice'] = contentSplit[28]
-                        elem['tePurchasePrice'] = contentSplit[29]
-                        elem['teSellerFees'] = contentSplit[30]
-                        elem['teamname'] = contentSplit[31]
-                        elem['tmEventName'] = contentSplit[32]
-                        elem['tmRowName'] = contentSplit[33]
-                        elem['tmSectionName'] = contentSplit[34]
-                        elem['seqId'] = contentSplit[35]
-                        elem['sortSeq'] = contentSplit[36].replace('\n','')
-                    except:
-                        continue
-
-                    if elem['buyerEmailAddr'].lower() in emailAddressSet:
-                        exportData.append(elem)
-
-                print('Number of records to import : {}'.format(len(exportData)))
-
-                fileNum = fileNum + 1
-                content_array = [exportData[x:x+10000] for x in xrange(0, len(exportData), 10000)]
-                importCounter = 1
-
-                print('Length of content_array : {}'.format(len(content_array)))
-
-                for i in content_array:
-
-                    importContents = []
-                    for j in i:
-                        tmp_contents = {
-                            "pk" : j['pk'],
-                            "acct_id" : j['acctId'],
-                            "activity_name" : j['activityName'],
-                            "add_datetime" : j['addDatetime'],
-                            "add_user" : j['addUser'],
-                            "assoc_acct_id" : j['assocAcctId'],
-                            "assoc_cust_name_id" : j['assocCustNameId'],
-                            "buyer_email_addr" : j['buyerEmailAddr'],
-                            "event_date" : j['eventDate'],
-                            "event_id" : j['eventId'],
-                            "event_name" : j['eventName'],
-                            "event_time" : j['eventTime'],
-                            "export_datetime" : j['exportDatetime'],
-                            "forard_to_email_addr" : j['forwardToEmailAddr'],
-                            "inet_transaction_amount" : j['inetTransactionAmount'],
-                            "kore_updated" : j['koreUpdated'],
-                            "last_seat" : j['lastSeat'],
-                            "name1" : j['name'],
-                            "num_seats" : j['numSeats'],
-                            "order_line_item" : j['orderLineItem'],
-                            "order_line_item_seq" : j['orderLineItemSeq'],
-                            "order_num" : j['orderNum'],
-                            "orig_purchase_price" : j['origPurchasePrice'],
-                            "plan_event_name" : j['planEventName'],
-                            "row_name" : j['rowName'],
-                            "seat_num" : j['seatNum'],
-                            "section_name" : j['sectionName'],
-                            "seller_email_addr" : j['sellerEmailAddr'],
-                            "te_posting_price" : j['tePostingPrice'],
-                            "te_purchase_price" : j['tePurchasePrice'],
-                            "te_seller_fees" : j['teSellerFees'],
-                            "teamname" : j['teamname'],
-                            "tm_event_name" : j['tmEventName'],
-                            "tm_row_name" : j['tmRowName'],
-                            "tm_section_name" : j['tmSectionName'],
-                            "seq_id" : j['seqId'],
-                            "sort_seq" : j['sortSeq']
-                            }
-
-                        importContents.append(tmp_contents)
-
-                    print('Import records into CDO {} of {}...'.format(importCounter, len(content_array)))
-                    print('Number of records to import: {}'.format(len(importContents)))
-
-                    data = {
-                        "name": "SYSTEM - KORE Tickets CDO Import",
-                        "fields": {
-                            "pk" : "{{CustomObject[14].Field[197]}}",
-                            "acct_id" : "{{CustomObject[14].Field[198]}}",
-                            "activity_name" : "{{CustomObject[14].Field[199]}}",
-                            "add_datetime" : "{{CustomObject[14].Field[200]}}",
-                            "add_user" : "{{CustomObject[14].Field[201]}}",
-                            "assoc_acct_id" : "{{CustomObject[14].Field[202]}}",
-                            "assoc_cust_name_id" : "{{CustomObject[14].Field[203]}}",
-                            "buyer_email_addr" : "{{CustomObject[14].Field[204]}}",
-                            "event_date" : "{{CustomObject[14].Field[205]}}",
-                            "event_id" : "{{CustomObject[14].Field[232]}}",
-                            "event_name" : "{{CustomObject[14].Field[233]}}",
-                            "event_time" : "{{CustomObject[14].Field[206]}}",
-                            "export_datetime" : "{{CustomObject[14].Field[207]}}",
-                            "forward_to_email_addr" : "{{CustomObject[14].Field[208]}}",
-                            "inet_transaction_amount" : "{{CustomObject[14].Field[209]}}",
-                            "kore_updated" : "{{CustomObject[14].Field[210]}}",
-                            "last_seat" : "{{CustomObject[14].Field[211]}}",
-                            "name1" : "{{CustomObject[14].Field[212]}}",
-                            "num_seats" : "{{CustomObject[14].Field[213]}}",
-                            "order_line_item" : "{{CustomObject[14].Field[214]}}",
-                            "order_line_item_seq" : "{{CustomObject[14].Field[215]}}",
-                            "order_num" : "{{CustomObject[14].Field[216]}}",
-                            "orig_purchase_price" : "{{CustomObject[14].Field[217]}}",
-                            "plan_event_name" : "{{CustomObject[14].Field[218]}}",
-                            "row_name" : "{{CustomObject[14].Field[219]}}",
-                            "seat_num" : "{{CustomObject[14].Field[220]}}",
-                            "section_name" : "{{CustomObject[14].Field[221]}}",
-                            "seller_email_addr" : "{{CustomObject[14].Field[222]}}",
-                            "te_posting_price" : "{{CustomObject[14].Field[223]}}",
-                            "te_purchase_price" : "{{CustomObject[14].Field[224]}}",
-                            "te_seller_fees" : "{{CustomObject[14].Field[225]}}",
-                            "teamname" : "{{CustomObject[14].Field[226]}}",
-                            "tm_event_name" : "{{CustomObject[14].Field[227]}}",
-                            "tm_row_name" : "{{CustomObject[14].Field[228]}}",
-                            "tm_section_name" : "{{CustomObject[14].Field[229]}}",
-                            "seq_id" : "{{CustomObject[14].Field[230]}}",
-                            "sort_seq" : "{{CustomObject[14].Field[231]}}",
-                            },
-                        "identifierFieldName" : "pk",
-                        "isSyncTriggeredOnImport" : "true",
-                        "mapDataCards" : "true",
-                        "mapDataCardsEntityType" : "Contact",
-                        "mapDataCardsSourceField": "buyer_email_addr",
-                        "mapDataCardsEntityField" : "{{Contact.Field(C_EmailAddress)}}",
-                        }
-
-                     # To String
-                    data = json.dumps(data)
-
-                    importAttempt = 1
-
-                    # NOTE - Uncomment the sections between the IMPORT lines to allow of import of Kore Membership file contents
-                    #        into Ticket Activity CDO
-                    # ########## IMPORT
-                    # while importAttempt < 6:
-                    #     print('Tickets_Daily Import Attempt ' + str(importAttempt) + ' of 5')
-                
-                    #     try:
-                    #         # Post to create Export
-                    #         r = requests.post(bulkUrl+'/customObjects/<customDataObjectId>/imports', data=data, headers=headers)
-                    #         importuri = r.json()['uri'] #retrieve uri of import
-
-                    #         # Push data to staging area
-                    #         import_contents = json.dumps(importContents)
-                    #         importResponse = requests.post(bulkUrl+importuri+'/data', data=import_contents, headers=headers)
-
-                    #         #Execute Sync with import uri
-                    #         data2 = {
-                    #           'syncedInstanceUri' : importuri
-                    #         }
-                    #         data2 = json.dumps(data2)
-
-                    #         r = requests.post(bulkUrl+'/syncs', data=data2, headers=headers)
-
-                    #         importAttempt = 7
-
-                    #         print('Import Successful.')
-                    #     except:
-                    #         print('Import Unsuccessful.')
-                    #         importAttempt = importAttempt + 1
-                    #         time.sleep(60)
-                    # importCounter += 1
-                    # ########## IMPORT
-
-            ticketIntegrationSummary = getTicketIntegrationSummary()
-
-            successFlag = True
-
-            ticketActivityIntegrationSummary = getTicketActivityIntegrationSummary()
-            ticketActivityDataCreated = ticketActivityIntegrationSummary['dataCreated']
-            ticketActivityDataUpdated = ticketActivityIntegrationSummary['dataUpdated']
-            writeToTicketSummaryTable(successFlag, clientName, ticketActivityDataCreated, ticketActivityDataUpdated)
-
-            numOfRetries = 7
-
-        except Exception as e:
-
-            print(e)
-            print('Failed to run.')
-
-            numOfRetries += 1
-            actualRetries += 1
-
-            successFlag = False            
-            writeToTicketSummaryTable(successFlag, clientName, '0', '0')
-
-            time.sleep(300)
+    except Exception as e:
+
+        print(e)
+        print('Failed to run.')
+
+        successFlag = False
+        writeToTicketSummaryTable(successFlag, clientName, '0', '0')
 
     return successFlag
 
 
 
-def writeToTicketSummaryTable(sFlag, clientName, dataCreated, dataUpdated)
+def writeToTicketSummaryTable(sFlag, clientName, dataCreated, dataUpdated):
 
     db = pyodbc.connect(driver='{ODBC Driver 17 for SQL Server}',server='',database='', uid='', pwd='')
 
@@ -673,7 +669,7 @@ def writeToTicketSummaryTable(sFlag, clientName, dataCreated, dataUpdated)
             insert into <clientName>_Ticket_Activity_Summary values (
                 convert(datetime, '{}', 120), 'Success', {}, {}, 0
             )
-            """.format(todayDatetime, len(dataCreated), len(dataUpdated))
+            """.format(todayDatetime, dataCreated, dataUpdated)
         c.execute(sqlStmt)
 
     else:
@@ -804,8 +800,8 @@ def sendNotificationEmal(sFlag, clientName, dataCreated, dataUpdated):
                             <p>
                             This is to inform the recipient(s) that the """ + clientName + """ - KORE Integration for Ticket Activity has successfully executed for """ + todayDate + """.
                             <br><br>
-                            Records created: """ + str(len(dataCreated)) + """<br>
-                            Records updated: """ + str(len(dataUpdated)) + """<br>
+                            Records created: """ + str(dataCreated) + """<br>
+                            Records updated: """ + str(dataUpdated) + """<br>
                             </p>
                           </td>
                         </tr>
@@ -833,7 +829,7 @@ def sendNotificationEmal(sFlag, clientName, dataCreated, dataUpdated):
         MAILGUN_API_KEY = ''
         MAILGUN_DOMAIN_NAME = ''
 
-        requests.post(
+        getHttpSession().post(
             MAILGUN_DOMAIN_NAME,
             auth=("api", MAILGUN_API_KEY),
             data={"from": "Example Name <example@test.com>",
@@ -945,7 +941,7 @@ def sendNotificationEmal(sFlag, clientName, dataCreated, dataUpdated):
                           <td class='inner contents' style='padding-left:30px;padding-right:30px;padding-top:10px;padding-bottom:10px;font-family:Avenir TT Book, Arial, Helvetica, sans-serif;font-size:16px;color:#000000;width:100%;text-align:left;'>
                             
                             <p>
-                            This is to inform the recipient(s) that the """ + cilientName + """ - KORE Integration - Ticket Activity Process has exceeded the 
+                            This is to inform the recipient(s) that the """ + clientName + """ - KORE Integration - Ticket Activity Process has exceeded the 
                             max number of retries and failed to execute for """ + todayDate + """.
                             </p>
                           </td>
@@ -974,7 +970,7 @@ def sendNotificationEmal(sFlag, clientName, dataCreated, dataUpdated):
         MAILGUN_API_KEY = ''
         MAILGUN_DOMAIN_NAME = ''
 
-        requests.post(
+        getHttpSession().post(
             MAILGUN_DOMAIN_NAME,
             auth=("api", MAILGUN_API_KEY),
             data={"from": "Example Name <example@test.com>",
@@ -11,6 +11,36 @@
 # UPDATES
 #
 #
+# Version 1.5:
+# - replaced the recursive sync() polling with waitForSync (exponential backoff with jitter and an overall deadline)
+# - contact email export pages are now downloaded concurrently (iterExportPages)
+# - the contact email set and the summary counts are built while streaming the export pages (iterExportRecords)
+# - the integration summary reads the created/updated counts from totalResults instead of downloading every row (countOnly)
+# - the integration summary exports are created, synced and checked by runBulkExport
+# - contact email addresses are cached on disk and refreshed with the contacts modified since the last run
+# - all Eloqua, S3 and Mailgun calls go through one shared keep-alive HTTP session (getHttpSession)
+# - the Eloqua base url and auth headers are cached (getEloquaAccessContext) and passed to every stage, bulkUrl/restUrl come from it
+# - Kore files are streamed from S3 line by line and parsed rows go straight to the import batches (iterUrlLines, iterBatches)
+# - the Kore files of a run are processed in parallel over a pool of worker processes (processFilesConcurrently)
+# - processed S3 keys are recorded in a manifest, only new or changed Kore files are picked up (and a retry resumes)
+# - the file layout is declared once (get*Schema), the row parser is built from it and yields the import records
+#   directly, the import definition fields come from the same schema
+# - large Kore files can be parsed column-wise a chunk of lines at a time (columnarParsing, iterColumnarRows)
+# - Kore files can be staged on local disk and parsed through mmap, only matching rows are decoded (stageFiles)
+# - staged files are checked against a hashed contact index (optionally behind a Bloom filter) on the raw email column
+# - the contact email set is replaced by the compact contact index of getContactEmailIndex (sorted 64-bit hashes),
+#   shared by the runs within emailIndexReuseMinutes
+# - download, parse/batching and import of a file run as pipeline stages connected by bounded queues (iterPipelined)
+# - the import block is replaced by the import uploader, several batches are uploaded at once behind an adaptive
+#   throttle (429 rate limits) and every sync is followed to completion (importEnabled, importWorkers)
+# - one import definition per run (looked up by name or created), the file workers only stage batches into it and
+#   the run syncs it once, after every file is staged
+# - import batches are sized by serialized bytes, adapted to the upload latency and errors (getBatchSizer)
+# - the whole run retried 5 times with 5 minute sleeps is replaced by stages retried after their own policy
+#   (stageRetries) and a run journal (runJournalPath), a retry resumes after the files processed and the rows
+#   of a file already staged instead of starting over; every attempt of a run matches the files against the same
+#   contact index (getRunContactIndex) and the summary stage is not run again once done
+#
 # Version 1.4:
 # - updated to Python3 syntax
 #
@@ -31,35 +61,11 @@ import boto
 from boto.s3.connection import S3Connection
 import sys, os
 from boto.s3.key import Key
-import urllib.request
 import csv
 import codecs
-import requests
-import json
-import base64
-import time
 import datetime
 import pyodbc
-
-
-
-#Sync function for retreiving exports/imports from Eloqua
-def sync(uri, response, base_url):
-    if response.json()['status'] == 'pending':
-        syncrequest = requests.get(base_url + '/api/bulk/2.0' + uri, headers=headers)
-        if syncrequest.json()['status'] == 'success':
-            return True
-        elif syncrequest.json()['status'] == 'pending':
-            print('Sync Pending')
-            sync(uri, response, base_url)
-        elif syncrequest.json()['status'] == 'active':
-            print('Sync Churning')
-            sync(uri, response, base_url)
-        elif syncrequest.json()['status'] == 'warning' or 'error':
-            print((requests.get(base_url + '/api/bulk/2.0' + uri + '/logs', headers=headers)).json())
-        else:
-            print(syncrequest.json())
-            print('Sync Failed')
+from Kore_Integration_Utils import runBulkExport, iterExportRecords, getExportCount, getRunContactIndex, getHttpSession, getEloquaAccessContext, iterUrlLines, iterSizedBatches, getBatchSizer, processFilesConcurrently, loadKeyManifest, getKeyEntry, isKeyProcessed, markKeyProcessed, compileRowParser, getImportFields, iterColumnarRows, stageUrlToFile, iterStagedRows, iterPipelined, getImportDefinitionUri, startImportUploader, getFileImportWorkers, submitImportBatch, finishImportUploader, syncImportDefinition, isSyncDone, openRunJournal, runJournalStage, getFileOffset, recordFileOffset, iterResumedBatches
 
 
 
@@ -70,26 +76,10 @@ def getEloquaAccess():
     username = ''
     pw = ''
 
-    # Set up authentication encoding  
-    key = site+'\\'+username+':'+pw
-    authKey = base64.b64encode(site + '\\' + username + ':' + pw)
+    # Base URL and headers are looked up once and cached for ACCESS_TTL seconds
+    ACCESS_TTL = 3600
 
-    # Key and JSON signals to Eloqua
-    headers = {
-        "Authorization": "Basic " + authKey.strip(),
-        "content-type":"application/json",
-        "Accept":"application/json; encoding='utf8'"
-    }
-
-    r = requests.get('https://login.eloqua.com/id', headers=headers)
-    baseUrl = r.json()['urls']['base']
-
-    apiAccess = {}
-    apiAccess['sitename'] = site
-    apiAccess['headers'] = headers
-    apiAccess['baseUrl'] = baseUrl
-    
-    return apiAccess
+    return getEloquaAccessContext(site, username, pw, ttl=ACCESS_TTL)
 
 
 
@@ -113,645 +103,590 @@ def getBucketInfo():
 
 
 
-def getTicketIntegrationSummary():                
+def getRunSettings():
+
+    # Polling of Eloqua syncs, delays and deadline are in seconds
+    SYNC_MAX_DELAY = 60
+    SYNC_DEADLINE = 3600
+
+    # Bulk export paging, number of records per page and pages downloaded at the same time
+    EXPORT_PAGE_SIZE = 50000
+    EXPORT_WORKERS = 4
+
+    # Integration summary only reads the record counts of the CDO exports (no paging through the data)
+    SUMMARY_COUNT_ONLY = True
+
+    # Import the parsed rows into the CDO (IMPORT_PATH relative to the bulk API), IMPORT_WORKERS batches at a time
+    # for the whole run, whatever the number of FILE_WORKERS
+    IMPORT_ENABLED = False
+    IMPORT_PATH = '/customObjects/<customDataObjectId>/imports'
+    IMPORT_WORKERS = 4
+
+    # Import batches are cut by serialized size, starting at IMPORT_BATCH_BYTES and adapted between IMPORT_BATCH_MIN_BYTES
+    # and IMPORT_BATCH_MAX_BYTES so that an upload takes about IMPORT_BATCH_SECONDS; at most IMPORT_BATCH_SIZE rows per batch
+    IMPORT_BATCH_BYTES = 4194304
+    IMPORT_BATCH_MIN_BYTES = 262144
+    IMPORT_BATCH_MAX_BYTES = 20971520
+    IMPORT_BATCH_SECONDS = 10
+    IMPORT_BATCH_SIZE = 50000
+
+    # Download, parse/batching and import of a file run as pipeline stages (iterPipelined), each stage runs at most
+    # PIPELINE_QUEUE_SIZE chunks (of PIPELINE_LINE_CHUNK lines for the download) ahead of the next one
+    PIPELINE_QUEUE_SIZE = 4
+    PIPELINE_LINE_CHUNK = 10000
+
+    # Parse the Kore files a chunk of COLUMNAR_CHUNK_ROWS lines at a time (iterColumnarRows) instead of line by line
+    COLUMNAR_PARSING = True
+    COLUMNAR_CHUNK_ROWS = 20000
+
+    # Download each Kore file once into STAGING_DIR and parse it from there (iterStagedRows) instead of streaming it;
+    # parsing then only starts once the whole file is on disk
+    STAGE_FILES = False
+    STAGING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'staging', 'tickets')
+
+    # Number of Kore files processed at the same time, in worker processes (or threads when False)
+    FILE_WORKERS = 4
+    FILE_WORKER_PROCESSES = True
+
+    # Manifest of the Kore files (S3 keys) already processed
+    KEY_MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'tickets_key_manifest.json')
+
+    # Journal of the runs (SQLite, shared by the Kore templates), a run started again on the same day resumes from it
+    RUN_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'kore_run_journal.db')
+
+    # Retry policy of each stage of a run: attempts, seconds before the first retry and longest wait (doubled per retry)
+    STAGE_RETRIES = {
+        'access' : {'attempts' : 5, 'delay' : 30, 'maxDelay' : 300},
+        'contacts' : {'attempts' : 3, 'delay' : 60, 'maxDelay' : 300},
+        'files' : {'attempts' : 5, 'delay' : 10, 'maxDelay' : 300},
+        'summary' : {'attempts' : 3, 'delay' : 30, 'maxDelay' : 300},
+        }
+
+    # Local cache of the contact email addresses (one per Eloqua site, the site name is added to EMAIL_CACHE_PATH),
+    # fully re-exported every EMAIL_CACHE_FULL_REFRESH_DAYS
+    EMAIL_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'contact_emails.db')
+    EMAIL_CACHE_FULL_REFRESH_DAYS = 7
+
+    # Contact index (sorted email hashes) saved with the cache, reused as is by runs within EMAIL_INDEX_REUSE_MINUTES
+    # of the last export; Bloom filter bits per contact in front of it (0 for none); confirm matches against the cache
+    EMAIL_INDEX_REUSE_MINUTES = 30
+    CONTACT_BLOOM_BITS = 0
+    CONTACT_EXACT_CHECK = False
+
+    runSettings = {}
+    runSettings['syncMaxDelay'] = SYNC_MAX_DELAY
+    runSettings['syncDeadline'] = SYNC_DEADLINE
+    runSettings['exportPageSize'] = EXPORT_PAGE_SIZE
+    runSettings['exportWorkers'] = EXPORT_WORKERS
+    runSettings['summaryCountOnly'] = SUMMARY_COUNT_ONLY
+    runSettings['importEnabled'] = IMPORT_ENABLED
+    runSettings['importPath'] = IMPORT_PATH
+    runSettings['importWorkers'] = IMPORT_WORKERS
+    runSettings['importBatchSize'] = IMPORT_BATCH_SIZE
+    runSettings['importBatchBytes'] = IMPORT_BATCH_BYTES
+    runSettings['importBatchMinBytes'] = IMPORT_BATCH_MIN_BYTES
+    runSettings['importBatchMaxBytes'] = IMPORT_BATCH_MAX_BYTES
+    runSettings['importBatchSeconds'] = IMPORT_BATCH_SECONDS
+    runSettings['pipelineQueueSize'] = PIPELINE_QUEUE_SIZE
+    runSettings['pipelineLineChunk'] = PIPELINE_LINE_CHUNK
+    runSettings['columnarParsing'] = COLUMNAR_PARSING
+    runSettings['columnarChunkRows'] = COLUMNAR_CHUNK_ROWS
+    runSettings['stageFiles'] = STAGE_FILES
+    runSettings['stagingDir'] = STAGING_DIR
+    runSettings['fileWorkers'] = FILE_WORKERS
+    runSettings['fileWorkerProcesses'] = FILE_WORKER_PROCESSES
+    runSettings['keyManifestPath'] = KEY_MANIFEST_PATH
+    runSettings['runJournalPath'] = RUN_JOURNAL_PATH
+    runSettings['stageRetries'] = STAGE_RETRIES
+    runSettings['emailCachePath'] = EMAIL_CACHE_PATH
+    runSettings['emailCacheFullRefreshDays'] = EMAIL_CACHE_FULL_REFRESH_DAYS
+    runSettings['emailIndexReuseMinutes'] = EMAIL_INDEX_REUSE_MINUTES
+    runSettings['contactBloomBits'] = CONTACT_BLOOM_BITS
+    runSettings['contactExactCheck'] = CONTACT_EXACT_CHECK
+
+    return runSettings
+
+
+
+#Layout of the Kore Tickets file: CDO import field name, column in the file and Eloqua CDO field
+#
+# The row parser (compileRowParser) and the fields of the import definition are both built from it.
+def getTicketSchema():
+
+    TICKET_FIELDS = [
+        ('pk', 0, '{{CustomObject[15].Field[234]}}'),
+        ('email_addr', 1, '{{CustomObject[15].Field[235]}}'),
+        ('seatgroup', 2, '{{CustomObject[15].Field[236]}}'),
+        ('acct_id', 3, '{{CustomObject[15].Field[237]}}'),
+        ('season_name', 4, '{{CustomObject[15].Field[238]}}'),
+        ('event_id', 5, '{{CustomObject[15].Field[239]}}'),
+        ('tm_event_name', 6, '{{CustomObject[15].Field[240]}}'),
+        ('event_name', 7, '{{CustomObject[15].Field[241]}}'),
+        ('event_name_long', 8, '{{CustomObject[15].Field[301]}}'),
+        ('section_name', 9, '{{CustomObject[15].Field[242]}}'),
+        ('row_name', 10, '{{CustomObject[15].Field[243]}}'),
+        ('price_code', 11, '{{CustomObject[15].Field[244]}}'),
+        ('purchase_price', 12, '{{CustomObject[15].Field[245]}}'),
+        ('percent_paid', 13, '{{CustomObject[15].Field[246]}}'),
+        ('name', 14, '{{CustomObject[15].Field[247]}}'),
+        ('ticket_status', 15, '{{CustomObject[15].Field[248]}}'),
+        ('group_flag', 16, '{{CustomObject[15].Field[249]}}'),
+        ('acct_rep_full_name', 17, '{{CustomObject[15].Field[250]}}'),
+        ('add_datetime', 18, '{{CustomObject[15].Field[251]}}'),
+        ('seat_increment', 19, '{{CustomObject[15].Field[252]}}'),
+        ('total_events', 20, '{{CustomObject[15].Field[253]}}'),
+        ('add_usr', 21, '{{CustomObject[15].Field[254]}}'),
+        ('upd_datetime', 22, '{{CustomObject[15].Field[255]}}'),
+        ('order_num', 23, '{{CustomObject[15].Field[256]}}'),
+        ('order_line_item', 24, '{{CustomObject[15].Field[257]}}'),
+        ('order_line_item_seq', 25, '{{CustomObject[15].Field[258]}}'),
+        ('sales_source_name', 26, '{{CustomObject[15].Field[259]}}'),
+        ('name_last_first_mi', 27, '{{CustomObject[15].Field[260]}}'),
+        ('season_year', 28, '{{CustomObject[15].Field[261]}}'),
+        ('comp_name', 29, '{{CustomObject[15].Field[262]}}'),
+        ('kore_updated', 30, '{{CustomObject[15].Field[263]}}'),
+        ('full_price', 31, '{{CustomObject[15].Field[264]}}'),
+        ('printed_price', 32, '{{CustomObject[15].Field[265]}}'),
+        ('seat_num', 33, '{{CustomObject[15].Field[266]}}'),
+        ('last_seat', 34, '{{CustomObject[15].Field[267]}}'),
+        ('num_seats', 35, '{{CustomObject[15].Field[268]}}'),
+        ('seats', 36, '{{CustomObject[15].Field[269]}}'),
+        ('block_purchase_price', 37, '{{CustomObject[15].Field[270]}}'),
+        ('owed_amount', 38, '{{CustomObject[15].Field[271]}}'),
+        ('paid_amount', 39, '{{CustomObject[15].Field[272]}}'),
+        ('source', 40, '{{CustomObject[15].Field[273]}}'),
+        ('plan_event_name', 41, '{{CustomObject[15].Field[274]}}'),
+        ('price_code_group', 42, '{{CustomObject[15].Field[275]}}'),
+        ('event_type_code', 43, '{{CustomObject[15].Field[276]}}'),
+        ('acct_rep_id', 44, '{{CustomObject[15].Field[277]}}'),
+        ('acct_type_desc', 45, '{{CustomObject[15].Field[278]}}'),
+        ('other_info_1', 46, '{{CustomObject[15].Field[279]}}'),
+        ('other_info_2', 47, '{{CustomObject[15].Field[280]}}'),
+        ('other_info_3', 48, '{{CustomObject[15].Field[281]}}'),
+        ('other_info_4', 49, '{{CustomObject[15].Field[282]}}'),
+        ('other_info_5', 50, '{{CustomObject[15].Field[283]}}'),
+        ('other_info_6', 51, '{{CustomObject[15].Field[284]}}'),
+        ('other_info_7', 52, '{{CustomObject[15].Field[285]}}'),
+        ('other_info_8', 53, '{{CustomObject[15].Field[286]}}'),
+        ('other_info_9', 54, '{{CustomObject[15].Field[287]}}'),
+        ('other_info_10', 55, '{{CustomObject[15].Field[288]}}'),
+        ('ticket_type_category', 56, '{{CustomObject[15].Field[289]}}'),
+        ('database_id', 57, '{{CustomObject[15].Field[290]}}'),
+        ('ledger_code', 58, '{{CustomObject[15].Field[291]}}'),
+        ('season_id', 59, '{{CustomObject[15].Field[292]}}'),
+        ('team', 60, '{{CustomObject[15].Field[293]}}'),
+        ('event_time', 61, '{{CustomObject[15].Field[294]}}'),
+        ('class_name', 62, '{{CustomObject[15].Field[295]}}'),
+        ('pc_ticket', 63, '{{CustomObject[15].Field[296]}}'),
+        ('pc_tax', 64, '{{CustomObject[15].Field[297]}}'),
+        ('pc_licfee', 65, '{{CustomObject[15].Field[298]}}'),
+        ('ticket_type', 66, '{{CustomObject[15].Field[299]}}'),
+        ('ticket_type_code', 67, '{{CustomObject[15].Field[300]}}')
+        ]
+
+    ticketSchema = {}
+    ticketSchema['name'] = 'tickets'
+    ticketSchema['fields'] = TICKET_FIELDS
+    ticketSchema['emailField'] = 'email_addr'
+
+    return ticketSchema
+
+
+
+#Parse the lines of a Kore Tickets file, yields the rows belonging to Eloqua contacts
+#
+# Built from getTicketSchema (compileRowParser), counts of parsed and matching rows are kept in fileStats.
+parseTicketRows = compileRowParser(getTicketSchema())
 
-    apiAccess = getEloquaAccess()
-    sitename = apiAccess['site']
-    headers = apiAccess['headers']
-    baseUrl = apiAccess['baseUrl']
 
-    print('Retrieving Tickets CDO Data Created Today...')
 
-    cdoData = json.dumps({
-        "name" : "Retrieve SYSTEM - KORE Tickets CDO Data Created Today",
-        "fields" : {
-            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
-            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
-        },
-        "filter" : "'{{CustomObject[<customDataObjectId>].CreatedAt}}' >= '" + todayDate + "'"
-    })
+#Bulk import definition of the Tickets CDO, looked up (or created) once per run by getImportDefinitionUri
+def getTicketImportDefinition():
 
-    cdoUrl = baseUrl + '/api/bulk/2.0/customObjects/<customDataObjectId>/exports'
-    cdoReqExport = requests.post(cdoUrl, headers=headers, data=cdoData)
+    ticketSchema = getTicketSchema()
 
-    cdoExportUri = cdoReqExport.json()["uri"]
+    importDefinition = {
+        "name": "SYSTEM - KORE Tickets CDO Import",
+        "fields": getImportFields(ticketSchema),
+        "identifierFieldName" : "pk",
+        "isSyncTriggeredOnImport" : "false",
+        "mapDataCards" : "true",
+        "mapDataCardsEntityType" : "Contact",
+        "mapDataCardsSourceField": ticketSchema['emailField'],
+        "mapDataCardsEntityField" : "{{Contact.Field(C_EmailAddress)}}",
+        }
 
-    # Setup sync instance 
-    cdoReqExportSyncData = json.dumps({
-        "syncedInstanceUri" : cdoExportUri}
-    )
+    return importDefinition
 
-    # Sync the data retrieval
-    cdoReqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=cdoReqExportSyncData)
 
-    if cdoReqSync.status_code == 201:
-        cdoSyncUri = cdoReqSync.json()['uri']
-        sync(cdoSyncUri, cdoReqSync, bulkUrl)
-    else: 
-        print('cdoReqSync status code failed to process...')
-        #quit()
 
-    # Get the Sync Instance URI
-    cdoReqSyncInstanceUri = cdoReqSync.json()['syncedInstanceUri']
+#Download, parse and import a single Kore Tickets file
+#
+# Runs in a worker of processFilesConcurrently, fileContext holds the access context, bucket info,
+# contact index and run settings. Returns the counts of the file.
+def processTicketFile(fileContext, keyString):
+
+    apiAccess = fileContext['apiAccess']
+    bucketInfo = fileContext['bucketInfo']
+    contactIndex = fileContext['contactIndex']
+    runSettings = fileContext['runSettings']
+    ticketSchema = getTicketSchema()
+
+    filename = keyString.split('/')[-1]
+    print('Filename : {}'.format(str(filename)))
+
+    # Each file (worker) uses its own S3 connection
+    conn = boto.connect_s3(bucketInfo['accessKey'],
+                    bucketInfo['secretAccessKey'])
+
+    url = conn.generate_url(
+        60,
+        'GET',
+        bucketInfo['bucketName'],
+        keyString
+        )
+
+    # The staged file is removed once the file is done or failed, whatever step it failed at
+    stagedPath = None
+    try:
+        # Stage the file locally or stream it, rows are parsed and filtered as the lines come in
+        fileStats = {'records' : 0, 'matched' : 0}
+        if runSettings['stageFiles']:
+            stagedPath = stageUrlToFile(url, runSettings['stagingDir'], filename)
+            exportRows = iterStagedRows(stagedPath, ticketSchema, contactIndex, fileStats, runSettings['columnarChunkRows'], keepFile=True)
+        else:
+            # Download stage, the lines are read ahead of the parser in chunks of pipelineLineChunk
+            contentLines = iterPipelined(iterUrlLines(url), runSettings['pipelineQueueSize'], runSettings['pipelineLineChunk'])
+            if runSettings['columnarParsing']:
+                exportRows = iterColumnarRows(contentLines, ticketSchema, contactIndex, fileStats, runSettings['columnarChunkRows'])
+            else:
+                exportRows = parseTicketRows(contentLines, contactIndex, fileStats)
+
+        # Parse and batching stage, the next import batches are prepared while the current one is imported
+        batchSizer = getBatchSizer(
+            initialBytes=runSettings['importBatchBytes'],
+            minBytes=runSettings['importBatchMinBytes'],
+            maxBytes=runSettings['importBatchMaxBytes'],
+            maxRows=runSettings['importBatchSize'],
+            targetSeconds=runSettings['importBatchSeconds']
+            )
+        importBatches = iterPipelined(iterSizedBatches(exportRows, batchSizer), runSettings['pipelineQueueSize'])
+
+        # NOTE - set IMPORT_ENABLED (getRunSettings) to import the Kore Tickets file contents into the CDO,
+        #        batches are staged importWorkers at a time while the file is still being parsed, less the
+        #        rows of the file staged by an earlier attempt of the run (journal); the run syncs them once
+        journal = fileContext['journal']
+        keyEntry = fileContext['keyEntries'][keyString]
+        uploader = None
+        resumeOffset = 0
+        if fileContext['importUri'] is not None:
+            resumeOffset = getFileOffset(journal, keyEntry)[0]
+            if resumeOffset:
+                print('Resuming {} after the {} rows already staged'.format(keyString, resumeOffset))
+            uploader = startImportUploader(
+                apiAccess,
+                fileContext['importUri'],
+                maxWorkers=fileContext['importWorkers'],
+                maxDelay=runSettings['syncMaxDelay'],
+                deadline=runSettings['syncDeadline'],
+                batchSizer=batchSizer,
+                rowOffset=resumeOffset,
+                stagedDone=lambda rowsStaged: recordFileOffset(journal, keyEntry, rowsStaged)
+                )
 
-    # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-    # Keep trying to retrieve the data until successful
-    cdoCount = 0
-    cdoHasMore = 'False'
+        importCounter = 1
+        rowOffset = 0
 
-    cdoReqData = requests.get(baseUrl + '/api/bulk/2.0' + cdoReqSyncInstanceUri + '/data', params='limit=50000', headers=headers)
-    #parsedResponse = r.json()
-    cdoReqDataCount = int(cdoReqData.json()['count'])
+        # Rows come out of the parser as import records already, less the rows staged before
+        for i, importContents in iterResumedBatches(importBatches, resumeOffset):
 
-    print('Retrieving first 50000 CDO records...')
-    ticketDataCreated = []
+            rowOffset += len(i)
 
-    if cdoReqDataCount > 0:
-        cdoReqDataItems = cdoReqData.json()['items']
-    else:
-        cdoReqDataItems = []
-
-    for element in cdoReqDataItems:
-        elem = {}
-        elem['pk'] = element['pk']
-        elem['emailAddress'] = element['emailAddress'].lower()
-        elem['createDate'] = element['createDate']
-        elem['updateDate'] = element['updateDate']
-        ticketDataCreated.append(elem)
-
-    cdoHasMore = cdoReqData.json()["hasMore"]
-    cdoOffsetNum = 0
-    #orig_url = url
-
-    while cdoHasMore is True:
-        cdoOffsetNum = cdoOffsetNum + 50000
-        print('Retrieving next {} CDO records...'.format(cdoOffsetNum))
-        cdoReqUrl = bulkUrl + cdoReqSyncInstanceUri + '/data' + '?offset=%d' % cdoOffsetNum
-
-        cdoReqData = requests.get(cdoReqUrl, params='limit=50000', headers=headers)
-        cdoReqDataCount = int(cdoReqData.json()['count'])
-
-        if cdoReqDataCount > 0:
-            cdoReqDataItems = cdoReqData.json()['items']
-        else:
-            cdoReqDataItems = []
-
-        for element in cdoReqDataItems:
-            elem = {}
-            elem['pk'] = element['pk']
-            elem['emailAddress'] = element['emailAddress'].lower()
-            elem['createDate'] = element['createDate']
-            elem['updateDate'] = element['updateDate']
-            ticketDataCreated.append(elem)
-        
-        cdoHasMore = cdoReqData.json()["hasMore"]
-      
-    print('Number of Ticket Data Created : {}'.format(len(ticketDataCreated)))
+            if not importContents:
+                print('Import batch {} already staged, skipping...'.format(importCounter))
+                importCounter += 1
+                continue
 
-    print('Retrieving Tickets CDO Data Updated Today...')
+            print('Import records into CDO batch {}...'.format(importCounter))
+            print('Number of records to import: {}'.format(len(importContents)))
 
-    cdoData = json.dumps({
-        "name" : "Retrieve SYSTEM - KORE Tickets CDO Data Updated Today",
-        "fields" : {
-            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
-            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
-            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
-        },
-        "filter" : "'{{CustomObject[<customDataObjectId>].UpdatedAt}}' >= '" + todayDate + "' AND '{{CustomObject[<customDataObjectId>].CreatedAt}}' < '" + todayDate + "'"
-    })
+            if uploader is not None:
+                submitImportBatch(uploader, importCounter, importContents)
+            importCounter += 1
+
+        if uploader is not None:
+            importResult = finishImportUploader(uploader, sync=False)
+            print('Import batches staged : {}'.format(len(importResult['batches'])))
+            recordFileOffset(journal, keyEntry, rowOffset, 'staged')
+
+        print('Number of records processed : {}'.format(fileStats['records']))
+        print('Number of records to import : {}'.format(fileStats['matched']))
+
+        fileStats['keyString'] = keyString
 
-    cdoUrl = baseUrl + '/api/bulk/2.0/customObjects/<customDataObjectId>/exports'
-    cdoReqExport = requests.post(cdoUrl, headers=headers, data=cdoData)
+        return fileStats
 
-    cdoExportUri = cdoReqExport.json()["uri"]
+    finally:
+        if stagedPath is not None and os.path.exists(stagedPath):
+            os.remove(stagedPath)
 
-    # Setup sync instance 
-    cdoReqExportSyncData = json.dumps({
-        "syncedInstanceUri" : cdoExportUri}
-    )
 
-    # Sync the data retrieval
-    cdoReqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=cdoReqExportSyncData)
 
-    if cdoReqSync.status_code == 201:
-        cdoSyncUri = cdoReqSync.json()['uri']
-        sync(cdoSyncUri, cdoReqSync, bulkUrl)
-    else: 
-        print 'cdoReqSync status code failed to process...'
-        #quit()
+def getTicketIntegrationSummary(apiAccess, countOnly=True):                
 
-    # Get the Sync Instance URI
-    cdoReqSyncInstanceUri = cdoReqSync.json()["syncedInstanceUri"]
+    runSettings = getRunSettings()
 
-    # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-    # Keep trying to retrieve the data until successful
-    cdoCount = 0
-    cdoHasMore = "False"
+    todayDate = datetime.datetime.today().strftime('%Y-%m-%d')
 
-    cdoReqData = requests.get(baseUrl + '/api/bulk/2.0' + cdoReqSyncInstanceUri + '/data', params='limit=50000', headers=headers)
-    cdoReqDataCount = int(cdoReqData.json()['count'])
+    print('Retrieving Tickets CDO Data Created Today...')
 
-    print('Retrieving first 50000 CDO records...')
-    ticketDataUpdated = []
+    cdoData = {
+        "name" : "Retrieve SYSTEM - KORE Tickets CDO Data Created Today",
+        "fields" : {
+            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
+            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
+        },
+        "filter" : "'{{CustomObject[<customDataObjectId>].CreatedAt}}' >= '" + todayDate + "'"
+    }
 
-    if cdoReqDataCount > 0:
-        cdoReqDataItems = cdoReqData.json()['items']
+    # Create the export, sync it and wait for the sync (raises when the sync does not go through)
+    cdoReqSyncInstanceUri = runBulkExport(
+        apiAccess,
+        '/customObjects/<customDataObjectId>/exports',
+        cdoData,
+        maxDelay=runSettings['syncMaxDelay'],
+        deadline=runSettings['syncDeadline']
+        )
+
+    # Using the Sync Instance URI, count the records from Eloqua API
+    if countOnly:
+        ticketDataCreated = getExportCount(apiAccess, cdoReqSyncInstanceUri)
     else:
-        cdoReqDataItems = []
+        ticketDataCreated = 0
+        for element in iterExportRecords(apiAccess, cdoReqSyncInstanceUri, limit=runSettings['exportPageSize'], maxWorkers=runSettings['exportWorkers']):
+            ticketDataCreated = ticketDataCreated + 1
 
-    for element in cdoReqDataItems:
-        elem = {}
-        elem['pk'] = element['pk']
-        elem['emailAddress'] = element['emailAddress'].lower()
-        elem['createDate'] = element['createDate']
-        elem['updateDate'] = element['updateDate']
-        ticketDataUpdated.append(elem)
+    print('Number of Ticket Data Created : {}'.format(ticketDataCreated))
 
-    cdoHasMore = cdoReqData.json()["hasMore"]
-    cdoOffsetNum = 0
+    print('Retrieving Tickets CDO Data Updated Today...')
 
-    while cdoHasMore is True:
-        cdoOffsetNum = cdoOffsetNum + 50000
-        print('Retrieving next {} CDO records...'.format(cdoOffsetNum))
-        cdoReqUrl = bulkUrl + cdoReqSyncInstanceUri + '/data' + '?offset=%d' % cdoOffsetNum
+    cdoData = {
+        "name" : "Retrieve SYSTEM - KORE Tickets CDO Data Updated Today",
+        "fields" : {
+            "pk" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "emailAddress" : "{{CustomObject[<customDataObjectId>].Field[<fieldId>]}}",
+            "createDate" : "{{CustomObject[<customDataObjectId>].CreatedAt}}",
+            "updateDate" : "{{CustomObject[<customDataObjectId>].UpdatedAt}}"
+        },
+        "filter" : "'{{CustomObject[<customDataObjectId>].UpdatedAt}}' >= '" + todayDate + "' AND '{{CustomObject[<customDataObjectId>].CreatedAt}}' < '" + todayDate + "'"
+    }
 
-        cdoReqData = requests.get(cdoReqUrl, params='limit=50000', headers=headers)
-        cdoReqDataCount = int(cdoReqData.json()['count'])
+    # Create the export, sync it and wait for the sync (raises when the sync does not go through)
+    cdoReqSyncInstanceUri = runBulkExport(
+        apiAccess,
+        '/customObjects/<customDataObjectId>/exports',
+        cdoData,
+        maxDelay=runSettings['syncMaxDelay'],
+        deadline=runSettings['syncDeadline']
+        )
+
+    # Using the Sync Instance URI, count the records from Eloqua API
+    if countOnly:
+        ticketDataUpdated = getExportCount(apiAccess, cdoReqSyncInstanceUri)
+    else:
+        ticketDataUpdated = 0
+        for element in iterExportRecords(apiAccess, cdoReqSyncInstanceUri, limit=runSettings['exportPageSize'], maxWorkers=runSettings['exportWorkers']):
+            ticketDataUpdated = ticketDataUpdated + 1
 
-        if cdoReqDataCount > 0:
-            cdoReqDataItems = cdoReqData.json()['items']
-        else:
-            cdoReqDataItems = []
-
-        for element in cdoReqDataItems:
-            elem = {}
-            elem['pk'] = element['pk']
-            elem['emailAddress'] = element['emailAddress'].lower()
-            elem['createDate'] = element['createDate']
-            elem['updateDate'] = element['updateDate']
-            ticketDataUpdated.append(elem)
-        
-        cdoHasMore = cdoReqData.json()["hasMore"]
-      
-    print('Number of Ticket Data Updated : {}'.format(len(ticketDataUpdated)))
+    print('Number of Ticket Data Updated : {}'.format(ticketDataUpdated))
 
     ticketIntegrationSummary = {}
-    ticketIntegrationSummary['dataCreated'] = len(ticketDataCreated)
-    ticketIntegrationSummary['dataUpdated'] = len(ticketDataUpdated)
+    ticketIntegrationSummary['dataCreated'] = ticketDataCreated
+    ticketIntegrationSummary['dataUpdated'] = ticketDataUpdated
 
     return ticketIntegrationSummary
 
 
 
+#Process the Kore Tickets files of the bucket that are new or changed since they were last processed
+def processTicketFiles(apiAccess, contactIndex, runSettings, journal):
+
+    # Connect to the bucket
+    bucketInfo = getBucketInfo()
+    conn = boto.connect_s3(bucketInfo['accessKey'],
+                    bucketInfo['secretAccessKey'])
+    bucket = conn.get_bucket(bucketInfo['bucketName'], validate=False)
+    # go through the list of files
+    bucket_list = bucket.list(prefix=bucketInfo['prefix'])
+
+    # Only pick up the files that are new or changed since they were last processed
+    keyManifest = loadKeyManifest(runSettings['keyManifestPath'])
+    keyEntries = {}
+
+    keyStringArray = []
+    for l in bucket_list:
+        if 'ticket_' in str(l.key):
+            keyString = str(l.key)
+            keyEntry = getKeyEntry(l)
+            if isKeyProcessed(keyManifest, keyEntry):
+                print('Keystring already processed : {}'.format(str(keyString)))
+                continue
+            print('Keystring : {}'.format(str(keyString)))
+            keyStringArray.append(keyString)
+            keyEntries[keyString] = keyEntry
+
+    fileContext = {}
+    fileContext['apiAccess'] = apiAccess
+    fileContext['bucketInfo'] = bucketInfo
+    fileContext['contactIndex'] = contactIndex
+    fileContext['runSettings'] = runSettings
+    fileContext['journal'] = journal
+    fileContext['keyEntries'] = keyEntries
+
+    # One import definition for all the files (and retries) of the run
+    if runSettings['importEnabled']:
+        fileContext['importUri'] = getImportDefinitionUri(apiAccess, runSettings['importPath'], getTicketImportDefinition())
+    else:
+        fileContext['importUri'] = None
+
+    # Files staged whole by an earlier attempt of the run only wait for the sync
+    pendingKeyStrings = keyStringArray
+    if fileContext['importUri'] is not None:
+        pendingKeyStrings = []
+        for keyString in keyStringArray:
+            if getFileOffset(journal, keyEntries[keyString])[1] == 'staged':
+                print('Keystring already staged : {}'.format(str(keyString)))
+            else:
+                pendingKeyStrings.append(keyString)
+
+    # Import requests in flight for the whole run (importWorkers), shared by the file workers of a process
+    # and split over the worker processes
+    fileContext['importWorkers'] = getFileImportWorkers(
+        runSettings['importWorkers'],
+        runSettings['fileWorkers'],
+        runSettings['fileWorkerProcesses'],
+        len(pendingKeyStrings)
+        )
+
+    # Without imports a file is done once parsed, with imports once the sync of the run took its rows in
+    fileDone = None
+    if fileContext['importUri'] is None:
+        fileDone = lambda keyString, fileResult: markKeyProcessed(runSettings['keyManifestPath'], keyManifest, keyEntries[keyString])
+
+    fileResults = processFilesConcurrently(
+        pendingKeyStrings,
+        processTicketFile,
+        fileContext,
+        parallelism=runSettings['fileWorkers'],
+        useProcesses=runSettings['fileWorkerProcesses'],
+        fileDone=fileDone
+        )
+
+    # One sync of the import definition for the run, once every file is staged. When it fails the rows
+    # of the run are staged again by the next attempt; a sync ending with a warning only left out the
+    # rows Eloqua rejected, the files are done.
+    if fileContext['importUri'] is not None and keyStringArray:
+        syncResult = syncImportDefinition(apiAccess, fileContext['importUri'], maxDelay=runSettings['syncMaxDelay'], deadline=runSettings['syncDeadline'])
+        if not isSyncDone(syncResult):
+            for keyString in keyStringArray:
+                recordFileOffset(journal, keyEntries[keyString], 0, 'failed')
+            raise Exception('Import sync of the run finished with status {}'.format(syncResult['status']))
+
+        for keyString in keyStringArray:
+            recordFileOffset(journal, keyEntries[keyString], getFileOffset(journal, keyEntries[keyString])[0], 'synced')
+            markKeyProcessed(runSettings['keyManifestPath'], keyManifest, keyEntries[keyString])
+
+    return fileResults
+
+
+
 def startTicketIntegration(clientName):
 
-    apiAccess = getEloquaAccess()
-    sitename = apiAccess['site']
-    headers = apiAccess['headers']
-    baseUrl = apiAccess['baseUrl']
+    runSettings = getRunSettings()
 
     successFlag = True
-    numOfRetries = 1
-    actualRetries = 1
 
     todayDate = datetime.datetime.today().strftime('%Y-%m-%d')
 
     print('\n')
     print('Started running {} - Tickets.py : {}'.format(clientName, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
 
-    while numOfRetries <= 5:
+    # Journal of today's run, every stage is retried after its own policy (stageRetries) and a run
+    # started again today resumes from the stages, files and import syncs recorded in it (the contact
+    # index of the run included, the staged rows of a file are counted against it)
+    journal = openRunJournal(runSettings['runJournalPath'], 'Tickets ' + clientName, todayDate)
+    stageRetries = runSettings['stageRetries']
+
+    try:
+
+        # Cached access context, a retry only logs in again once the cached one has expired
+        apiAccess = runJournalStage(journal, 'access', getEloquaAccess, stageRetries['access'])
+        sitename = apiAccess['sitename']
+
+        print('Retrieving all Email Addresses ' + sitename + ' in Instance...')
+        contactIndex = runJournalStage(
+            journal,
+            'contacts',
+            lambda: getRunContactIndex(
+                journal,
+                apiAccess,
+                runSettings['emailCachePath'],
+                fullRefreshDays=runSettings['emailCacheFullRefreshDays'],
+                limit=runSettings['exportPageSize'],
+                maxWorkers=runSettings['exportWorkers'],
+                maxDelay=runSettings['syncMaxDelay'],
+                deadline=runSettings['syncDeadline'],
+                reuseMinutes=runSettings['emailIndexReuseMinutes'],
+                bloomBitsPerEmail=runSettings['contactBloomBits'],
+                exactCheck=runSettings['contactExactCheck']
+                ),
+            stageRetries['contacts']
+            )
 
-        print('Running script {} of 5 times...'.format(numOfRetries))
+        print('Number of Email Addresses : {}'.format(len(contactIndex['hashes'])))
 
-        try:
+        print('Processing KORE files for the ' + clientName)
 
-            print('Retrieving all Email Addresses ' + sitename + ' in Instance...')
-            reqExportData = json.dumps({
-                'name' : 'All Email Addresses',
-                'fields' : {
-                    'emailAddress' : '{{Contact.Field(C_EmailAddress)}}',
-                    },
-                })
+        # A retry only goes through the files not processed yet (key manifest) and the rows of a file not synced yet (journal)
+        fileResults = runJournalStage(
+            journal,
+            'files',
+            lambda: processTicketFiles(apiAccess, contactIndex, runSettings, journal),
+            stageRetries['files']
+            )
 
-            reqExport = requests.post(baseUrl + '/api/bulk/2.0/contacts/exports', headers=headers, data=reqExportData)
+        print('Number of files processed : {}'.format(len(fileResults)))
+        print('Total number of records processed : {}'.format(sum(fileResult['records'] for fileResult in fileResults)))
+        print('Total number of records to import : {}'.format(sum(fileResult['matched'] for fileResult in fileResults)))
 
-            reqExportUri = reqExport.json()["uri"]
+        successFlag = True
 
-            # Setup sync instance 
-            reqSyncData = json.dumps({
-                'syncedInstanceUri' : reqExportUri}
-                )
+        ticketsIntegrationSummary = runJournalStage(
+            journal,
+            'summary',
+            lambda: getTicketIntegrationSummary(apiAccess, runSettings['summaryCountOnly']),
+            stageRetries['summary'],
+            skipDone=True
+            )
+        ticketsDataCreated = ticketsIntegrationSummary['dataCreated']
+        ticketsDataUpdated = ticketsIntegrationSummary['dataUpdated']
+        writeToTicketSummaryTable(successFlag, clientName, ticketsDataCreated, ticketsDataUpdated)
 
-            # Sync the data retrieval
-            reqSync = requests.post(baseUrl + '/api/bulk/2.0/syncs', headers=headers, data=reqSyncData)
-
-            if reqSync.status_code == 201:
-                syncUri = reqSync.json()['uri']
-                sync(syncUri, reqSync, bulkUrl)
-            else: 
-                print('Failed to sync...')
-                #quit()
-
-            # Get the Sync Instance URI
-            reqSyncInstanceUri = reqSync.json()['syncedInstanceUri']
-
-            # Uxing the Sync Istance URI, retrieve the data from Eloqua API
-            # Keep trying to retrieve the data until successful
-            reqDataUrl = baseUrl + '/api/bulk/2.0' + reqSyncInstanceUri + '/data'
-            count = 0
-            hasMore = 'False'
-
-            reqData = requests.get(reqDataUrl, params='limit=50000', headers=headers)
-
-            print('Retrieving first 50000 records...')
-            emailAddress = []
-            for element in reqData.json()['items']:
-                emailAddress.append(element['emailAddress'].lower())
-
-            hasMore = reqData.json()['hasMore']
-            offsetNum = 0
-
-            while hasMore is True:
-                offsetNum = offsetNum + 50000
-                print('Retrieving next {} records...'.format(offsetNum))
-                reqDataUrl = baseUrl + '/api/bulk/2.0' + reqSyncInstanceUri + '/data' + '?offset=%d' % offsetNum
-
-                reqData = requests.get(reqDataUrl, params='limit=50000', headers=headers)
-
-                for element in reqData.json()['items']:
-                    emailAddress.append(element['emailAddress'].lower())
-                
-                hasMore = reqData.json()['hasMore']
-              
-            print('Number of Email Addresses : {}'.format(len(emailAddress)))
-
-            print('Setting up Email Address Set...')
-            emailAddressSet = set(emailAddress)
-
-            print('Processing KORE files for the ' + clietName)
-
-            # Connect to the bucket
-            conn = boto.connect_s3(AWS_ACCESS_KEY_ID,
-                            AWS_SECRET_ACCESS_KEY)
-            bucket = conn.get_bucket(bucket_name, validate=False)
-            # go through the list of files
-            bucket_list = bucket.list(prefix=prefix)
-
-            keyStringArray = []
-            for l in bucket_list:
-                if 'ticket_' in str(l.key):
-                    keyString = str(l.key)
-                    print('Keystring : {}'.format(str(keyString)))
-                    keyStringArray.append(keyString)
-
-            fileNum = 1
-            for keyString in keyStringArray:
-                filename = keyString.split('/')[-1]
-                print('Filename : {}'.format(str(filename)))
-
-                key=bucket.get_key(keyString)
-                print('Key : {}'.format(str(key)))
-
-                url = conn.generate_url(
-                    60,
-                    'GET',
-                    bucket_name,
-                    keyString
-                    )
-
-                bucketData = urllib.request.urlopen(url)
-                contentOrig = []
-                for line in bucketData:
-                    contentOrig.append(line.decode('utf-8'))
-
-                print('Number of records to process : {}'.format(len(contentOrig)))
-
-                #continue 
-
-                exportData = []
-                counter = 0
-                fieldnameFlag = 0
-                for i in contentOrig:
-
-                    if counter == 0:
-                        counter = counter + 1
-                        continue
-
-                    contentSplit = i.split('|')
-                    try:
-                        elem = {}
-                        elem['pk'] = contentSplit[0]
-                        elem['emailAddress'] = contentSplit[1]
-                        elem['seatGroup'] = contentSplit[2]
-                        elem['acctId'] = contentSplit[3]
-                        elem['seasonName'] = contentSplit[4]
-                        elem['eventId'] = contentSplit[5]
-                        elem['tmEventName'] = contentSplit[6]
-                        elem['eventName'] = contentSplit[7]
-                        elem['eventNameLong'] = contentSplit[8]
-                        elem['sectionName'] = contentSplit[9]
-                        elem['rowName'] = contentSplit[10]
-                        elem['priceCode'] = contentSplit[11]
-                        elem['purchasePrice'] = contentSplit[12]
-                        elem['percentPaid'] = contentSplit[13]
-                        elem['name'] = contentSplit[14]
-                        elem['ticketStatus'] = contentSplit[15]
-                        elem['groupFlag'] = contentSplit[16]
-                        elem['acctRepFullName'] = contentSplit[17]
-                        elem['addDateTime'] = contentSplit[18]
-                        elem['seatIncrement'] = contentSplit[19]
-                        elem['totalEvents'] = contentSplit[20]
-                        elem['addUser'] = contentSplit[21]
-                        elem['updDateTime'] = contentSplit[22]
-                        elem['orderNum'] = contentSplit[23]
-                        elem['orderLineItem'] = contentSplit[24]
-                        elem['orderLineItemSeq'] = contentSplit[25]
-                        elem['salesSourceName'] = contentSplit[26]
-                        elem['nameLastFirstMi'] = contentSplit[27]
-                        elem['seasonYear'] = contentSplit[28]
-                        elem['compName'] = contentSplit[29]
-                        elem['koreUpdated'] = contentSplit[30]
-                        elem['fullPrice'] = contentSplit[31]
-                        elem['printedPrice'] = contentSplit[32]
-                        elem['seatNum'] = contentSplit[33]
-                        elem['lastSeat'] = contentSplit[34]
-                        elem['numSeats'] = contentSplit[35]
-                        elem['seats'] = contentSplit[36]
-                        elem['blockPurchasePrice'] = contentSplit[37]
-                        elem['owedAmount'] = contentSplit[38]
-                        elem['paidAmount'] = contentSplit[39]
-                        elem['source'] = contentSplit[40]
-                        elem['planEventName'] = contentSplit[41]
-                        elem['priceCodeGroup'] = contentSplit[42]
-                        elem['eventTypeCode'] = contentSplit[43]
-                        elem['acctRepId'] = contentSplit[44]
-                        elem['acctTypeDesc'] = contentSplit[45]
-                        elem['otherInfo1'] = contentSplit[46]
-                        elem['otherInfo2'] = contentSplit[47]
-                        elem['otherInfo3'] = contentSplit[48]
-                        elem['otherInfo4'] = contentSplit[49]
-                        elem['otherInfo5'] = contentSplit[50]
-                        elem['otherInfo6'] = contentSplit[51]
-                        elem['otherInfo7'] = contentSplit[52]
-                        elem['otherInfo8'] = contentSplit[53]
-                        elem['otherInfo9'] = contentSplit[54]
-                        elem['otherInfo10'] = contentSplit[55]
-                        elem['ticketTypeCategory'] = contentSplit[56]
-                        elem['databaseId'] = contentSplit[57]
-                        elem['ledgerCode'] = contentSplit[58]
-                        elem['seasonId'] = contentSplit[59]
-                        elem['team'] = contentSplit[60]
-                        elem['eventTime'] = contentSplit[61]
-                        elem['className'] = contentSplit[62]
-                        elem['pcTicket'] = contentSplit[63]
-                        elem['pcTax'] = contentSplit[64]
-                        elem['pcLicFee'] = contentSplit[65]
-                        elem['ticketType'] = contentSplit[66]
-                        elem['ticketTypeCode'] = contentSplit[67].replace('\n','')
-                    except:
-                        continue
-
-                    if elem['emailAddress'].lower() in emailAddressSet:
-                        exportData.append(elem)
-
-                print('Number of records to import : {}'.format(len(exportData)))
-
-                fileNum = fileNum + 1
-                content_array = [exportData[x:x+10000] for x in xrange(0, len(exportData), 10000)]
-                importCounter = 1
-
-                print('Length of content_array : {}'.format(len(content_array)))
-
-                for i in content_array:
-
-                    importContents = []
-                    for j in i:
-                        tmp_contents = {
-                            "pk" : j['pk'],
-                            "email_addr" : j['emailAddress'],
-                            "seatgroup" : j['seatGroup'],
-                            "acct_id" : j['acctId'],
-                            "season_name" : j['seasonName'],
-                            "event_id" : j['eventId'],
-                            "tm_event_name" : ['tmEventName'],
-                            "event_name" : j['eventName'],
-                            "event_name_long" : j['eventNameLong'],
-                            "section_name" : j['sectionName'],
-                            "row_name" : j['rowName'],
-                            "price_code" : j['priceCode'],
-                            "purchase_price" : j['purchasePrice'],
-                            "percent_paid" : j['percentPaid'],
-                            "name" : j['name'],
-                            "ticket_status" : j['ticketStatus'],
-                            "group_flag" : j['groupFlag'],
-                            "acct_rep_full_name" : j['acctRepFullName'],
-                            "add_datetime" : j['addDateTime'],
-                            "seat_increment" : j['seatIncrement'],
-                            "total_events" : j['totalEvents'],
-                            "add_usr" : j['addUser'],
-                            "upd_datetime" : j['updDateTime'],
-                            "order_num" : j['orderNum'],
-                            "order_line_item" : j['orderLineItem'],
-                            "order_line_item_seq" : j['orderLineItemSeq'],
-                            "sales_source_name" : j['salesSourceName'],
-                            "name_last_first_mi" : j['nameLastFirstMi'],
-                            "season_year" : j['seasonYear'],
-                            "comp_name" : j['compName'],
-                            "kore_updated" : j['koreUpdated'],
-                            "full_price" : j['fullPrice'],
-                            "printed_price" : j['printedPrice'],
-                            "seat_num" : j['seatNum'],
-                            "last_seat" : j['lastSeat'],
-                            "num_seats" : j['numSeats'],
-                            "seats" : j['seats'],
-                            "block_purchase_price" : j['blockPurchasePrice'],
-                            "owed_amount" : j['owedAmount'],
-                            "paid_amount" : j['paidAmount'],
-                            "source" : j['source'],
-                            "plan_event_name" : j['planEventName'],
-                            "price_code_group" : j['priceCodeGroup'],
-                            "event_type_code" : j['eventTypeCode'],
-                            "acct_rep_id" : j['acctRepId'],
-                            "acct_type_desc" : j['acctTypeDesc'],
-                            "other_info_1" : j['otherInfo1'],
-                            "other_info_2" : j['otherInfo2'],
-                            "other_info_3" : j['otherInfo3'],
-                            "other_info_4" : j['otherInfo4'],
-                            "other_info_5" : j['otherInfo5'],
-                            "other_info_6" : j['otherInfo6'],
-                            "other_Info_7" : j['otherInfo7'],
-                            "other_info_8" : j['otherInfo8'],
-                            "other_info_9" : j['otherInfo9'],
-                            "other_info_10" : j['otherInfo10'],
-                            "ticket_type_category" : j['ticketTypeCategory'],
-                            "database_id" : j['databaseId'],
-                            "ledger_code" : j['ledgerCode'],
-                            "season_id" : j['seasonId'],
-                            "team" : j['team'],
-                            "event_time" : j['eventTime'],
-                            "class_name" : j['className'],
-                            "pc_ticket" : j['pcTicket'],
-                            "pc_tax" : j['pcTax'],
-                            "pc_licfee" : j['pcLicFee'],
-                            "ticket_type" : j['ticketType'],
-                            "ticket_type_code" : j['ticketTypeCode']
-                            }
-
-                        importContents.append(tmp_contents)
-
-                    print('Import records into CDO {} of {}...'.format(importCounter, len(content_array)))
-                    print('Number of records to import: {}'.format(len(importContents)))
-
-                    data = {
-                        "name": "SYSTEM - KORE Tickets CDO Import",
-                        "fields": {
-                            "pk" : "{{CustomObject[15].Field[234]}}",
-                            "email_addr" : "{{CustomObject[15].Field[235]}}",
-                            "seatgroup" : "{{CustomObject[15].Field[236]}}",
-                            "acct_id" : "{{CustomObject[15].Field[237]}}",
-                            "season_name" : "{{CustomObject[15].Field[238]}}",
-                            "event_id" : "{{CustomObject[15].Field[239]}}",
-                            "tm_event_name" : "{{CustomObject[15].Field[240]}}",
-                            "event_name" : "{{CustomObject[15].Field[241]}}",
-                            "event_name_long" : "{{CustomObject[15].Field[301]}}",
-                            "section_name" : "{{CustomObject[15].Field[242]}}",
-                            "row_name" : "{{CustomObject[15].Field[243]}}",
-                            "price_code" : "{{CustomObject[15].Field[244]}}",
-                            "purchase_price" : "{{CustomObject[15].Field[245]}}",
-                            "percent_paid" : "{{CustomObject[15].Field[246]}}",
-                            "name" : "{{CustomObject[15].Field[247]}}",
-                            "ticket_status" : "{{CustomObject[15].Field[248]}}",
-                            "group_flag" : "{{CustomObject[15].Field[249]}}",
-                            "acct_rep_full_name" : "{{CustomObject[15].Field[250]}}",
-                            "seat_increment" : "{{CustomObject[15].Field[252]}}",
-                            "total_events" : "{{CustomObject[15].Field[253]}}",
-                            "add_usr" : "{{CustomObject[15].Field[254]}}",
-                            "upd_datetime" : "{{CustomObject[15].Field[255]}}",
-                            "order_num" : "{{CustomObject[15].Field[256]}}",
-                            "order_line_item" : "{{CustomObject[15].Field[257]}}",
-                            "order_line_item_seq" : "{{CustomObject[15].Field[258]}}",
-                            "add_datetime" : "{{CustomObject[15].Field[251]}}",
-                            "sales_source_name" : "{{CustomObject[15].Field[259]}}",
-                            "name_last_first_mi" : "{{CustomObject[15].Field[260]}}",
-                            "season_year" : "{{CustomObject[15].Field[261]}}",
-                            "comp_name" : "{{CustomObject[15].Field[262]}}",
-                            "kore_updated" : "{{CustomObject[15].Field[263]}}",
-                            "full_price" : "{{CustomObject[15].Field[264]}}",
-                            "printed_price" : "{{CustomObject[15].Field[265]}}",
-                            "seat_num" : "{{CustomObject[15].Field[266]}}",
-                            "last_seat" : "{{CustomObject[15].Field[267]}}",
-                            "num_seats" : "{{CustomObject[15].Field[268]}}",
-                            "seats" : "{{CustomObject[15].Field[269]}}",
-                            "block_purchase_price" : "{{CustomObject[15].Field[270]}}",
-                            "owed_amount" : "{{CustomObject[15].Field[271]}}",
-                            "paid_amount" : "{{CustomObject[15].Field[272]}}",
-                            "source" : "{{CustomObject[15].Field[273]}}",
-                            "plan_event_name" : "{{CustomObject[15].Field[274]}}",
-                            "price_code_group" : "{{CustomObject[15].Field[275]}}",
-                            "event_type_code" : "{{CustomObject[15].Field[276]}}",
-                            "acct_rep_id" : "{{CustomObject[15].Field[277]}}",
-                            "acct_type_desc" : "{{CustomObject[15].Field[278]}}",
-                            "other_info_1" : "{{CustomObject[15].Field[279]}}",
-                            "other_info_2" : "{{CustomObject[15].Field[280]}}",
-                            "other_info_3" : "{{CustomObject[15].Field[281]}}",
-                            "other_info_4" : "{{CustomObject[15].Field[282]}}",
-                            "other_info_5" : "{{CustomObject[15].Field[283]}}",
-                            "other_info_6" : "{{CustomObject[15].Field[284]}}",
-                            "other_info_7" : "{{CustomObject[15].Field[285]}}",
-                            "other_info_8" : "{{CustomObject[15].Field[286]}}",
-                            "other_info_9" : "{{CustomObject[15].Field[287]}}",
-                            "other_info_10" : "{{CustomObject[15].Field[288]}}",
-                            "ticket_type_category" : "{{CustomObject[15].Field[289]}}", 
-                            "database_id" : "{{CustomObject[15].Field[290]}}",
-                            "ledger_code" : "{{CustomObject[15].Field[291]}}",
-                            "season_id" : "{{CustomObject[15].Field[292]}}",
-                            "team" : "{{CustomObject[15].Field[293]}}", 
-                            "event_time" : "{{CustomObject[15].Field[294]}}",
-                            "class_name" : "{{CustomObject[15].Field[295]}}",
-                            "pc_ticket" : "{{CustomObject[15].Field[296]}}",
-                            "pc_tax" : "{{CustomObject[15].Field[297]}}",
-                            "pc_licfee" : "{{CustomObject[15].Field[298]}}",
-                            "ticket_type" : "{{CustomObject[15].Field[299]}}",
-                            "ticket_type_code" : "{{CustomObject[15].Field[300]}}"
-                            },
-                        "identifierFieldName" : "pk",
-                        "isSyncTriggeredOnImport" : "true",
-                        "mapDataCards" : "true",
-                        "mapDataCardsEntityType" : "Contact",
-                        "mapDataCardsSourceField": "email_addr",
-                        "mapDataCardsEntityField" : "{{Contact.Field(C_EmailAddress)}}",
-                        }
-
-                     # To String
-                    data = json.dumps(data)
-
-                    importAttempt = 1
-
-                    # NOTE - Uncomment the sections between the IMPORT lines to allow of import of Kore Membership file contents
-                    #        into Ticket Activity CDO
-                    # ########## IMPORT
-                    # while importAttempt < 6:
-                    #     print('Tickets_Daily Import Attempt ' + str(importAttempt) + ' of 5')
-                
-                    #     try:
-                    #         # Post to create Export
-                    #         r = requests.post(bulkUrl+'/customObjects/<customDataObjectId>/imports', data=data, headers=headers)
-                    #         importuri = r.json()['uri'] #retrieve uri of import
-
-                    #         # Push data to staging area
-                    #         import_contents = json.dumps(importContents)
-                    #         importResponse = requests.post(bulkUrl+importuri+'/data', data=import_contents, headers=headers)
-
-                    #         #Execute Sync with import uri
-                    #         data2 = {
-                    #           'syncedInstanceUri' : importuri
-                    #         }
-                    #         data2 = json.dumps(data2)
-
-                    #         r = requests.post(bulkUrl+'/syncs', data=data2, headers=headers)
-
-                    #         importAttempt = 7
-
-                    #         print('Import Successful.')
-                    #     except:
-                    #         print('Import Unsuccessful.')
-                    #         importAttempt = importAttempt + 1
-                    #         time.sleep(60)
-                    # importCounter += 1
-                    # ########## IMPORT
-
-            ticketIntegrationSummary = getTicketIntegrationSummary()
-
-            successFlag = True
-
-            ticketsIntegrationSummary = getTicketIntegrationSummary()
-            ticketsDataCreated = ticketsIntegrationSummary['dataCreated']
-            ticketsDataUpdated = ticketsIntegrationSummary['dataUpdated']
-            writeToTicketSummaryTable(successFlag, clientName, ticketsDataCreated, ticketsDataUpdated)
-
-            numOfRetries = 7
-
-        except Exception as e:
-
-            print(e)
-            print('Failed to run.')
-
-            numOfRetries += 1
-            actualRetries += 1
-
-            successFlag = False            
-            writeToTicketSummaryTable(successFlag, clientName, '0', '0')
-
-            time.sleep(300)
+    except Exception as e:
+
+        print(e)
+        print('Failed to run.')
+
+        successFlag = False
+        writeToTicketSummaryTable(successFlag, clientName, '0', '0')
 
     return successFlag
 
 
 
-def writeToTicketSummaryTable(sFlag, clientName, dataCreated, dataUpdated)
+def writeToTicketSummaryTable(sFlag, clientName, dataCreated, dataUpdated):
 
     db = pyodbc.connect(driver='{ODBC Driver 17 for SQL Server}',server='',database='', uid='', pwd='')
 
@@ -765,7 +700,7 @@ def writeToTicketSummaryTable(sFlag, clientName, dataCreated, dataUpdated)
             insert into <clientName>_Tickets_Summary values (
                 convert(datetime, '{}', 120), 'Success', {}, {}, 0
             )
-            """.format(todayDatetime, len(dataCreated), len(dataUpdated))
+            """.format(todayDatetime, dataCreated, dataUpdated)
         c.execute(sqlStmt)
 
     else:
@@ -783,7 +718,7 @@ def writeToTicketSummaryTable(sFlag, clientName, dataCreated, dataUpdated)
     c.close()
     db.close()
 
-    sendNotificationEmal(sFlag, clientName, dataCreated, dataUpdated)
+    sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated)
 
 
 
@@ -896,8 +831,8 @@ def sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated):
                             <p>
                             This is to inform the recipient(s) that the """ + clientName + """ - KORE Integration for Tickets has successfully executed for """ + todayDate + """.
                             <br><br>
-                            Records created: """ + str(len(dataCreated)) + """<br>
-                            Records updated: """ + str(len(dataUpdated)) + """<br>
+                            Records created: """ + str(dataCreated) + """<br>
+                            Records updated: """ + str(dataUpdated) + """<br>
                             </p>
                           </td>
                         </tr>
@@ -925,7 +860,7 @@ def sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated):
         MAILGUN_API_KEY = ''
         MAILGUN_DOMAIN_NAME = ''
 
-        requests.post(
+        getHttpSession().post(
             MAILGUN_DOMAIN_NAME,
             auth=("api", MAILGUN_API_KEY),
             data={"from": "Example Name <example@test.com>",
@@ -1037,7 +972,7 @@ def sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated):
                           <td class='inner contents' style='padding-left:30px;padding-right:30px;padding-top:10px;padding-bottom:10px;font-family:Avenir TT Book, Arial, Helvetica, sans-serif;font-size:16px;color:#000000;width:100%;text-align:left;'>
                             
                             <p>
-                            This is to inform the recipient(s) that the """ + cilientName + """ - KORE Integration - Tickets Process has exceeded the 
+                            This is to inform the recipient(s) that the """ + clientName + """ - KORE Integration - Tickets Process has exceeded the 
                             max number of retries and failed to execute for """ + todayDate + """.
                             </p>
                           </td>
@@ -1066,7 +1001,7 @@ def sendSuccessfulEmail(sFlag, clientName, dataCreated, dataUpdated):
         MAILGUN_API_KEY = ''
         MAILGUN_DOMAIN_NAME = ''
 
-        requests.post(
+        getHttpSession().post(
             MAILGUN_DOMAIN_NAME,
             auth=("api", MAILGUN_API_KEY),
             data={"from": "Example Name <example@test.com>",
@@ -0,0 +1,253 @@
+###
+# Tests of the Kore file parsers, the run journal and the import definitions of Kore_Integration_Utils.py
+#
+# Run with: python -m unittest test_Kore_Integration_Utils
+###
+
+import array
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from Kore_Integration_Utils import hashEmail, compileRowParser, iterColumnarRows, iterStagedRows, openRunJournal, getFileOffset, recordFileOffset, iterResumedBatches, importDefinitionCache, isSameImportDefinition, getImportDefinitionUri
+
+
+
+#Contact index (see buildContactIndex) holding the given email addresses
+def getTestContactIndex(emailAddresses):
+
+    contactIndex = {}
+    contactIndex['hashes'] = array.array('q', sorted(hashEmail(emailAddress.encode('utf-8')) for emailAddress in emailAddresses))
+    contactIndex['cachePath'] = None
+    contactIndex['exactCheck'] = False
+    contactIndex['bloom'] = None
+    contactIndex['bloomBits'] = 0
+    contactIndex['bloomProbes'] = 0
+
+    return contactIndex
+
+
+
+class KoreParserTest(unittest.TestCase):
+
+    contactIndex = getTestContactIndex(['a@x.com', 'b@x.com', 'c@x.com'])
+
+    # Email in the middle of the layout, the truncated row ends with its email cell
+    middleSchema = {'name' : 'Middle', 'fields' : [('pk', 0, 'F0'), ('email', 1, 'F1'), ('name', 2, 'F2')], 'emailField' : 'email'}
+    middleLines = [
+        'pk|email|name\n',
+        'p1|A@x.com|one\n',
+        'p2|b@x.com\n',
+        'p3|n@x.com|three\n',
+        'p4|c@x.com|four\r\n',
+        ]
+
+    # Email as the last column of the layout
+    lastSchema = {'name' : 'Last', 'fields' : [('pk', 0, 'F0'), ('name', 1, 'F1'), ('email', 2, 'F2')], 'emailField' : 'email'}
+    lastLines = [
+        'pk|name|email\n',
+        'p1|one|a@x.com\n',
+        'p2|two\n',
+        'p3|three|n@x.com\n',
+        'p4|four|c@x.com\r\n',
+        ]
+
+    def parseColumnar(self, lines, schema):
+
+        fileStats = {'records' : 0, 'matched' : 0}
+        records = list(iterColumnarRows(iter(lines), schema, self.contactIndex, fileStats, chunkRows=10))
+
+        return records, fileStats
+
+    def parseStaged(self, lines, schema):
+
+        stagedFile, stagedPath = tempfile.mkstemp()
+        with os.fdopen(stagedFile, 'wb') as stagingFile:
+            stagingFile.write(''.join(lines).encode('utf-8'))
+
+        fileStats = {'records' : 0, 'matched' : 0}
+        records = list(iterStagedRows(stagedPath, schema, self.contactIndex, fileStats, chunkRows=10))
+        self.assertFalse(os.path.exists(stagedPath))
+
+        return records, fileStats
+
+    def parseRows(self, lines, schema):
+
+        fileStats = {'records' : 0, 'matched' : 0}
+        records = list(compileRowParser(schema)(iter(lines), self.contactIndex, fileStats))
+
+        return records, fileStats
+
+    def test_truncated_row(self):
+
+        expected = [{'pk' : 'p1', 'email' : 'A@x.com', 'name' : 'one'}, {'pk' : 'p4', 'email' : 'c@x.com', 'name' : 'four'}]
+
+        for parse in (self.parseRows, self.parseColumnar, self.parseStaged):
+            records, fileStats = parse(self.middleLines, self.middleSchema)
+            self.assertEqual(records, expected)
+            self.assertEqual(fileStats, {'records' : 4, 'matched' : 2})
+
+    def test_email_last_column(self):
+
+        expected = [{'pk' : 'p1', 'name' : 'one', 'email' : 'a@x.com'}, {'pk' : 'p4', 'name' : 'four', 'email' : 'c@x.com'}]
+
+        for parse in (self.parseRows, self.parseColumnar, self.parseStaged):
+            records, fileStats = parse(self.lastLines, self.lastSchema)
+            self.assertEqual(records, expected)
+            self.assertEqual(fileStats, {'records' : 4, 'matched' : 2})
+
+
+
+class KoreJournalTest(unittest.TestCase):
+
+    keyEntry = {'keyString' : 'Kore/Membership_20261018.txt', 'etag' : '"e1"', 'size' : 1000}
+
+    def setUp(self):
+
+        self.journalDir = tempfile.mkdtemp()
+        self.journalPath = os.path.join(self.journalDir, 'run_journal.db')
+        self.journal = openRunJournal(self.journalPath, 'Membership Client', '2026-10-18')
+
+    def tearDown(self):
+
+        shutil.rmtree(self.journalDir)
+
+    def test_resume_offset(self):
+
+        self.assertEqual(getFileOffset(self.journal, self.keyEntry), (0, None))
+
+        recordFileOffset(self.journal, self.keyEntry, 250)
+        self.assertEqual(getFileOffset(self.journal, self.keyEntry), (250, 'staging'))
+
+        recordFileOffset(self.journal, self.keyEntry, 400, 'staged')
+        self.assertEqual(getFileOffset(self.journal, self.keyEntry), (400, 'staged'))
+
+        # A run started again on the same day resumes from the journal
+        journal = openRunJournal(self.journalPath, 'Membership Client', '2026-10-18')
+        self.assertEqual(getFileOffset(journal, self.keyEntry), (400, 'staged'))
+
+    def test_other_file_version(self):
+
+        recordFileOffset(self.journal, self.keyEntry, 250)
+
+        for changed in ({'etag' : '"e2"'}, {'size' : 1200}):
+            keyEntry = dict(self.keyEntry, **changed)
+            self.assertEqual(getFileOffset(self.journal, keyEntry), (0, None))
+
+    def test_other_run(self):
+
+        recordFileOffset(self.journal, self.keyEntry, 250)
+
+        for runName, runDate in (('Membership Client', '2026-10-19'), ('Tickets Client', '2026-10-18')):
+            journal = openRunJournal(self.journalPath, runName, runDate)
+            self.assertEqual(getFileOffset(journal, self.keyEntry), (0, None))
+
+    def resumeBatches(self, resumeOffset):
+
+        importBatches = [['r1', 'r2', 'r3'], ['r4', 'r5'], ['r6', 'r7', 'r8']]
+
+        return [importContents for importBatch, importContents in iterResumedBatches(iter(importBatches), resumeOffset)]
+
+    def test_resumed_batches(self):
+
+        self.assertEqual(self.resumeBatches(0), [['r1', 'r2', 'r3'], ['r4', 'r5'], ['r6', 'r7', 'r8']])
+        # Offset in the middle of a batch
+        self.assertEqual(self.resumeBatches(4), [[], ['r5'], ['r6', 'r7', 'r8']])
+        # Offset at the end of a batch
+        self.assertEqual(self.resumeBatches(5), [[], [], ['r6', 'r7', 'r8']])
+        # Whole file staged
+        self.assertEqual(self.resumeBatches(8), [[], [], []])
+        self.assertEqual(self.resumeBatches(10), [[], [], []])
+
+
+
+class KoreImportDefinitionTest(unittest.TestCase):
+
+    importDefinition = {
+        'name' : 'SYSTEM - KORE Tickets CDO Import',
+        'fields' : {'pk' : '{{CustomObject[1].Field[1]}}', 'email' : '{{CustomObject[1].Field[2]}}'},
+        'identifierFieldName' : 'pk',
+        'isSyncTriggeredOnImport' : 'false',
+        'mapDataCards' : 'true',
+        }
+
+    apiAccess = {'bulkUrl' : 'https://bulk.example.com', 'headers' : {}}
+
+    def setUp(self):
+
+        importDefinitionCache.clear()
+
+    # Existing definition as listed by Eloqua, flags as booleans
+    def getItem(self, **settings):
+
+        item = dict(self.importDefinition, uri='/customObjects/1/imports/10', isSyncTriggeredOnImport=False, mapDataCards=True)
+        item.update(settings)
+
+        return item
+
+    def test_boolean_flags(self):
+
+        self.assertTrue(isSameImportDefinition(self.getItem(), self.importDefinition))
+        self.assertTrue(isSameImportDefinition(self.getItem(mapDataCards='TRUE'), self.importDefinition))
+        self.assertFalse(isSameImportDefinition(self.getItem(isSyncTriggeredOnImport=True), self.importDefinition))
+        self.assertFalse(isSameImportDefinition(self.getItem(mapDataCards=False), self.importDefinition))
+
+    def test_omitted_behaviour_settings(self):
+
+        importDefinition = dict(self.importDefinition)
+        del importDefinition['isSyncTriggeredOnImport']
+        del importDefinition['mapDataCards']
+
+        item = self.getItem(mapDataCards=False)
+        self.assertTrue(isSameImportDefinition(item, importDefinition))
+        del item['isSyncTriggeredOnImport']
+        self.assertTrue(isSameImportDefinition(item, importDefinition))
+
+        # A definition syncing on every push, or mapping data cards, is never reused for one leaving them out
+        self.assertFalse(isSameImportDefinition(self.getItem(mapDataCards=False, isSyncTriggeredOnImport=True), importDefinition))
+        self.assertFalse(isSameImportDefinition(self.getItem(), importDefinition))
+
+        # Eloqua leaving a behaviour setting out of the listing means false
+        item = self.getItem()
+        del item['isSyncTriggeredOnImport']
+        self.assertTrue(isSameImportDefinition(item, self.importDefinition))
+        del item['mapDataCards']
+        self.assertFalse(isSameImportDefinition(item, self.importDefinition))
+
+    def test_other_fields(self):
+
+        fields = dict(self.importDefinition['fields'], email='{{CustomObject[1].Field[3]}}')
+        self.assertFalse(isSameImportDefinition(self.getItem(fields=fields), self.importDefinition))
+
+        fields = dict(self.importDefinition['fields'], name='{{CustomObject[1].Field[4]}}')
+        self.assertFalse(isSameImportDefinition(self.getItem(fields=fields), self.importDefinition))
+
+        self.assertFalse(isSameImportDefinition(self.getItem(identifierFieldName='email'), self.importDefinition))
+
+    def getImportDefinitionUri(self, items):
+
+        session = mock.Mock()
+        session.get.return_value.json.return_value = {'items' : items}
+
+        with mock.patch('Kore_Integration_Utils.getHttpSession', return_value=session), \
+             mock.patch('Kore_Integration_Utils.createImportDefinition', return_value='/customObjects/1/imports/20') as createImportDefinition:
+            importUri = getImportDefinitionUri(self.apiAccess, '/customObjects/1/imports', self.importDefinition)
+
+        return importUri, createImportDefinition.call_count
+
+    def test_import_definition_uri(self):
+
+        self.assertEqual(self.getImportDefinitionUri([self.getItem()]), ('/customObjects/1/imports/10', 0))
+
+        # Cached for the rest of the process
+        self.assertEqual(self.getImportDefinitionUri([]), ('/customObjects/1/imports/10', 0))
+
+        importDefinitionCache.clear()
+        self.assertEqual(self.getImportDefinitionUri([self.getItem(isSyncTriggeredOnImport=True)]), ('/customObjects/1/imports/20', 1))
+
+
+
+if __name__ == '__main__':
+    unittest.main()